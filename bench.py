@@ -0,0 +1,133 @@
+"""Benchmark entrypoint for BugulmaEnjoyers: throughput and latency as JSON."""
+
+import itertools
+import json
+from pathlib import Path
+
+import click
+
+from bugulma_enjoyers.bench import (
+    DETOXIFIERS,
+    TINY_MODEL,
+    run_benchmark,
+    sample_texts,
+    synthetic_texts,
+)
+from bugulma_enjoyers.constants import INFERENCE_BACKENDS, QUANTIZATION_MODES
+from bugulma_enjoyers.setup_logging import setup_logging
+
+
+@click.option("--verbose", "-v", count=True, default=False)
+@click.option("--quiet", "-q", count=True, default=False)
+@click.option(
+    "--detoxifier",
+    "-d",
+    "detoxifiers",
+    help="Detoxifier to benchmark; may be repeated.",
+    type=click.Choice(DETOXIFIERS),
+    multiple=True,
+    default=DETOXIFIERS,
+)
+@click.option(
+    "--rows",
+    "-n",
+    help="Number of input rows; may be repeated.",
+    multiple=True,
+    default=[64],
+)
+@click.option(
+    "--batch-size",
+    "-b",
+    "batch_sizes",
+    help="Batch size; may be repeated.",
+    multiple=True,
+    default=[8],
+)
+@click.option(
+    "--model",
+    help="Detoxifier model, e.g. 'fake/echo?latency=0.5&error_rate=0.05', or 'tiny' (local stub).",
+    default=TINY_MODEL,
+)
+@click.option("--translator", help="Translator model; 'tiny' is a local stub.", default=TINY_MODEL)
+@click.option("--input", "-f", "input_", help="Sample inputs from this TSV, not synthetic ones.")
+@click.option("--max-length", help="Generation length limit.", default=32)
+@click.option("--num-beams", help="Beam size.", default=1)
+@click.option("--device", help="Device to run the models on.", default="cpu")
+@click.option(
+    "--quantization",
+    "quantizations",
+    help="Quantization of the HF models; may be repeated. Other modes are compared with 'none'.",
+    type=click.Choice(QUANTIZATION_MODES),
+    multiple=True,
+    default=["none"],
+)
+@click.option(
+    "--inference-backend",
+    help="How the HF models run.",
+    type=click.Choice(INFERENCE_BACKENDS),
+    default="eager",
+)
+@click.option("--seed", help="Seed of the inputs.", default=0)
+@click.option("--work-dir", help="Stub checkpoint directory.", default=".bugulma_cache/bench")
+@click.option("--output", "-o", help="Also write the results to this JSON file.", default=None)
+@click.command()
+def main(  # noqa: PLR0913, PLR0917
+    detoxifiers: tuple[str, ...] = DETOXIFIERS,
+    rows: tuple[int, ...] = (64,),
+    batch_sizes: tuple[int, ...] = (8,),
+    model: str = TINY_MODEL,
+    translator: str = TINY_MODEL,
+    input_: str | None = None,
+    max_length: int = 32,
+    num_beams: int = 1,
+    device: str = "cpu",
+    quantizations: tuple[str, ...] = ("none",),
+    inference_backend: str = "eager",
+    seed: int = 0,
+    work_dir: str = ".bugulma_cache/bench",
+    output: str | None = None,
+    verbose: int = 0,
+    quiet: int = 0,
+) -> None:
+    """Benchmark entrypoint for BugulmaEnjoyers."""
+    setup_logging(verbose - quiet + 1)
+    results = []
+    # Без квантования считаем первым: с его выходами сравниваются остальные режимы
+    quantizations = sorted(set(quantizations), key=QUANTIZATION_MODES.index)
+    for size, detoxifier, batch_size in itertools.product(rows, detoxifiers, batch_sizes):
+        texts = (
+            synthetic_texts(size, seed=seed)
+            if input_ is None
+            else sample_texts(input_, size, seed=seed)
+        )
+        baseline = None
+        for quantization in quantizations:
+            report = run_benchmark(
+                detoxifier,
+                texts,
+                batch_size,
+                model=model,
+                translator=translator,
+                work_dir=work_dir,
+                max_length=max_length,
+                num_beams=num_beams,
+                device=device,
+                quantization=quantization,
+                inference_backend=inference_backend,
+                reference=None if baseline is None else baseline["outputs"],
+            )
+            if baseline is None and quantization == "none":
+                baseline = report
+            elif baseline is not None:
+                report["speedup"] = report["rows_per_s"] / baseline["rows_per_s"]
+            results.append(report)
+    for report in results:
+        del report["outputs"]
+    report = json.dumps(results, indent=2, ensure_ascii=False)
+    if output is not None:
+        Path(output).write_text(report, encoding="utf-8")
+    click.echo(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""Reproducible end-to-end throughput and latency benchmark of the detoxifiers."""
+
+import difflib
+import logging
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import torch
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+from tokenizers.processors import TemplateProcessing
+from tokenizers.trainers import WordLevelTrainer
+from transformers import PreTrainedTokenizerFast, T5Config, T5ForConditionalGeneration
+
+from bugulma_enjoyers.constants import NLLB_LANG_CODES
+from bugulma_enjoyers.detoxifiers import (
+    BacktranslationDetoxifier,
+    BaseDetoxifier,
+    PipelineConfig,
+    StandaloneDetoxifier,
+)
+from bugulma_enjoyers.io import read_input
+from bugulma_enjoyers.models._model_cache import model_nbytes
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DETOXIFIERS = ("standalone", "backtranslation")
+UNKNOWN_DETOXIFIER_ERROR = "Unknown detoxifier {!r}. Supported detoxifiers: {}"
+
+# Имя модели, вместо которой бенчмарк собирает крошечный локальный seq2seq-чекпойнт
+TINY_MODEL = "tiny"
+TINY_SPECIAL_TOKENS = ["<pad>", "</s>", "<unk>", *NLLB_LANG_CODES.values()]
+
+# Частые татарские слова для синтетических входов
+TATAR_WORDS = (
+    "мин син ул без сез алар бу шул әйе юк бар кил кит сөйлә яз укы эшлә"
+    " бик яхшы начар зур кечкенә матур тиз акрын бүген иртәгә кичә хәзәр"
+    " кеше бала әни әти дус өй шәһәр авыл мәктәп эш көн төн су ачы тәмле"
+    " аңла белә тели ярата кирәк мөмкин тагын инде генә дә да белән өчен"
+).split()
+
+
+def synthetic_texts(rows: int, seed: int = 0, min_words: int = 3, max_words: int = 30) -> list[str]:
+    """
+    Generates Tatar-looking texts with a realistic spread of lengths.
+
+    Args:
+        rows (int): Number of texts.
+        seed (int, optional): Random seed. Defaults to 0.
+        min_words (int, optional): Minimal words in a text. Defaults to 3.
+        max_words (int, optional): Maximal words in a text. Defaults to 30.
+
+    Returns:
+        list[str]: The texts.
+
+    """
+    rng = random.Random(seed)  # noqa: S311
+    return [
+        " ".join(rng.choices(TATAR_WORDS, k=rng.randint(min_words, max_words))) for _ in range(rows)
+    ]
+
+
+def sample_texts(path: str | Path, rows: int, seed: int = 0) -> list[str]:
+    """
+    Samples texts (with replacement) from an input TSV.
+
+    Args:
+        path (str | Path): The input file.
+        rows (int): Number of texts.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        list[str]: The texts.
+
+    """
+    texts = [str(text) for text in read_input(path)]
+    return random.Random(seed).choices(texts, k=rows)  # noqa: S311
+
+
+def build_tiny_seq2seq(path: str | Path, texts: list[str], seed: int = 0) -> Path:
+    """
+    Saves a randomly initialized, tiny T5 checkpoint with a word-level tokenizer.
+
+    It loads through the usual `hf/<path>` model name and knows the NLLB language codes, so it
+    can stand in for both the detoxifier and the translator. The checkpoint is built only once.
+
+    Args:
+        path (str | Path): Directory to save the checkpoint to.
+        texts (list[str]): Texts to build the vocabulary from.
+        seed (int, optional): Seed of the weights. Defaults to 0.
+
+    Returns:
+        Path: The checkpoint directory.
+
+    """
+    path = Path(path)
+    if (path / "config.json").exists():
+        return path
+
+    backend = Tokenizer(WordLevel(unk_token="<unk>"))  # noqa: S106
+    backend.pre_tokenizer = Whitespace()
+    backend.train_from_iterator(texts, WordLevelTrainer(special_tokens=TINY_SPECIAL_TOKENS))
+    # Как у T5: в конец каждого текста добавляется </s>, так что пустых входов не бывает
+    backend.post_processor = TemplateProcessing(
+        single="$A </s>",
+        special_tokens=[("</s>", backend.token_to_id("</s>"))],
+    )
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        pad_token="<pad>",  # noqa: S106
+        eos_token="</s>",  # noqa: S106
+        unk_token="<unk>",  # noqa: S106
+    )
+
+    torch.manual_seed(seed)
+    model = T5ForConditionalGeneration(
+        T5Config(
+            vocab_size=len(tokenizer),
+            d_model=64,
+            d_kv=16,
+            d_ff=128,
+            num_layers=2,
+            num_heads=4,
+            pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+            decoder_start_token_id=tokenizer.pad_token_id,
+        ),
+    )
+    path.mkdir(parents=True, exist_ok=True)
+    model.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return path
+
+
+class StageTimer:
+    """Records the latency of every `forward` call of the models it instruments."""
+
+    def __init__(self) -> None:
+        """Initializes the StageTimer."""
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.rows: dict[str, int] = defaultdict(int)
+        self.models: dict[str, object] = {}
+        self._baseline: dict[str, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def instrument(self, model: object, stage: str) -> None:
+        """
+        Times the model's batches under the given stage name.
+
+        Args:
+            model (object): A BaseModel.
+            stage (str): The stage name.
+
+        """
+        self.models[stage] = model
+        forward = model.forward
+
+        def timed_forward(batch: dict) -> list[str]:
+            start = time.perf_counter()
+            outputs = forward(batch)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.latencies[stage].append(elapsed)
+                self.rows[stage] += len(outputs)
+            return outputs
+
+        # forward_batches вызывает self.forward, так что атрибута экземпляра достаточно
+        model.forward = timed_forward
+
+    def reset(self) -> None:
+        """Forgets everything recorded so far."""
+        with self._lock:
+            self.latencies.clear()
+            self.rows.clear()
+            self._baseline = {stage: self._api_counters(stage) for stage in self.models}
+
+    def _api_counters(self, stage: str) -> tuple[int, int]:
+        limiter = getattr(self.models[stage], "rate_limiter", None)
+        return (0, 0) if limiter is None else (limiter.retries, limiter.throttles)
+
+    def api_stats(self, stage: str) -> dict[str, int]:
+        """Retries and throttling errors of an API model since the last reset."""
+        if getattr(self.models[stage], "rate_limiter", None) is None:
+            return {}
+        retries, throttles = self._api_counters(stage)
+        base_retries, base_throttles = self._baseline.get(stage, (0, 0))
+        return {"retries": retries - base_retries, "throttles": throttles - base_throttles}
+
+
+def _percentiles(latencies: list[float]) -> dict[str, float]:
+    if not latencies:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]).tolist()
+    return {"p50": p50, "p95": p95, "p99": p99}
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of the process so far, in MiB; None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На macOS ru_maxrss в байтах, на Linux в килобайтах
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _resolve_model(name: str, tiny_path: Path, texts: list[str]) -> str:
+    if name != TINY_MODEL:
+        return name
+    return f"hf/{build_tiny_seq2seq(tiny_path, [*texts, *TATAR_WORDS])}"
+
+
+def _build_detoxifier(
+    kind: str,
+    config: PipelineConfig,
+    timer: StageTimer,
+) -> BaseDetoxifier:
+    if kind == "standalone":
+        detoxifier = StandaloneDetoxifier(config)
+        timer.instrument(detoxifier.model, "detoxify")
+        return detoxifier
+    if kind == "backtranslation":
+        base = StandaloneDetoxifier(config)
+        timer.instrument(base.model, "detoxify")
+        detoxifier = BacktranslationDetoxifier(config, base)
+        timer.instrument(detoxifier.translator, "translate")
+        return detoxifier
+    raise ValueError(UNKNOWN_DETOXIFIER_ERROR.format(kind, list(DETOXIFIERS)))
+
+
+def agreement(reference: list[str], outputs: list[str]) -> dict[str, float]:
+    """
+    Compares outputs with reference outputs of the same inputs, e.g. unquantized ones.
+
+    Args:
+        reference (list[str]): The reference outputs.
+        outputs (list[str]): The outputs to check.
+
+    Returns:
+        dict[str, float]: Share of identical outputs and mean character-level similarity.
+
+    """
+    if not reference:
+        return {"exact_match": 1.0, "char_similarity": 1.0}
+    pairs = list(zip(reference, outputs, strict=True))
+    return {
+        "exact_match": sum(ref == out for ref, out in pairs) / len(pairs),
+        "char_similarity": float(
+            np.mean([difflib.SequenceMatcher(None, ref, out).ratio() for ref, out in pairs]),
+        ),
+    }
+
+
+def run_benchmark(  # noqa: PLR0913, PLR0917
+    detoxifier: str,
+    texts: list[str],
+    batch_size: int,
+    model: str = TINY_MODEL,
+    translator: str = TINY_MODEL,
+    work_dir: str | Path = ".bugulma_cache/bench",
+    max_length: int = 32,
+    num_beams: int = 1,
+    device: str = "cpu",
+    quantization: str = "none",
+    reference: list[str] | None = None,
+    inference_backend: str = "eager",
+) -> dict:
+    """
+    Runs a detoxifier over the texts and measures it.
+
+    One batch is run first as a warm-up (which also pays for compilation) and is not measured.
+    On-disk caches and the translation memory are disabled, so every run does the full work.
+    Given the outputs of a reference run (e.g. without quantization), the report also tells how
+    well the outputs agree with them.
+
+    Args:
+        detoxifier (str): "standalone" or "backtranslation".
+        texts (list[str]): The inputs.
+        batch_size (int): Batch size of the models.
+        model (str, optional): Detoxifier model name, or "tiny" for a local stub checkpoint.
+            Defaults to "tiny".
+        translator (str, optional): Translator model name, or "tiny". Defaults to "tiny".
+        work_dir (str | Path, optional): Where the tiny checkpoint is kept.
+            Defaults to ".bugulma_cache/bench".
+        max_length (int, optional): Generation length limit. Defaults to 32.
+        num_beams (int, optional): Beam size. Defaults to 1.
+        device (str, optional): The device. Defaults to "cpu".
+        quantization (str, optional): Quantization of the HF models. Defaults to "none".
+        reference (list[str] | None, optional): Reference outputs to compare with.
+            Defaults to None.
+        inference_backend (str, optional): How the HF models run. Defaults to "eager".
+
+    Returns:
+        dict: Throughput, per-batch latency percentiles, peak RSS, per-stage breakdown and
+            the outputs themselves (under "outputs").
+
+    """
+    tiny_path = Path(work_dir) / "tiny-seq2seq"
+    config = PipelineConfig(
+        detoxifier_model_name=_resolve_model(model, tiny_path, texts),
+        translator_model_name=(
+            _resolve_model(translator, tiny_path, texts)
+            if detoxifier == "backtranslation"
+            else PipelineConfig.translator_model_name
+        ),
+        batch_size=batch_size,
+        max_length=max_length,
+        num_beams=num_beams,
+        device=device,
+        quantization=quantization,
+        inference_backend=inference_backend,
+        cache_dir=None,
+        # Иначе прогрев заполнил бы память переводов и часть замера ушла бы на попадания
+        translation_memory=False,
+    )
+    timer = StageTimer()
+    detox = _build_detoxifier(detoxifier, config, timer)
+    languages = ["tt"] * len(texts)
+
+    detox.detoxify_batch(texts[:batch_size], languages[:batch_size])
+    timer.reset()
+    start = time.perf_counter()
+    outputs = detox.detoxify_batch(texts, languages)
+    wall = time.perf_counter() - start
+    weights_mb = model_nbytes(tuple(getattr(m, "model", None) for m in timer.models.values()))
+    weights_mb /= 2**20
+    # Модели больше не нужны: следующий прогон не должен делить с этим память
+    detox.release()
+
+    latencies = [latency for stage in timer.latencies.values() for latency in stage]
+    return {
+        "detoxifier": detoxifier,
+        "model": model,
+        "translator": translator if detoxifier == "backtranslation" else None,
+        "quantization": quantization,
+        "inference_backend": inference_backend,
+        "rows": len(texts),
+        "batch_size": batch_size,
+        "wall_s": wall,
+        "rows_per_s": len(texts) / wall if wall else None,
+        "batch_latency_s": _percentiles(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+        "weights_mb": weights_mb,
+        "stages": {
+            stage: {
+                "batches": len(stage_latencies),
+                "rows": timer.rows[stage],
+                "busy_s": sum(stage_latencies),
+                **_percentiles(stage_latencies),
+                **timer.api_stats(stage),
+            }
+            for stage, stage_latencies in timer.latencies.items()
+        },
+        **({} if reference is None else {"agreement": agreement(reference, outputs)}),
+        "outputs": outputs,
+    }
@@ -0,0 +1,107 @@
+"""Generic in-memory and on-disk key-value caches."""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Mapping
+from pathlib import Path
+
+# SQLite ограничивает число параметров в одном запросе
+_SQLITE_CHUNK = 500
+
+
+class LRUCache:
+    """A dict-like cache that forgets the least recently used entries beyond `max_size`."""
+
+    def __init__(self, max_size: int = 100_000) -> None:
+        """
+        Initializes the LRUCache.
+
+        Args:
+            max_size (int, optional): Maximum number of entries. Defaults to 100_000.
+
+        """
+        self.max_size = max_size
+        self._data: OrderedDict[str, str] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        """Returns the cached value, or None if there is none."""
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        """Stores a value, evicting the least recently used entry if the cache is full."""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        """The number of cached entries."""
+        return len(self._data)
+
+
+class SQLiteCache:
+    """A persistent string-to-string store backed by a single SQLite table."""
+
+    def __init__(self, path: str | Path, table: str = "cache") -> None:
+        """
+        Initializes the SQLiteCache, creating the database file if needed.
+
+        Args:
+            path (str | Path): Path to the database file.
+            table (str, optional): Name of the table. Defaults to "cache".
+
+        """
+        if not table.isidentifier():
+            msg = f"Invalid table name: {table!r}"
+            raise ValueError(msg)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+            )
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, str]:
+        """
+        Looks up many keys at once.
+
+        Args:
+            keys (Iterable[str]): The keys to look up.
+
+        Returns:
+            dict[str, str]: The values of the keys that are present.
+
+        """
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQLITE_CHUNK):
+                chunk = keys[start : start + _SQLITE_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})",  # noqa: S608
+                    chunk,
+                )
+                found.update(rows)
+        return found
+
+    def set_many(self, items: Mapping[str, str]) -> None:
+        """Stores many values in a single transaction."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)",  # noqa: S608
+                items.items(),
+            )
+
+    def close(self) -> None:
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
@@ -1,9 +1,8 @@
 """Useful constants are defined here."""
 
+import functools
 from enum import Enum
 
-from google.generativeai.types import HarmBlockThreshold, HarmCategory
-
 
 class Language(Enum):
     """Two-letter language codes."""
@@ -15,10 +14,30 @@ class Language(Enum):
 
 NLLB_LANG_CODES: dict[str, str] = {"en": "eng_Latn", "ru": "rus_Cyrl", "tt": "tat_Cyrl"}
 
+# Квантование HF-моделей: none — float16 на GPU и float32 на CPU; dynamic-int8 — линейные слои
+# в int8 с динамическим квантованием активаций (только CPU); bf16 — все веса в bfloat16
+QUANTIZATION_MODES = ("none", "dynamic-int8", "bf16")
+
+# Исполнение HF-моделей: eager — обычный PyTorch; compile — torch.compile со статическим
+# KV-кэшем; onnx — экспорт в ONNX Runtime через Optimum (нужен extra onnx)
+INFERENCE_BACKENDS = ("eager", "compile", "onnx")
+
+
+@functools.cache
+def _low_safety() -> dict:
+    from google.generativeai.types import HarmBlockThreshold, HarmCategory  # noqa: PLC0415
+
+    return {
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    }
+
 
-LOW_SAFETY = {
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-}
+def __getattr__(name: str) -> object:
+    # LOW_SAFETY собирается при первом обращении, чтобы не импортировать SDK Google заранее
+    if name == "LOW_SAFETY":
+        return _low_safety()
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
@@ -1,5 +1,12 @@
 """Dataset classes are forcefully held here against their will."""
 
 from .detoxification_dataset import DetoxificationDataset
+from .loader import build_dataloader
+from .sampler import BucketBatchSampler, TokenBudgetBatchSampler
 
-__all__ = ["DetoxificationDataset"]
+__all__ = [
+    "BucketBatchSampler",
+    "DetoxificationDataset",
+    "TokenBudgetBatchSampler",
+    "build_dataloader",
+]
@@ -1,34 +1,116 @@
 """Collate function для DataLoader."""
 
 import json
+from collections.abc import Callable
 
 import torch
+from torch.nn.utils.rnn import pad_sequence
 
 from bugulma_enjoyers.prompts import BATCH_PROMPTS
 
+MIXED_BATCH_ERROR = "Batch mixes {}: {}. Use BucketBatchSampler to keep batches homogeneous."
 
-def get_collate_fn(task: str) -> None:
+
+def _single_value(batch: list[dict], key: str) -> object:
+    """Returns the value of `key` shared by all items of the batch."""
+    values = {item.get(key) for item in batch}
+    if len(values) > 1:
+        raise ValueError(MIXED_BATCH_ERROR.format(key, sorted(map(str, values))))
+    return values.pop()
+
+
+BATCH_DATA_PLACEHOLDER = "{batch_data_str}"
+
+
+def split_batch_prompt(task: str, language: str) -> tuple[str, str]:
+    """
+    Splits a batch prompt into its static prefix and per-batch suffix template.
+
+    Everything before the batch data (instructions, examples, the dictionary) is the same for
+    every request, so providers can cache it once per run.
+
+    Args:
+        task (str): The task, a key of BATCH_PROMPTS.
+        language (str): The language of the texts.
+
+    Returns:
+        tuple[str, str]: The ready-to-send prefix and the suffix, still to be formatted with
+            `batch_data_str`.
+
+    """
+    template = BATCH_PROMPTS[task][language]
+    split_at = template.index(BATCH_DATA_PLACEHOLDER)
+    # format() без аргументов только раскрывает экранированные {{ }}
+    return template[:split_at].format(), template[split_at:]
+
+
+def format_batch_data(texts: list[str]) -> str:
+    """Serializes texts into the JSON list the batch prompts expect, IDs being positions."""
+    return json.dumps(
+        [{"ID": idx, "text": text} for idx, text in enumerate(texts)],
+        ensure_ascii=False,
+    )
+
+
+def build_batch_prompt(task: str, language: str, texts: list[str]) -> str:
+    """
+    Builds the prompt asking an LLM to process all texts at once.
+
+    Args:
+        task (str): The task, a key of BATCH_PROMPTS.
+        language (str): The language of the texts.
+        texts (list[str]): The texts; their positions become the IDs in the prompt.
+
+    Returns:
+        str: The prompt.
+
+    """
+    prefix, suffix = split_batch_prompt(task, language)
+    return prefix + suffix.format(batch_data_str=format_batch_data(texts))
+
+
+def get_collate_fn(task: str, pad_token_id: int = 0) -> Callable[[list[dict]], dict]:
     def collate_fn(batch: list[dict]) -> dict:
-        """Collate function для DataLoader."""
+        """
+        Collate function для DataLoader.
+
+        Pads `input_ids` and `attention_mask` only up to the longest item of the batch. The
+        prompt and `forced_bos_token_id` are shared by the whole batch, so all items must be of
+        the same language.
+        """
+        if not batch:
+            return {
+                "input_ids": torch.empty((0, 0), dtype=torch.long),
+                "attention_mask": torch.empty((0, 0), dtype=torch.long),
+                "languages": [],
+                "original_text": [],
+                "indices": [],
+                "prompted_text": "",
+                "task": task,
+                "forced_bos_token_id": None,
+            }
+        language = _single_value(batch, "language")
         return {
-            "input_ids": torch.stack([item["input_ids"] for item in batch]),
-            "attention_mask": torch.stack([item["attention_mask"] for item in batch]),
+            "input_ids": pad_sequence(
+                [item["input_ids"] for item in batch],
+                batch_first=True,
+                padding_value=pad_token_id,
+            ),
+            "attention_mask": pad_sequence(
+                [item["attention_mask"] for item in batch],
+                batch_first=True,
+                padding_value=0,
+            ),
             "languages": [item["language"] for item in batch],
             "original_text": [item["original_text"] for item in batch],
-            "prompted_text": ""
-            if not batch
-            else (
-                BATCH_PROMPTS[task][batch[0]["language"]].format(
-                    batch_data_str=json.dumps(
-                        [
-                            {"ID": idx, "text": item["original_text"]}
-                            for idx, item in enumerate(batch)
-                        ],
-                        ensure_ascii=False,
-                    ),
-                )
+            "indices": [item.get("index", idx) for idx, item in enumerate(batch)],
+            "prompted_text": build_batch_prompt(
+                task,
+                language,
+                [item["original_text"] for item in batch],
             ),
-            "forced_bos_token_id": batch[0].get("forced_bos_token_id") if batch else None,
+            "task": task,
+            "forced_bos_token_id": _single_value(batch, "forced_bos_token_id"),
         }
 
     return collate_fn
@@ -1,10 +1,12 @@
 """Basic detoxification dataset class is defined here."""
 
 import logging
+from pathlib import Path
 
 import torch
 from torch.utils.data import Dataset
 
+from bugulma_enjoyers.datasets.token_store import TokenStore
 from bugulma_enjoyers.prompts import SIMPLE_PROMPTS
 
 logger = logging.getLogger(__name__)
@@ -22,6 +24,7 @@ class DetoxificationDataset(Dataset):
         task="detoxification",
         use_prompts: bool = True,
         forced_bos_token_id: int | None = None,
+        cache_dir: str | Path | None = None,
     ) -> None:
         """
         Initializes the DetoxificationDataset.
@@ -32,6 +35,8 @@ class DetoxificationDataset(Dataset):
             tokenizer (torch.nn.Module): The tokenizer to use for tokenization.
             max_length (int, optional): The maximum length of the input text. Defaults to 256.
             prompts (dict[str, str] | None, optional): The prompts to use for detoxification. Defaults to None.
+            cache_dir (str | Path | None, optional): Directory to persist token ids in, so that
+                the same texts are never tokenized twice. Defaults to None (no persistence).
 
         """
         self.texts = texts
@@ -41,20 +46,48 @@ class DetoxificationDataset(Dataset):
         self.forced_bos_token_id = forced_bos_token_id
         self.task = task
         self.use_prompts = use_prompts
+        self.cache_dir = cache_dir
+        self._encodings = None
 
     def __len__(self) -> int:
         """The length of the dataset."""
         return len(self.texts)
 
+    @property
+    def prompted_texts(self) -> list[str]:
+        """The texts with the prompts of their languages applied."""
+        return [
+            (SIMPLE_PROMPTS[self.task][lang] if self.use_prompts else "{}").format(text)
+            for text, lang in zip(self.texts, self.languages, strict=True)
+        ]
+
+    @property
+    def lengths(self) -> list[int]:
+        """Token length of every item (after truncation), used to bucket similar items."""
+        return self._encode().lengths.tolist()
+
+    def _encode(self) -> TokenStore:
+        """Tokenizes the whole dataset in one batched call, without padding."""
+        if self._encodings is None:
+            # Токенизация: паддинг делается в collate до самого длинного элемента батча
+            self._encodings = TokenStore.build(
+                self.tokenizer,
+                self.prompted_texts,
+                max_length=self.max_length,
+                cache_dir=self.cache_dir,
+            )
+        return self._encodings
+
     def __getitem__(self, idx: int) -> dict[str, torch.Tensor]:
         """
         Returns the item at the given index.
 
         The element is a dictionary with the following keys:
-            - input_ids: torch.Tensor of shape (max_length,)
-            - attention_mask: torch.Tensor of shape (max_length,)
+            - input_ids: torch.Tensor of shape (seq_len,), not padded
+            - attention_mask: torch.Tensor of shape (seq_len,)
             - language: str
             - original_text: str
+            - index: int, position of the item in the dataset
         Note that the input_ids and attention_mask correspond to the text with the prompt prepended.
         """
         text = self.texts[idx]
@@ -62,22 +95,14 @@ class DetoxificationDataset(Dataset):
 
         prompt = SIMPLE_PROMPTS[self.task][lang] if self.use_prompts else "{}"
 
-        input_text = prompt.format(text)
-
-        # Токенизация
-        encoding = self.tokenizer(
-            input_text,
-            max_length=self.max_length,
-            padding="max_length",
-            truncation=True,
-            return_tensors="pt",
-        )
+        input_ids = torch.from_numpy(self._encode()[idx].astype("int64"))
 
         return {
-            "input_ids": encoding["input_ids"].squeeze(0),
-            "attention_mask": encoding["attention_mask"].squeeze(0),
+            "input_ids": input_ids,
+            "attention_mask": torch.ones_like(input_ids),
             "language": lang,
             "original_text": text,
-            "prompted_text": input_text,
+            "prompted_text": prompt.format(text),
             "forced_bos_token_id": self.forced_bos_token_id,
+            "index": idx,
         }
@@ -0,0 +1,42 @@
+"""DataLoader construction shared by the detoxifiers."""
+
+from torch.utils.data import DataLoader
+
+from bugulma_enjoyers.datasets.collate import get_collate_fn
+from bugulma_enjoyers.datasets.detoxification_dataset import DetoxificationDataset
+from bugulma_enjoyers.datasets.sampler import BucketBatchSampler
+
+
+def build_dataloader(
+    dataset: DetoxificationDataset,
+    batch_size: int,
+    task: str,
+    model: object | None = None,
+) -> DataLoader:
+    """
+    Builds a DataLoader with language/length bucketing and dynamic padding.
+
+    Batches come out of order: every batch has an `indices` entry with the dataset positions
+    of its items, which callers use to put the outputs back in input order.
+
+    Args:
+        dataset (DetoxificationDataset): The dataset to iterate over.
+        batch_size (int): Maximum number of items in a batch.
+        task (str): The task used to pick the batch prompt.
+        model (object | None, optional): The model the batches are for. Its
+            `make_batch_sampler` may replace the default bucketing, e.g. to pack API requests
+            by tokens. Defaults to None.
+
+    Returns:
+        DataLoader: The DataLoader.
+
+    """
+    pad_token_id = getattr(dataset.tokenizer, "pad_token_id", None)
+    batch_sampler = None if model is None else model.make_batch_sampler(dataset, task)
+    if batch_sampler is None:
+        batch_sampler = BucketBatchSampler(dataset.lengths, dataset.languages, batch_size)
+    return DataLoader(
+        dataset,
+        batch_sampler=batch_sampler,
+        collate_fn=get_collate_fn(task, pad_token_id=0 if pad_token_id is None else pad_token_id),
+    )
@@ -0,0 +1,120 @@
+"""Batch samplers that keep batches homogeneous in language and token length."""
+
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
+
+from torch.utils.data import Sampler
+
+
+class BucketBatchSampler(Sampler[list[int]]):
+    """
+    Groups dataset indices into batches of one language and similar token length.
+
+    Indices are split by language, sorted by length inside every language (longest first, so
+    out-of-memory problems surface on the very first batch) and cut into chunks of `batch_size`.
+    Combined with dynamic padding in the collate function this keeps the padded tensors close
+    to the real amount of tokens. Since batches no longer follow the input order, every item
+    carries its dataset index and callers are expected to put results back in place.
+    """
+
+    def __init__(
+        self,
+        lengths: Sequence[int],
+        languages: Sequence[str],
+        batch_size: int,
+    ) -> None:
+        """
+        Initializes the BucketBatchSampler.
+
+        Args:
+            lengths (Sequence[int]): Token length of every dataset item.
+            languages (Sequence[str]): Language of every dataset item.
+            batch_size (int): Maximum number of items in a batch.
+
+        """
+        if len(lengths) != len(languages):
+            msg = "lengths and languages must have the same size"
+            raise ValueError(msg)
+        if batch_size < 1:
+            msg = f"batch_size must be positive, got {batch_size}"
+            raise ValueError(msg)
+
+        groups = defaultdict(list)
+        for idx, lang in enumerate(languages):
+            groups[lang].append(idx)
+
+        self.batches = []
+        for indices in groups.values():
+            ordered = sorted(indices, key=lambda idx: lengths[idx], reverse=True)
+            self.batches.extend(
+                ordered[start : start + batch_size] for start in range(0, len(ordered), batch_size)
+            )
+
+    def __iter__(self) -> Iterator[list[int]]:
+        """Yields batches of dataset indices."""
+        yield from self.batches
+
+    def __len__(self) -> int:
+        """The number of batches."""
+        return len(self.batches)
+
+
+class TokenBudgetBatchSampler(Sampler[list[int]]):
+    """
+    Packs items of one language into batches that fit an input and an output token budget.
+
+    Meant for LLM APIs, where the batch prompt carries a large static preamble: the more rows a
+    request holds, the better that cost is amortized. Items are packed longest first, so the
+    budgets are filled tightly. An item that alone exceeds a budget gets a batch of its own.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        languages: Sequence[str],
+        input_tokens: Sequence[int],
+        output_tokens: Sequence[int],
+        max_input_tokens: int,
+        max_output_tokens: int,
+        max_rows: int | None = None,
+    ) -> None:
+        """
+        Initializes the TokenBudgetBatchSampler.
+
+        Args:
+            languages (Sequence[str]): Language of every dataset item.
+            input_tokens (Sequence[int]): Estimated prompt tokens of every item.
+            output_tokens (Sequence[int]): Estimated answer tokens of every item.
+            max_input_tokens (int): Prompt token budget of a batch (without the static preamble).
+            max_output_tokens (int): Answer token budget of a batch.
+            max_rows (int | None, optional): Maximum number of items in a batch. Defaults to None.
+
+        """
+        groups = defaultdict(list)
+        for idx, lang in enumerate(languages):
+            groups[lang].append(idx)
+
+        self.batches = []
+        for indices in groups.values():
+            batch, batch_input, batch_output = [], 0, 0
+            for idx in sorted(indices, key=lambda idx: input_tokens[idx], reverse=True):
+                fits = (
+                    batch_input + input_tokens[idx] <= max_input_tokens
+                    and batch_output + output_tokens[idx] <= max_output_tokens
+                    and (max_rows is None or len(batch) < max_rows)
+                )
+                if batch and not fits:
+                    self.batches.append(batch)
+                    batch, batch_input, batch_output = [], 0, 0
+                batch.append(idx)
+                batch_input += input_tokens[idx]
+                batch_output += output_tokens[idx]
+            if batch:
+                self.batches.append(batch)
+
+    def __iter__(self) -> Iterator[list[int]]:
+        """Yields batches of dataset indices."""
+        yield from self.batches
+
+    def __len__(self) -> int:
+        """The number of batches."""
+        return len(self.batches)
@@ -0,0 +1,205 @@
+"""Compact, persistable storage for pre-tokenized texts."""
+
+import hashlib
+import itertools
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Self
+
+import numpy as np
+
+from bugulma_enjoyers.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Предел размера каталога с сохранёнными токенами; сверх него удаляются давно не читанные
+MAX_CACHE_BYTES = 256 * 2**20
+
+
+def tokenizer_fingerprint(tokenizer: Any) -> str | None:
+    """
+    Describes a tokenizer well enough to tell whether cached token ids are still valid.
+
+    Args:
+        tokenizer (Any): The tokenizer.
+
+    Returns:
+        str | None: The fingerprint, or None if the tokenizer can not be identified (e.g. the
+            dummy tokenizer of API models), in which case nothing should be persisted.
+
+    """
+    name = getattr(tokenizer, "name_or_path", None)
+    if not name:
+        return None
+    try:
+        vocab_size = len(tokenizer)
+    except TypeError:
+        vocab_size = getattr(tokenizer, "vocab_size", None)
+    # src_lang влияет на служебные токены NLLB, поэтому входит в ключ
+    src_lang = getattr(tokenizer, "src_lang", None)
+    return f"{type(tokenizer).__name__}|{name}|{vocab_size}|{src_lang}"
+
+
+class TokenStore:
+    """
+    Token ids of many texts packed into two flat arrays.
+
+    Item `i` is `tokens[offsets[i]:offsets[i + 1]]`, so the whole dataset costs two numpy
+    allocations instead of a Python list per text.
+    """
+
+    def __init__(self, offsets: np.ndarray, tokens: np.ndarray) -> None:
+        """
+        Initializes the TokenStore.
+
+        Args:
+            offsets (np.ndarray): int64 array of size `n + 1` with item boundaries.
+            tokens (np.ndarray): int32 array with the token ids of all items.
+
+        """
+        self.offsets = offsets
+        self.tokens = tokens
+
+    @classmethod
+    def from_lists(cls, ids: list[list[int]]) -> Self:
+        """Packs a list of token id lists."""
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in ids], out=offsets[1:])
+        tokens = np.fromiter(
+            itertools.chain.from_iterable(ids),
+            dtype=np.int32,
+            count=int(offsets[-1]),
+        )
+        return cls(offsets, tokens)
+
+    @classmethod
+    def build(
+        cls,
+        tokenizer: Any,
+        texts: list[str],
+        max_length: int,
+        cache_dir: str | Path | None = None,
+        max_cache_bytes: int | None = MAX_CACHE_BYTES,
+    ) -> Self:
+        """
+        Tokenizes all texts in a single batched call, reusing a persisted store if possible.
+
+        The on-disk store is keyed by the tokenizer fingerprint, `max_length` and a hash of the
+        texts. Callers pass the texts with their prompts applied, so the prompt template is part
+        of the key as well. Every distinct list of texts adds a file, so the least recently used
+        files are removed once the directory grows beyond `max_cache_bytes`.
+
+        Args:
+            tokenizer (Any): The tokenizer to use.
+            texts (list[str]): The texts to tokenize.
+            max_length (int): Texts are truncated to this many tokens.
+            cache_dir (str | Path | None, optional): Directory with persisted stores. Defaults to
+                None, which disables persistence.
+            max_cache_bytes (int | None, optional): Size limit of `cache_dir`. Defaults to
+                MAX_CACHE_BYTES; None disables the limit.
+
+        Returns:
+            TokenStore: The token ids of the texts.
+
+        """
+        fingerprint = tokenizer_fingerprint(tokenizer)
+        path = None
+        if cache_dir is not None and fingerprint is not None:
+            path = Path(cache_dir) / f"{cls.cache_key(fingerprint, texts, max_length)}.npz"
+            if path.exists():
+                try:
+                    store = cls.load(path)
+                    # Время изменения служит отметкой последнего использования для вытеснения
+                    os.utime(path)
+                except (OSError, ValueError, KeyError):
+                    logger.warning("Corrupted token store %s, tokenizing again", path)
+                else:
+                    return store
+
+        with metrics.timer("tokenization_seconds", tokenizer=type(tokenizer).__name__):
+            ids = tokenizer(
+                texts,
+                max_length=max_length,
+                padding=False,
+                truncation=True,
+                return_attention_mask=False,
+            )["input_ids"]
+        store = cls.from_lists(ids)
+        if path is not None:
+            store.save(path)
+            if max_cache_bytes is not None:
+                prune_cache(path.parent, max_cache_bytes, keep=path)
+        return store
+
+    @staticmethod
+    def cache_key(fingerprint: str, texts: list[str], max_length: int) -> str:
+        """Hashes everything the token ids depend on."""
+        digest = hashlib.sha256(f"{fingerprint}|{max_length}|{len(texts)}".encode())
+        for text in texts:
+            digest.update(b"\0")
+            digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """Number of tokens of every item."""
+        return np.diff(self.offsets)
+
+    def save(self, path: str | Path) -> None:
+        """Atomically writes the store to an `.npz` file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez(file, offsets=self.offsets, tokens=self.tokens)
+            Path(tmp_path).replace(path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def load(cls, path: str | Path) -> Self:
+        """Reads a store written by `save`."""
+        with np.load(path) as data:
+            return cls(data["offsets"], data["tokens"])
+
+    def __len__(self) -> int:
+        """The number of items."""
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        """The token ids of the item at the given index."""
+        return self.tokens[self.offsets[idx] : self.offsets[idx + 1]]
+
+
+def prune_cache(cache_dir: str | Path, max_bytes: int, keep: Path | None = None) -> None:
+    """
+    Removes the least recently used stores until the directory fits into `max_bytes`.
+
+    Args:
+        cache_dir (str | Path): Directory with persisted stores.
+        max_bytes (int): Size limit of the stores.
+        keep (Path | None, optional): A store that is never removed, e.g. the one just written.
+            Defaults to None.
+
+    """
+    entries = []
+    for path in Path(cache_dir).glob("*.npz"):
+        try:
+            stat = path.stat()
+        except OSError:
+            # Удалён параллельным процессом
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+        logger.debug("Evicted token store %s", path)
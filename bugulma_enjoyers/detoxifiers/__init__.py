@@ -1,10 +1,14 @@
 from bugulma_enjoyers.detoxifiers.backtranslation import BacktranslationDetoxifier
 from bugulma_enjoyers.detoxifiers.base import BaseDetoxifier, PipelineConfig
+from bugulma_enjoyers.detoxifiers.caching import CachingDetoxifier
+from bugulma_enjoyers.detoxifiers.dedup import DedupDetoxifier
 from bugulma_enjoyers.detoxifiers.standalone import MT0PipelineConfig, StandaloneDetoxifier
 
 __all__ = [
     "BacktranslationDetoxifier",
     "BaseDetoxifier",
+    "CachingDetoxifier",
+    "DedupDetoxifier",
     "PipelineConfig",
     "MT0PipelineConfig",
     "StandaloneDetoxifier",
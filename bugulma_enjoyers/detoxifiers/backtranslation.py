@@ -1,12 +1,17 @@
+import json
 import logging
 from collections import defaultdict
 
 import torch
 
 from bugulma_enjoyers.constants import NLLB_LANG_CODES
-from bugulma_enjoyers.datasets.collate import get_collate_fn
 from bugulma_enjoyers.datasets.detoxification_dataset import DetoxificationDataset
+from bugulma_enjoyers.datasets.loader import build_dataloader
 from bugulma_enjoyers.detoxifiers.base import BaseDetoxifier, PipelineConfig
+from bugulma_enjoyers.detoxifiers.translation_memory import (
+    TranslationMemory,
+    translation_namespace,
+)
 from bugulma_enjoyers.load_model import load_model
 from bugulma_enjoyers.models import APIModel
 
@@ -29,6 +34,34 @@ class BacktranslationDetoxifier(BaseDetoxifier):
             model_name=config.translator_model_name, pipeline_config=config,
         ).to(self.device)
 
+        # Переводы обоих плеч переиспользуются между батчами и перезапусками
+        self.memory = None
+        if config.translation_memory:
+            memory_path = config.cache_path("translations")
+            self.memory = TranslationMemory(
+                translation_namespace(config),
+                db_path=None if memory_path is None else memory_path / "translations.sqlite",
+            )
+
+    def release(self) -> None:
+        """Frees the translator and the models of the pivot-language detoxifier."""
+        self.translator.release()
+        self.base_detoxifier.release()
+
+    def close(self) -> None:
+        """Closes the translator, the pivot-language detoxifier and the translation memory."""
+        self.translator.close()
+        self.base_detoxifier.close()
+        if self.memory is not None:
+            self.memory.close()
+
+    def fingerprint(self) -> str:
+        """Extends the default fingerprint with the one of the pivot-language detoxifier."""
+        return json.dumps(
+            {"self": super().fingerprint(), "base": self.base_detoxifier.fingerprint()},
+            sort_keys=True,
+        )
+
     def _get_translator_code(self, lang: str) -> str:
         code = NLLB_LANG_CODES.get(lang)
         if code is None:
@@ -60,6 +93,21 @@ class BacktranslationDetoxifier(BaseDetoxifier):
         texts: list[str],
         src_lang: str,
         tgt_lang: str,
+    ) -> list[str]:
+        if self.memory is None:
+            return self._run_translator(texts, src_lang, tgt_lang)
+        return self.memory.translate(
+            texts,
+            src_lang,
+            tgt_lang,
+            lambda misses: self._run_translator(misses, src_lang, tgt_lang),
+        )
+
+    def _run_translator(
+        self,
+        texts: list[str],
+        src_lang: str,
+        tgt_lang: str,
     ) -> list[str]:
         src_code = NLLB_LANG_CODES.get(src_lang, "eng_Latn")
         tgt_code = NLLB_LANG_CODES.get(tgt_lang, "eng_Latn")
@@ -71,16 +119,22 @@ class BacktranslationDetoxifier(BaseDetoxifier):
             languages=[src_lang] * len(texts),
             tokenizer=self.translator.tokenizer,
             forced_bos_token_id=forced_bos_token_id,
+            max_length=self.config.max_length,
             use_prompts=isinstance(self.translator, APIModel),
+            cache_dir=self.config.cache_path("tokens"),
         )
-        dataloader = torch.utils.data.DataLoader(
+        dataloader = build_dataloader(
             dataset,
-            batch_size=self.config.batch_size,
-            shuffle=False,
-            collate_fn=get_collate_fn("translation"),
+            self.config.batch_size,
+            task="translation",
+            model=self.translator,
         )
+        results = [None] * len(texts)
         with torch.inference_mode():
-            return [text for batch in dataloader for text in self.translator.forward(batch)]
+            for batch, outputs in self.translator.forward_batches(dataloader):
+                for idx, text in zip(batch["indices"], outputs, strict=True):
+                    results[idx] = text
+        return results
 
     def detoxify(self, text: str, language: str) -> str:
         """
@@ -142,15 +196,18 @@ class BacktranslationDetoxifier(BaseDetoxifier):
             lang_groups[lang].append(text)
             lang_indices[lang].append(idx)
         results = [None] * len(texts)
+        untouched = set()
         for lang, group_texts in lang_groups.items():
             # Перевод на pivot
             translated = self._translate_batch(group_texts, lang, pivot)
             # print(translated) # noqa: ERA001
             # Детоксификация
-            detoxified = self.base_detoxifier.detoxify_batch(translated, pivot)
+            detoxified = self.base_detoxifier.detoxify_batch(translated, [pivot] * len(translated))
+            untouched.update(lang_indices[lang][pos] for pos in self.base_detoxifier.last_untouched)
             # Перевод обратно
             back_translated = self._translate_batch(detoxified, pivot, lang)
             # Сохраняем результаты
             for idx, result in zip(lang_indices[lang], back_translated, strict=True):
                 results[idx] = result
+        self.last_untouched = frozenset(untouched)
         return results
@@ -1,13 +1,90 @@
 """ABC for detoxifier & basic pipeline config is defined here."""
 
+import functools
+import hashlib
+import json
+import time
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, field
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
 
 import torch
 
+from bugulma_enjoyers.generation import GenerationPolicy, default_generation_policies
+from bugulma_enjoyers.metrics import metrics
+from bugulma_enjoyers.prompts import BATCH_PROMPTS, SIMPLE_PROMPTS
+
+labse_model_name: str = "sentence-transformers/LaBSE"
+xcomet_model_name: str = "myyycroft/XCOMET-lite"
+
+# Поля конфига, которые не влияют на результат детоксификации
+RUNTIME_CONFIG_FIELDS = frozenset(
+    {
+        "batch_size",
+        "scorer_batch_size",
+        "device",
+        "inference_backend",
+        "num_workers",
+        "threads_per_worker",
+        "translation_memory",
+        "cache_dir",
+        "api_max_in_flight",
+        "api_pool_size",
+        "api_connect_timeout",
+        "api_read_timeout",
+        "api_requests_per_minute",
+        "api_tokens_per_minute",
+        "api_max_retries",
+        "api_backoff_base",
+        "api_backoff_max",
+        "api_max_repair_attempts",
+        "api_max_input_tokens",
+        "api_max_output_tokens",
+        "api_max_batch_rows",
+        "api_prefix_caching",
+        "api_prefix_cache_ttl",
+    },
+)
+
+
+def _instrument_detoxify_batch(detoxify_batch: Callable) -> Callable:
+    """Records calls, rows, time and unchanged rows of `detoxify_batch`, by detoxifier class."""
+
+    @functools.wraps(detoxify_batch)
+    def instrumented(self: "BaseDetoxifier", texts: list[str], languages: list[str]) -> list[str]:
+        start = time.perf_counter()
+        self.last_untouched = frozenset()
+        outputs = detoxify_batch(self, texts, languages)
+        detoxifier = type(self).__name__
+        metrics.observe("detoxifier_seconds", time.perf_counter() - start, detoxifier=detoxifier)
+        metrics.increment("detoxifier_calls_total", detoxifier=detoxifier)
+        metrics.increment("detoxifier_rows_total", len(texts), detoxifier=detoxifier)
+        unchanged = sum(text == output for text, output in zip(texts, outputs, strict=False))
+        metrics.increment("detoxifier_unchanged_rows_total", unchanged, detoxifier=detoxifier)
+        return outputs
+
+    return instrumented
+
 
 class BaseDetoxifier(ABC):
-    """ABC for detoxifiers."""
+    """
+    ABC for detoxifiers.
+
+    Attributes:
+        last_untouched (frozenset[int]): Positions of the rows of the last `detoxify_batch` call
+            that were returned unchanged because the model gave no answer for them (e.g. after
+            API failures). Such results must not be cached.
+
+    """
+
+    last_untouched: frozenset[int] = frozenset()
+
+    def __init_subclass__(cls, **kwargs: object) -> None:
+        """Instruments `detoxify_batch` of every subclass that overrides it."""
+        super().__init_subclass__(**kwargs)
+        if "detoxify_batch" in cls.__dict__:
+            cls.detoxify_batch = _instrument_detoxify_batch(cls.detoxify_batch)
 
     @abstractmethod
     def detoxify(self, text: str, language: str) -> str:
@@ -37,6 +114,50 @@ class BaseDetoxifier(ABC):
 
         """
 
+    def release(self) -> None:  # noqa: B027
+        """
+        Frees the models of the detoxifier once it is no longer needed.
+
+        The detoxifier must not be used afterwards. The default implementation does nothing.
+        """
+
+    def close(self) -> None:  # noqa: B027
+        """
+        Releases what the detoxifier holds outside the process at the end of the run.
+
+        E.g. prompt prefixes cached (and billed) by API providers, or open databases. The
+        default implementation does nothing.
+        """
+
+    def fingerprint(self) -> str:
+        """
+        Describes everything the outputs depend on besides the input texts.
+
+        Two detoxifiers with equal fingerprints are expected to produce equal outputs, which lets
+        results be cached across runs. The default covers the class, the output-relevant fields
+        of `self.config` and the prompts.
+
+        Returns:
+            str: The fingerprint.
+
+        """
+        config = getattr(self, "config", None)
+        config_fields = {} if config is None else asdict(config)
+        prompts = json.dumps([SIMPLE_PROMPTS, BATCH_PROMPTS], sort_keys=True, ensure_ascii=False)
+        return json.dumps(
+            {
+                "detoxifier": type(self).__name__,
+                "config": {
+                    key: value
+                    for key, value in config_fields.items()
+                    if key not in RUNTIME_CONFIG_FIELDS
+                },
+                "prompts": hashlib.sha256(prompts.encode("utf-8")).hexdigest(),
+            },
+            sort_keys=True,
+            default=str,
+        )
+
 
 @dataclass
 class PipelineConfig:
@@ -54,6 +175,7 @@ class PipelineConfig:
     detoxifier_model_name: str = "hf/s-nlp/mt0-xl-detox-orpo"
     translator_model_name: str = "hf/facebook/nllb-200-distilled-600M"
     toxicity_detector_model_name: str = "hf/textdetox/xlmr-large-toxicity-classifier-v2"
+    similarity_model_name: str = f"hf/{labse_model_name}"
 
     # Inference параметры
     max_length: int = 256
@@ -62,17 +184,79 @@ class PipelineConfig:
     temperature: float = 0.7
     top_p: float = 0.9
     do_sample: bool = False
+    # Бюджет генерации HF-моделей по задачам ("detoxification", "translation"): max_new_tokens
+    # растёт с длиной источников батча, но не больше max_length; задачи без политики
+    # генерируют до max_length
+    generation_policies: dict[str, GenerationPolicy] = field(
+        default_factory=default_generation_policies,
+    )
 
+    # Сколько батчей API-модели отправляются одновременно
+    api_max_in_flight: int = 4
+    # Пул HTTP-соединений и таймауты (секунды) для API-моделей
+    api_pool_size: int = 8
+    api_connect_timeout: float = 10.0
+    api_read_timeout: float = 120.0
+    # Квоты провайдера (None — без ограничения) и повторы при 429/5xx
+    api_requests_per_minute: float | None = None
+    api_tokens_per_minute: float | None = None
+    api_max_retries: int = 5
+    api_backoff_base: float = 1.0
+    api_backoff_max: float = 60.0
+    # Сколько запросов на батч можно потратить на дозапрос пропущенных строк
+    api_max_repair_attempts: int = 4
+    # Бюджеты токенов на запрос: если api_max_input_tokens задан, батчи API-моделей
+    # набираются по токенам (не больше api_max_batch_rows строк), а не по batch_size.
+    # Лимит ответа передаётся провайдеру, только если задан api_max_output_tokens: у Gemini
+    # в него входят и рассуждения, так что слишком тесный лимит обрывает JSON
+    api_max_input_tokens: int | None = None
+    api_max_output_tokens: int | None = None
+    api_max_batch_rows: int = 64
+    # Кэшировать статичную часть батч-промпта (инструкции и словарь) на стороне провайдера
+    api_prefix_caching: bool = True
+    api_prefix_cache_ttl: float = 3600.0
+
+    # Строки с вероятностью токсичности ниже порога не детоксифицируются
     toxicity_threshold: float = 0.5
+    # Каскад: выход стадии уходит на следующую, если он ещё токсичен или похож на исходный
+    # текст меньше, чем на similarity_threshold
     similarity_threshold: float = 0.7
+    # Размер батча классификатора токсичности и LaBSE
+    scorer_batch_size: int = 64
+
+    # Квантование HF-моделей при загрузке: "none", "dynamic-int8" (CPU) или "bf16"
+    quantization: str = "none"
+    # Исполнение HF-моделей: "eager", "compile" или "onnx"
+    inference_backend: str = "eager"
 
-    device: str = "cuda" if torch.cuda.is_available() else "cpu"
+    # Процессы для параллельного инференса локальной модели на CPU (веса общие через fork) и
+    # потоки torch в каждом; None делит ядра поровну
+    num_workers: int = 1
+    threads_per_worker: int | None = None
+
+    # Запоминать переводы BacktranslationDetoxifier (на диске в cache_dir/translations)
+    translation_memory: bool = True
+
+    # Определяется при создании конфига, а не при импорте модуля
+    device: str = field(default_factory=lambda: "cuda" if torch.cuda.is_available() else "cpu")
 
     backtranslation_languages: list[str] = field(default_factory=lambda: ["ru"])
 
     pivot_language: str = "en"
     prompts = None
 
+    # Кэши на диске (токены и т.п.); None отключает их
+    cache_dir: str | None = ".bugulma_cache"
 
-labse_model_name: str = "sentence-transformers/LaBSE"
-xcomet_model_name: str = "myyycroft/XCOMET-lite"
+    def cache_path(self, name: str) -> Path | None:
+        """
+        Returns the directory of the named on-disk cache.
+
+        Args:
+            name (str): The name of the cache, e.g. "tokens".
+
+        Returns:
+            Path | None: The directory, or None if on-disk caching is disabled.
+
+        """
+        return None if self.cache_dir is None else Path(self.cache_dir) / name
@@ -0,0 +1,127 @@
+"""Class CachingDetoxifier: memoizes results of any other detoxifier is defined here."""
+
+import hashlib
+import logging
+from pathlib import Path
+
+from bugulma_enjoyers.cache import LRUCache, SQLiteCache
+from bugulma_enjoyers.detoxifiers.base import BaseDetoxifier
+
+logger = logging.getLogger(__name__)
+
+
+class CachingDetoxifier(BaseDetoxifier):
+    """
+    Wraps a detoxifier and remembers its result for every (text, language).
+
+    Results are looked up in an in-memory LRU first and in an SQLite database second. Keys
+    also include the fingerprint of the wrapped detoxifier (model names, generation parameters,
+    prompts), so changing the config never returns stale results. Only misses are forwarded
+    to the wrapped detoxifier, in a single `detoxify_batch` call, and only rows it actually
+    answered are stored (see `BaseDetoxifier.last_untouched`).
+    """
+
+    def __init__(
+        self,
+        detoxifier: BaseDetoxifier,
+        db_path: str | Path | None = None,
+        max_memory_entries: int = 100_000,
+    ) -> None:
+        """
+        Initializes the CachingDetoxifier.
+
+        Args:
+            detoxifier (BaseDetoxifier): The detoxifier to cache results of.
+            db_path (str | Path | None, optional): SQLite database to persist results in.
+                Defaults to None, which keeps results in memory only.
+            max_memory_entries (int, optional): Size of the in-memory LRU. Defaults to 100_000.
+
+        """
+        self.detoxifier = detoxifier
+        self.config = getattr(detoxifier, "config", None)
+        self.memory = LRUCache(max_memory_entries)
+        self.disk = None if db_path is None else SQLiteCache(db_path, table="results")
+        self._namespace = hashlib.sha256(detoxifier.fingerprint().encode("utf-8")).hexdigest()
+
+    def release(self) -> None:
+        """Frees the models of the wrapped detoxifier."""
+        self.detoxifier.release()
+
+    def close(self) -> None:
+        """Closes the wrapped detoxifier and the database."""
+        self.detoxifier.close()
+        if self.disk is not None:
+            self.disk.close()
+
+    def fingerprint(self) -> str:
+        """Caching does not change the outputs, so the fingerprint is the wrapped one."""
+        return self.detoxifier.fingerprint()
+
+    def _key(self, text: str, language: str) -> str:
+        payload = f"{self._namespace}\0{language}\0{text}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def detoxify(self, text: str, language: str) -> str:
+        """
+        Runs detoxification on a single text.
+
+        Args:
+            text (str): Text to detoxify
+            language (str): Language of the text
+
+        Returns:
+            str: detoxified text
+
+        """
+        return self.detoxify_batch([text], [language])[0]
+
+    def detoxify_batch(self, texts: list[str], languages: list[str]) -> list[str]:
+        """
+        Run detoxification on a batch of texts, skipping the ones with cached results.
+
+        Args:
+            texts (List[str]): List of texts to detoxify
+            languages (List[str]): List of languages of the texts
+
+        Returns:
+            List[str]: List of detoxified texts
+
+        """
+        keys = [self._key(text, lang) for text, lang in zip(texts, languages, strict=True)]
+        found = {}
+        for key in keys:
+            value = self.memory.get(key)
+            if value is not None:
+                found[key] = value
+        if self.disk is not None:
+            from_disk = self.disk.get_many({key for key in keys if key not in found})
+            for key, value in from_disk.items():
+                self.memory.put(key, value)
+            found.update(from_disk)
+
+        # Повторы внутри батча тоже отправляются только один раз
+        misses = {}
+        for idx, key in enumerate(keys):
+            if key not in found and key not in misses:
+                misses[key] = idx
+        logger.info("Result cache: %d hits, %d misses", len(texts) - len(misses), len(misses))
+
+        if misses:
+            outputs = self.detoxifier.detoxify_batch(
+                [texts[idx] for idx in misses.values()],
+                [languages[idx] for idx in misses.values()],
+            )
+            computed = dict(zip(misses, outputs, strict=True))
+            # Строки без ответа модели (например, после сбоев API) не кэшируем: при следующем
+            # запуске они должны уйти в модель снова
+            untouched = self.detoxifier.last_untouched
+            failed = {key for pos, key in enumerate(misses) if pos in untouched}
+            answered = {key: value for key, value in computed.items() if key not in failed}
+            for key, value in answered.items():
+                self.memory.put(key, value)
+            if self.disk is not None:
+                self.disk.set_many(answered)
+            found.update(computed)
+            self.last_untouched = frozenset(idx for idx, key in enumerate(keys) if key in failed)
+
+        return [found[key] for key in keys]
@@ -0,0 +1,195 @@
+"""Class DedupDetoxifier: sends only unique normalized texts to another detoxifier."""
+
+import json
+import logging
+import re
+from dataclasses import dataclass
+
+from bugulma_enjoyers.detoxifiers.base import BaseDetoxifier
+
+logger = logging.getLogger(__name__)
+
+# Заглушки в ключе дедупликации: символы из области частного использования Unicode, которых
+# нет в обычных текстах (тексты, где они всё же есть, не объединяются с другими)
+MENTION_SENTINEL = "\ue000"
+URL_SENTINEL = "\ue001"
+
+MENTION_PATTERN = re.compile(r"(?<!\w)@\w+")
+URL_PATTERN = re.compile(r"\b(?:https?://|www\.)\S+", re.IGNORECASE)
+REPEATED_PUNCTUATION_PATTERN = re.compile(r"([!?.,;:])\1+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+@dataclass
+class NormalizedText:
+    """The deduplication key of a text, and the mentions and URLs the key abstracts from."""
+
+    text: str
+    mentions: list[str]
+    urls: list[str]
+
+
+def normalize(text: str) -> NormalizedText:
+    """
+    Computes the deduplication key of a text.
+
+    Mentions and URLs are replaced by sentinels, runs of the same punctuation mark are
+    collapsed to one and whitespace is squeezed. The key is only used to group rows; the
+    detoxifier always sees an original text.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        NormalizedText: The key and the replaced mentions and URLs, in order.
+
+    """
+    if MENTION_SENTINEL in text or URL_SENTINEL in text:
+        # Ключ из исходного текста: совпадёт только с точно таким же текстом
+        return NormalizedText(text, [], [])
+    urls = URL_PATTERN.findall(text)
+    text = URL_PATTERN.sub(URL_SENTINEL, text)
+    mentions = MENTION_PATTERN.findall(text)
+    text = MENTION_PATTERN.sub(MENTION_SENTINEL, text)
+    text = REPEATED_PUNCTUATION_PATTERN.sub(r"\1", text)
+    text = WHITESPACE_PATTERN.sub(" ", text).strip()
+    return NormalizedText(text, mentions, urls)
+
+
+def _mark(text: str, originals: list[str], sentinel: str, *, whole_word: bool) -> str:
+    """Replaces the originals in `text` by the sentinel, each after the previous one."""
+    pieces = []
+    start = 0
+    for original in originals:
+        pattern = re.escape(original) + (r"(?!\w)" if whole_word else "")
+        match = re.compile(pattern).search(text, start)
+        if match is None:
+            # Модель убрала упоминание или ссылку: переносить нечего
+            continue
+        pieces.extend([text[start : match.start()], sentinel])
+        start = match.end()
+    pieces.append(text[start:])
+    return "".join(pieces)
+
+
+def _fill(text: str, sentinel: str, replacements: list[str]) -> str:
+    """Replaces the sentinels in `text` by the replacements, in order."""
+    remaining = iter(replacements)
+    return re.sub(re.escape(sentinel), lambda _: next(remaining, ""), text)
+
+
+def transfer(output: str, source: NormalizedText, target: NormalizedText) -> str:
+    """
+    Adapts the result of one row to another row with the same key.
+
+    Args:
+        output (str): Result of detoxifying the original text of `source`.
+        source (NormalizedText): The row that was detoxified.
+        target (NormalizedText): A row with the same key.
+
+    Returns:
+        str: The result with the mentions and URLs of `source` replaced by those of `target`.
+
+    """
+    if source.mentions == target.mentions and source.urls == target.urls:
+        return output
+    output = _mark(output, source.urls, URL_SENTINEL, whole_word=False)
+    output = _mark(output, source.mentions, MENTION_SENTINEL, whole_word=True)
+    output = _fill(output, URL_SENTINEL, target.urls)
+    return _fill(output, MENTION_SENTINEL, target.mentions)
+
+
+class DedupDetoxifier(BaseDetoxifier):
+    """
+    Wraps a detoxifier and sends it one row per normalized (text, language) only.
+
+    Social-media texts often repeat up to mentions, links, whitespace or "!!!". Such rows get
+    the same key (see `normalize`), and only the original text of the first row with every key
+    reaches the wrapped detoxifier. The other rows get its result with their own mentions and
+    URLs put in place of the first row's; whitespace and punctuation runs come from the result.
+    """
+
+    def __init__(self, detoxifier: BaseDetoxifier) -> None:
+        """
+        Initializes the DedupDetoxifier.
+
+        Args:
+            detoxifier (BaseDetoxifier): The detoxifier to deduplicate inputs of.
+
+        """
+        self.detoxifier = detoxifier
+        self.config = getattr(detoxifier, "config", None)
+
+    def release(self) -> None:
+        """Frees the models of the wrapped detoxifier."""
+        self.detoxifier.release()
+
+    def close(self) -> None:
+        """Closes the wrapped detoxifier."""
+        self.detoxifier.close()
+
+    def fingerprint(self) -> str:
+        """The wrapped fingerprint, marked since near-duplicate rows share results."""
+        return json.dumps(
+            {"detoxifier": type(self).__name__, "base": self.detoxifier.fingerprint()},
+            sort_keys=True,
+        )
+
+    def detoxify(self, text: str, language: str) -> str:
+        """
+        Runs detoxification on a single text.
+
+        Args:
+            text (str): Text to detoxify
+            language (str): Language of the text
+
+        Returns:
+            str: detoxified text
+
+        """
+        return self.detoxify_batch([text], [language])[0]
+
+    def detoxify_batch(self, texts: list[str], languages: list[str]) -> list[str]:
+        """
+        Run detoxification on a batch of texts, once per unique normalized text.
+
+        Args:
+            texts (List[str]): List of texts to detoxify
+            languages (List[str]): List of languages of the texts
+
+        Returns:
+            List[str]: List of detoxified texts
+
+        """
+        normalized = [normalize(text) for text in texts]
+        # Для каждого ключа в модель уходит исходный текст первой строки с ним
+        unique: dict[tuple[str, str], int] = {}
+        representatives = []
+        for idx, (row, lang) in enumerate(zip(normalized, languages, strict=True)):
+            if (row.text, lang) not in unique:
+                unique[row.text, lang] = len(representatives)
+                representatives.append(idx)
+        logger.info("Deduplication: %d rows, %d unique", len(texts), len(unique))
+
+        outputs = (
+            self.detoxifier.detoxify_batch(
+                [texts[idx] for idx in representatives],
+                [languages[idx] for idx in representatives],
+            )
+            if unique
+            else []
+        )
+        positions = [
+            unique[row.text, lang] for row, lang in zip(normalized, languages, strict=True)
+        ]
+        untouched = self.detoxifier.last_untouched
+        self.last_untouched = frozenset(
+            idx for idx, position in enumerate(positions) if position in untouched
+        )
+        # Строки без ответа модели остаются как были, а не копией текста представителя
+        return [
+            text
+            if position in untouched
+            else transfer(outputs[position], normalized[representatives[position]], row)
+            for text, position, row in zip(texts, positions, normalized, strict=True)
+        ]
@@ -4,12 +4,12 @@ import logging
 from dataclasses import dataclass
 
 import torch
-from torch.utils.data import DataLoader
 from tqdm.auto import tqdm
 
-from bugulma_enjoyers.datasets.collate import get_collate_fn
 from bugulma_enjoyers.datasets.detoxification_dataset import DetoxificationDataset
+from bugulma_enjoyers.datasets.loader import build_dataloader
 from bugulma_enjoyers.detoxifiers.base import BaseDetoxifier, PipelineConfig
+from bugulma_enjoyers.detoxifiers.worker_pool import ForkWorkerPool
 from bugulma_enjoyers.load_model import load_model
 
 logger = logging.getLogger(__name__)
@@ -40,6 +40,34 @@ class StandaloneDetoxifier(BaseDetoxifier):
         self.model = load_model(model_name=config.detoxifier_model_name, pipeline_config=config)
         self.model.to(self.device)
 
+        self.pool = None
+        weights = getattr(self.model, "model", None)
+        if config.num_workers > 1:
+            if self.device.type != "cpu" or not isinstance(weights, torch.nn.Module):
+                logger.info("Worker processes are only used for local models on CPU")
+            else:
+                # Форкаем сразу после загрузки: процессы разделяют веса с родителем
+                try:
+                    self.pool = ForkWorkerPool(
+                        self._detoxify_shard,
+                        config.num_workers,
+                        config.threads_per_worker,
+                        modules=(weights,),
+                    )
+                except RuntimeError as exc:
+                    logger.warning("%s; detoxifying in this process", exc)
+
+    def release(self) -> None:
+        """Stops the worker processes and frees the weights of the model."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        self.model.release()
+
+    def close(self) -> None:
+        """Releases the provider-side resources of the model."""
+        self.model.close()
+
     def detoxify(self, text: str, language: str) -> str:
         """
         Runs detoxification on a single text.
@@ -59,6 +87,9 @@ class StandaloneDetoxifier(BaseDetoxifier):
         """
         Run detoxification on a collection of texts, batch-by-batch.
 
+        With `config.num_workers > 1`, shards of the texts are detoxified in parallel by the
+        worker processes.
+
         Args:
             texts (List[str]): List of texts to detoxify
             languages (List[str]): List of languages of the texts
@@ -67,24 +98,56 @@ class StandaloneDetoxifier(BaseDetoxifier):
             List[str]: List of detoxified texts
 
         """
+        if self.pool is None:
+            return self._detoxify_serial(texts, languages, progress=True)
+        results = [None] * len(texts)
+        for positions, outputs in tqdm(
+            self.pool.imap(texts, languages, min_size=self.config.batch_size),
+            desc="Detoxifying",
+            unit="shard",
+        ):
+            for idx, output in zip(positions, outputs, strict=True):
+                results[idx] = output
+        return results
+
+    def _detoxify_shard(self, texts: list[str], languages: list[str]) -> list[str]:
+        return self._detoxify_serial(texts, languages, progress=False)
+
+    def _detoxify_serial(
+        self,
+        texts: list[str],
+        languages: list[str],
+        *,
+        progress: bool,
+    ) -> list[str]:
         dataset = DetoxificationDataset(
             texts=texts,
             languages=languages,
             tokenizer=self.model.tokenizer,
             max_length=self.config.max_length,
             use_prompts=True,
+            cache_dir=self.config.cache_path("tokens"),
         )
 
-        dataloader = DataLoader(
+        dataloader = build_dataloader(
             dataset,
-            batch_size=self.config.batch_size,
-            collate_fn=get_collate_fn(task="detoxification"),
-            shuffle=False,
+            self.config.batch_size,
+            task="detoxification",
+            model=self.model,
         )
 
+        results = [None] * len(texts)
+        untouched = set()
         with torch.inference_mode():
-            return [
-                output
-                for batch in tqdm(dataloader, desc="Detoxifying", unit="batch")
-                for output in self.model.forward(batch)
-            ]
+            for batch, outputs in tqdm(
+                self.model.forward_batches(dataloader),
+                total=len(dataloader),
+                desc="Detoxifying",
+                unit="batch",
+                disable=not progress,
+            ):
+                for idx, output in zip(batch["indices"], outputs, strict=True):
+                    results[idx] = output
+                untouched.update(batch["indices"][pos] for pos in batch.get("untouched", ()))
+        self.last_untouched = frozenset(untouched)
+        return results
@@ -0,0 +1,142 @@
+"""Class TranslationMemory: remembers translations of the backtranslation legs is defined here."""
+
+import hashlib
+import json
+import logging
+from collections.abc import Callable
+from dataclasses import asdict
+from pathlib import Path
+
+from bugulma_enjoyers.cache import LRUCache, SQLiteCache
+from bugulma_enjoyers.detoxifiers.base import PipelineConfig
+from bugulma_enjoyers.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Поля конфига, от которых зависит перевод (но не модель детоксификации)
+TRANSLATION_CONFIG_FIELDS = (
+    "translator_model_name",
+    "max_length",
+    "num_beams",
+    "temperature",
+    "top_p",
+    "do_sample",
+    "quantization",
+)
+
+
+def translation_namespace(config: PipelineConfig) -> str:
+    """
+    Fingerprints everything the translations of the config depend on.
+
+    The detoxifier model and its settings are left out, so a rerun with another detoxifier
+    reuses the translations of both legs.
+
+    Args:
+        config (PipelineConfig): The config of the translator.
+
+    Returns:
+        str: A hex digest.
+
+    """
+    fields = {name: getattr(config, name) for name in TRANSLATION_CONFIG_FIELDS}
+    policy = (config.generation_policies or {}).get("translation")
+    fields["generation_policy"] = None if policy is None else asdict(policy)
+    payload = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranslationMemory:
+    """
+    Translations keyed by (translator and its settings, source language, target language, text).
+
+    Translations are looked up in an in-memory LRU first and in an SQLite database second; only
+    misses are translated, each distinct text once, and only they are written back.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        db_path: str | Path | None = None,
+        max_memory_entries: int = 100_000,
+    ) -> None:
+        """
+        Initializes the TranslationMemory.
+
+        Args:
+            namespace (str): Fingerprint of the translator, e.g. from `translation_namespace`.
+            db_path (str | Path | None, optional): SQLite database to persist translations in.
+                Defaults to None, which keeps them in memory only.
+            max_memory_entries (int, optional): Size of the in-memory LRU. Defaults to 100_000.
+
+        """
+        self.namespace = namespace
+        self.memory = LRUCache(max_memory_entries)
+        self.disk = None if db_path is None else SQLiteCache(db_path, table="translations")
+
+    def _key(self, text: str, src_lang: str, tgt_lang: str) -> str:
+        payload = f"{self.namespace}\0{src_lang}\0{tgt_lang}\0{text}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def translate(
+        self,
+        texts: list[str],
+        src_lang: str,
+        tgt_lang: str,
+        translate: Callable[[list[str]], list[str]],
+    ) -> list[str]:
+        """
+        Translates the texts, reusing remembered translations.
+
+        Args:
+            texts (list[str]): Texts in the source language.
+            src_lang (str): The source language.
+            tgt_lang (str): The target language.
+            translate (Callable[[list[str]], list[str]]): Translates the misses.
+
+        Returns:
+            list[str]: The translations, in input order.
+
+        """
+        keys = [self._key(text, src_lang, tgt_lang) for text in texts]
+        found = {}
+        for key in keys:
+            value = self.memory.get(key)
+            if value is not None:
+                found[key] = value
+        if self.disk is not None:
+            from_disk = self.disk.get_many({key for key in keys if key not in found})
+            for key, value in from_disk.items():
+                self.memory.put(key, value)
+            found.update(from_disk)
+
+        misses = {}
+        for idx, key in enumerate(keys):
+            if key not in found and key not in misses:
+                misses[key] = idx
+        logger.info(
+            "Translation memory %s->%s: %d hits, %d misses",
+            src_lang,
+            tgt_lang,
+            len(texts) - len(misses),
+            len(misses),
+        )
+        labels = {"src_lang": src_lang, "tgt_lang": tgt_lang}
+        metrics.increment("translation_memory_hits_total", len(texts) - len(misses), **labels)
+        metrics.increment("translation_memory_misses_total", len(misses), **labels)
+
+        if misses:
+            outputs = translate([texts[idx] for idx in misses.values()])
+            computed = dict(zip(misses, outputs, strict=True))
+            for key, value in computed.items():
+                self.memory.put(key, value)
+            if self.disk is not None:
+                self.disk.set_many(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def close(self) -> None:
+        """Closes the database, if any."""
+        if self.disk is not None:
+            self.disk.close()
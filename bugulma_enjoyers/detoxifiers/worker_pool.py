@@ -0,0 +1,225 @@
+"""Data-parallel inference over forked worker processes that share the parent's weights."""
+
+import contextlib
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+from collections.abc import Callable, Iterator
+
+import torch
+
+from bugulma_enjoyers.metrics import BufferSink, metrics
+
+logger = logging.getLogger(__name__)
+
+FORK_UNAVAILABLE_ERROR = "Worker pools need the 'fork' start method, which this platform lacks"
+
+# Шардов на процесс: мелкие шарды выравнивают нагрузку, крупные экономят на пересылке
+SHARDS_PER_WORKER = 4
+
+Shard = Callable[[list[str], list[str]], list[str]]
+
+# Метрики рабочего процесса, которые возвращаются родителю вместе с результатами шарда
+_worker_metrics = BufferSink()
+
+
+def default_threads_per_worker(num_workers: int, num_pools: int = 1) -> int:
+    """
+    Splits the CPUs evenly between the workers of all pools that run at the same time.
+
+    Args:
+        num_workers (int): Number of processes of every pool.
+        num_pools (int, optional): Number of pools running concurrently. Defaults to 1.
+
+    Returns:
+        int: Torch intra-op threads of every process, at least 1.
+
+    """
+    return max(1, (os.cpu_count() or 1) // (num_workers * num_pools))
+
+
+def _init_worker(threads: int) -> None:
+    torch.set_num_threads(threads)
+    # Может быть уже задано (или параллельная работа уже началась) в родителе до fork
+    with contextlib.suppress(RuntimeError):
+        torch.set_num_interop_threads(1)
+    # Синки (файлы метрик) принадлежат родителю: значения копятся и уходят ему с результатами
+    metrics.sinks = [_worker_metrics]
+
+
+def _worker_loop(
+    target: Shard,
+    threads: int,
+    tasks: multiprocessing.SimpleQueue,
+    results: multiprocessing.SimpleQueue,
+) -> None:
+    _init_worker(threads)
+    # None — сигнал остановки
+    while (task := tasks.get()) is not None:
+        index, (texts, languages) = task
+        _worker_metrics.drain()
+        try:
+            outputs = target(texts, languages)
+        except Exception as exc:
+            try:
+                results.put((index, None, exc))
+            except Exception:
+                # Исключение, которое не сериализуется, передаём описанием
+                results.put((index, None, RuntimeError(repr(exc))))
+        else:
+            results.put((index, (outputs, _worker_metrics.drain()), None))
+
+
+class ForkWorkerPool:
+    """
+    Runs a function over shards of the inputs in `num_workers` forked processes.
+
+    The processes are forked when the pool is created, so they see the parent's memory as it
+    is at that moment: model weights loaded before are shared copy-on-write (torch modules are
+    moved to shared memory first, so they stay shared even if pages are touched). Inputs are
+    sorted by length before sharding, so every shard pads little, and the results are put
+    back in input order. Metrics the workers record are replayed into the parent's recorder.
+
+    Forking a process that runs other threads may copy locks they hold into the child, so the
+    pool starts no threads of its own: shards and results go through pipes the calling thread
+    reads and writes. Pools should still be created before the pipeline starts its threads;
+    `imap` of a single pool must not be called from several threads at once.
+    """
+
+    def __init__(
+        self,
+        target: Shard,
+        num_workers: int,
+        threads_per_worker: int | None = None,
+        modules: tuple[torch.nn.Module, ...] = (),
+    ) -> None:
+        """
+        Initializes the ForkWorkerPool, forking the workers.
+
+        Args:
+            target (Shard): Processes a shard: (texts, languages) -> outputs.
+            num_workers (int): Number of processes.
+            threads_per_worker (int | None, optional): Torch intra-op threads of every process.
+                Defaults to None, which splits the CPUs evenly between the workers of this pool;
+                pools that run concurrently should pass `default_threads_per_worker` instead.
+            modules (tuple[torch.nn.Module, ...], optional): Weights to move to shared memory
+                before forking. Defaults to ().
+
+        Raises:
+            RuntimeError: If the platform cannot fork.
+
+        """
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError(FORK_UNAVAILABLE_ERROR)
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(num_workers)
+        for module in modules:
+            module.share_memory()
+        logger.info(
+            "Forking %d workers with %d threads each",
+            num_workers,
+            self.threads_per_worker,
+        )
+        context = multiprocessing.get_context("fork")
+        # SimpleQueue пишет в канал из вызывающего потока, без фонового потока-подкачки
+        self._tasks = context.SimpleQueue()
+        self._results = context.SimpleQueue()
+        self._processes = [
+            context.Process(
+                target=_worker_loop,
+                args=(target, self.threads_per_worker, self._tasks, self._results),
+                daemon=True,
+            )
+            for _ in range(num_workers)
+        ]
+        for process in self._processes:
+            process.start()
+
+    def shards(
+        self,
+        texts: list[str],
+        languages: list[str],
+        min_size: int = 1,
+    ) -> tuple[list[int], list[tuple[list[str], list[str]]]]:
+        """
+        Splits the inputs into shards of similar lengths.
+
+        Args:
+            texts (list[str]): The inputs.
+            languages (list[str]): Their languages.
+            min_size (int, optional): Minimal shard size, e.g. the batch size. Defaults to 1.
+
+        Returns:
+            tuple[list[int], list[tuple[list[str], list[str]]]]: Input positions in shard order
+                and the (texts, languages) shards.
+
+        """
+        order = sorted(range(len(texts)), key=lambda idx: len(texts[idx]))
+        size = max(min_size, math.ceil(len(texts) / (self.num_workers * SHARDS_PER_WORKER)))
+        shards = []
+        for start in range(0, len(order), size):
+            positions = order[start : start + size]
+            shard_languages = [languages[idx] for idx in positions]
+            shards.append(([texts[idx] for idx in positions], shard_languages))
+        return order, shards
+
+    def imap(
+        self,
+        texts: list[str],
+        languages: list[str],
+        min_size: int = 1,
+    ) -> Iterator[tuple[list[int], list[str]]]:
+        """
+        Processes the shards in parallel.
+
+        Args:
+            texts (list[str]): The inputs.
+            languages (list[str]): Their languages.
+            min_size (int, optional): Minimal shard size. Defaults to 1.
+
+        Yields:
+            tuple[list[int], list[str]]: Input positions of every shard and its outputs, as
+                shards finish (in shard order).
+
+        """
+        order, shards = self.shards(texts, languages, min_size)
+        pending = enumerate(shards)
+        # Не больше задач в работе, чем процессов: свободный процесс всегда читает канал задач,
+        # так что запись в него не блокируется, пока процессы ждут чтения своих результатов
+        in_flight = 0
+        for task in itertools.islice(pending, self.num_workers):
+            self._tasks.put(task)
+            in_flight += 1
+        done = {}
+        start = 0
+        try:
+            for index, (shard_texts, _) in enumerate(shards):
+                while index not in done:
+                    finished, result, error = self._results.get()
+                    in_flight -= 1
+                    if error is not None:
+                        raise error
+                    done[finished] = result
+                    task = next(pending, None)
+                    if task is not None:
+                        self._tasks.put(task)
+                        in_flight += 1
+                outputs, events = done.pop(index)
+                metrics.replay(events)
+                yield order[start : start + len(shard_texts)], outputs
+                start += len(shard_texts)
+        finally:
+            # Результаты брошенных шардов не должны достаться следующему вызову
+            for _ in range(in_flight):
+                self._results.get()
+
+    def close(self) -> None:
+        """Stops the workers."""
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+        self._tasks.close()
+        self._results.close()
@@ -0,0 +1,187 @@
+"""Offline evaluation of detoxification outputs: STA, SIM, FL and the joint score J."""
+
+import base64
+import hashlib
+import logging
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+from bugulma_enjoyers.cache import SQLiteCache
+from bugulma_enjoyers.scorers import FluencyScorer, SimilarityScorer, ToxicityScorer
+
+logger = logging.getLogger(__name__)
+
+
+def _key(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def _encode_embedding(embedding: torch.Tensor) -> str:
+    return base64.b64encode(embedding.numpy().astype(np.float32).tobytes()).decode("ascii")
+
+
+def _decode_embedding(value: str) -> torch.Tensor:
+    return torch.from_numpy(np.frombuffer(base64.b64decode(value), dtype=np.float32).copy())
+
+
+class Evaluator:
+    """
+    Scores (source, output) pairs the way the shared task does.
+
+    - STA: probability of the output being non-toxic;
+    - SIM: LaBSE cosine similarity of the output to the source;
+    - FL: xCOMET fluency of the output, if a fluency scorer is given;
+    - J: the product of the above, per row.
+
+    Every text (pair, for FL) is scored once per run. With `cache_path`, scores and embeddings
+    are also kept on disk per model and text, so evaluating another config only encodes the
+    outputs that changed: the sources and unchanged outputs come from the cache.
+    """
+
+    def __init__(
+        self,
+        toxicity: ToxicityScorer,
+        similarity: SimilarityScorer,
+        fluency: FluencyScorer | None = None,
+        cache_path: str | Path | None = None,
+    ) -> None:
+        """
+        Initializes the Evaluator.
+
+        Args:
+            toxicity (ToxicityScorer): The toxicity classifier.
+            similarity (SimilarityScorer): The sentence encoder.
+            fluency (FluencyScorer | None, optional): The fluency model. Defaults to None, which
+                leaves FL out of the scores and of J.
+            cache_path (str | Path | None, optional): SQLite database of cached scores.
+                Defaults to None (no on-disk cache).
+
+        """
+        self.toxicity = toxicity
+        self.similarity = similarity
+        self.fluency = fluency
+        self.scores, self.embeddings = None, None
+        if cache_path is not None:
+            self.scores = SQLiteCache(cache_path, table="scores")
+            self.embeddings = SQLiteCache(cache_path, table="embeddings")
+
+    @staticmethod
+    def _cached(
+        cache: SQLiteCache | None,
+        name: str | None,
+        items: list[tuple[str, ...]],
+        compute: Callable[[list[tuple[str, ...]]], list[str]],
+    ) -> dict[tuple[str, ...], str]:
+        """Looks up unique items in the cache and computes the missing ones in a single call."""
+        unique = list(dict.fromkeys(items))
+        if cache is None or name is None:
+            return dict(zip(unique, compute(unique), strict=True)) if unique else {}
+        keys = {item: _key(name, *item) for item in unique}
+        found = cache.get_many(keys.values())
+        missing = [item for item in unique if keys[item] not in found]
+        logger.info("%s: %d cached, %d to compute", name, len(unique) - len(missing), len(missing))
+        if missing:
+            computed = dict(zip((keys[item] for item in missing), compute(missing), strict=True))
+            cache.set_many(computed)
+            found.update(computed)
+        return {item: found[keys[item]] for item in unique}
+
+    def _toxicity(self, texts: list[str]) -> list[float]:
+        scores = self._cached(
+            self.scores,
+            self.toxicity.name and f"toxicity:{self.toxicity.name}",
+            [(text,) for text in texts],
+            lambda items: [repr(score) for score in self.toxicity.score([t for (t,) in items])],
+        )
+        return [float(scores[text,]) for text in texts]
+
+    def _similarity(self, sources: list[str], outputs: list[str]) -> list[float]:
+        embeddings = self._cached(
+            self.embeddings,
+            self.similarity.name and f"embedding:{self.similarity.name}",
+            [(text,) for text in [*sources, *outputs]],
+            lambda items: [
+                _encode_embedding(row) for row in self.similarity.embed([t for (t,) in items])
+            ],
+        )
+        left = torch.stack([_decode_embedding(embeddings[text,]) for text in sources])
+        right = torch.stack([_decode_embedding(embeddings[text,]) for text in outputs])
+        return (left * right).sum(dim=-1).tolist()
+
+    def _fluency(self, sources: list[str], outputs: list[str]) -> list[float]:
+        scores = self._cached(
+            self.scores,
+            self.fluency.name and f"fluency:{self.fluency.name}",
+            list(zip(sources, outputs, strict=True)),
+            lambda items: [
+                repr(score)
+                for score in self.fluency.score([s for s, _ in items], [o for _, o in items])
+            ],
+        )
+        return [float(scores[pair]) for pair in zip(sources, outputs, strict=True)]
+
+    def score(self, sources: list[str], outputs: list[str]) -> pd.DataFrame:
+        """
+        Scores every row.
+
+        Args:
+            sources (list[str]): The original texts.
+            outputs (list[str]): The detoxified texts.
+
+        Returns:
+            pd.DataFrame: STA, SIM, (FL) and J of every row.
+
+        """
+        if len(sources) != len(outputs):
+            msg = "sources and outputs must have the same size"
+            raise ValueError(msg)
+        similarity = self._similarity(sources, outputs) if outputs else []
+        scores = pd.DataFrame(
+            {
+                "STA": 1 - np.asarray(self._toxicity(outputs), dtype=float),
+                "SIM": np.asarray(similarity, dtype=float),
+            },
+        )
+        if self.fluency is not None:
+            scores["FL"] = self._fluency(sources, outputs)
+        # Отрицательная косинусная близость не должна делать J положительным
+        scores["J"] = scores.clip(lower=0).prod(axis=1)
+        return scores
+
+    def evaluate(self, sources: list[str], outputs: list[str]) -> dict[str, float]:
+        """
+        Scores the rows and averages the scores.
+
+        Args:
+            sources (list[str]): The original texts.
+            outputs (list[str]): The detoxified texts.
+
+        Returns:
+            dict[str, float]: Mean STA, SIM, (FL) and J, and the number of rows.
+
+        """
+        return self.summarize(self.score(sources, outputs))
+
+    @staticmethod
+    def summarize(scores: pd.DataFrame) -> dict[str, float]:
+        """
+        Averages per-row scores.
+
+        Args:
+            scores (pd.DataFrame): Scores returned by `score`.
+
+        Returns:
+            dict[str, float]: Mean of every score, and the number of rows.
+
+        """
+        return {**{column: float(scores[column].mean()) for column in scores}, "rows": len(scores)}
+
+    def close(self) -> None:
+        """Closes the on-disk caches."""
+        for cache in (self.scores, self.embeddings):
+            if cache is not None:
+                cache.close()
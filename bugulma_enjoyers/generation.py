@@ -0,0 +1,64 @@
+"""Generation length budgets derived from the source lengths."""
+
+import math
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class GenerationPolicy:
+    """
+    How many new tokens may be generated, given the lengths of the sources.
+
+    The budget is `ratio` times the longest source plus `slack`, at least `min_new_tokens` and
+    rounded up to a multiple of `round_to`, so sources of similar lengths share the budget (and
+    the compiled graphs of static-cache backends). The caller caps it with `max_length`. Local
+    models apply it to every row on its own, so a row's output does not depend on its batch.
+
+    Attributes:
+        ratio (float): Output tokens allowed per source token.
+        slack (int): Extra tokens on top, for very short sources.
+        min_new_tokens (int): Lower bound of the budget.
+        round_to (int): The budget is rounded up to a multiple of this.
+
+    """
+
+    ratio: float = 1.5
+    slack: int = 8
+    min_new_tokens: int = 16
+    round_to: int = 8
+
+    def max_new_tokens(self, source_lengths: Sequence[int], cap: int) -> int:
+        """
+        Computes the budget of the sources, e.g. of a single row.
+
+        Args:
+            source_lengths (Sequence[int]): Token counts of the sources (prompts included).
+            cap (int): Upper bound, e.g. the configured max_length.
+
+        Returns:
+            int: The number of new tokens that may be generated.
+
+        """
+        longest = max(source_lengths, default=0)
+        budget = max(self.min_new_tokens, math.ceil(longest * self.ratio) + self.slack)
+        budget = math.ceil(budget / self.round_to) * self.round_to
+        return min(cap, budget)
+
+
+def default_generation_policies() -> dict[str, GenerationPolicy]:
+    """
+    Returns the default policies by task.
+
+    Detoxification rewrites the text in the same language, so outputs are about as long as the
+    inputs. Translation may change the tokenization density between languages, so it gets
+    more room.
+
+    Returns:
+        dict[str, GenerationPolicy]: The policies, keyed by the task of the batches.
+
+    """
+    return {
+        "detoxification": GenerationPolicy(ratio=1.25, slack=8),
+        "translation": GenerationPolicy(ratio=2.0, slack=8),
+    }
@@ -1,6 +1,7 @@
 """Input-output module for Bugulma Enjoyers project."""
 
-from bugulma_enjoyers.io.input_ import read_input
-from bugulma_enjoyers.io.output import write_output
+from bugulma_enjoyers.io.input_ import iter_input, read_input
+from bugulma_enjoyers.io.journal import RunJournal
+from bugulma_enjoyers.io.output import OutputWriter, write_output
 
-__all__ = ["read_input", "write_output"]
+__all__ = ["OutputWriter", "RunJournal", "iter_input", "read_input", "write_output"]
@@ -1,8 +1,10 @@
+from collections.abc import Iterator
 from pathlib import Path
 
 import pandas as pd
 
 REQUIRED_COL = "tat_toxic"
+ID_COL = "ID"
 
 COL_NOT_FOUND = "Column '{column}' not found in the input file."
 
@@ -16,3 +18,38 @@ def read_input(path: str | Path, column: str = REQUIRED_COL) -> str:
     if column not in df.columns:
         raise ValueError(COL_NOT_FOUND.format(column=column))
     return df[column].to_list()
+
+
+def iter_input(
+    path: str | Path,
+    column: str = REQUIRED_COL,
+    chunk_size: int = 1000,
+) -> Iterator[tuple[list, list[str]]]:
+    """
+    Reads the input file chunk by chunk, so that memory does not grow with the file size.
+
+    Args:
+        path (str | Path): Path to the TSV file.
+        column (str, optional): The column with the texts. Defaults to "tat_toxic".
+        chunk_size (int, optional): Number of rows per chunk. Defaults to 1000.
+
+    Yields:
+        tuple[list, list[str]]: Row IDs (the "ID" column, or row numbers if there is none) and
+            texts of every chunk.
+
+    """
+    path = str(Path(path).resolve().absolute())
+    header = pd.read_csv(path, sep="\t", nrows=0).columns
+    if column not in header:
+        raise ValueError(COL_NOT_FOUND.format(column=column))
+    usecols = [ID_COL, column] if ID_COL in header else [column]
+
+    offset = 0
+    for chunk in pd.read_csv(path, sep="\t", usecols=usecols, chunksize=chunk_size):
+        ids = (
+            chunk[ID_COL].to_list()
+            if ID_COL in chunk.columns
+            else list(range(offset, offset + len(chunk)))
+        )
+        offset += len(chunk)
+        yield ids, chunk[column].to_list()
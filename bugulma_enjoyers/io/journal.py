@@ -0,0 +1,153 @@
+"""Checkpoint journal that lets interrupted runs resume where they stopped."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from types import TracebackType
+from typing import Self
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+
+
+def _row_key(stage: str, row_id: str, input_digest: str) -> bytes:
+    # Компактный ключ в памяти: сами результаты остаются в файле журнала
+    return hashlib.sha256(f"{stage}\0{row_id}\0{input_digest}".encode()).digest()[:12]
+
+
+class RunJournal:
+    """
+    Append-only JSON-lines record of the rows every stage has finished.
+
+    Each line stores the stage, row ID, a hash of the stage input and of the stage's fingerprint,
+    and the result. On resume, a result is reused only if all of them still match, so editing
+    the input file or changing a model simply recomputes the affected rows. Lines are synced to
+    disk as they are written; a line torn by a crash is ignored. The journal can be shared by
+    stages running in different threads.
+
+    Only a short hash of (stage, row ID, input) and the file offset of its line are kept in
+    memory; results are read back from the file on lookup, so memory stays small on large
+    inputs.
+    """
+
+    def __init__(self, path: str | Path, fingerprints: dict[str, str], *, resume: bool) -> None:
+        """
+        Initializes the RunJournal.
+
+        Args:
+            path (str | Path): Path to the journal file.
+            fingerprints (dict[str, str]): Fingerprint of every stage, by stage name.
+            resume (bool): Load the existing journal instead of starting a new one.
+
+        """
+        self.path = Path(path)
+        self.fingerprints = {stage: _digest(fp) for stage, fp in fingerprints.items()}
+        self._offsets: dict[bytes, int] = {}
+        self._lock = threading.Lock()
+        if resume and self.path.exists():
+            self._load()
+            logger.info("Resuming: %d finished row-stages in %s", len(self._offsets), self.path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("ab" if resume else "wb")
+        if resume and self._ends_with_torn_line():
+            self._file.write(b"\n")
+        self._file.flush()
+        self._size = self._file.tell()
+        self._reader = self.path.open("rb")
+
+    def _ends_with_torn_line(self) -> bool:
+        """Whether the last line of the file was not finished, e.g. because of a crash."""
+        if self.path.stat().st_size == 0:
+            return False
+        with self.path.open("rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) != b"\n"
+
+    def _load(self) -> None:
+        offset = 0
+        with self.path.open("rb") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    logger.warning("Skipping a torn journal line")
+                else:
+                    if record["fingerprint"] == self.fingerprints.get(record["stage"]):
+                        key = _row_key(record["stage"], str(record["id"]), record["input"])
+                        self._offsets[key] = offset
+                offset += len(line)
+
+    def _read_result(self, offset: int) -> str:
+        self._reader.seek(offset)
+        return json.loads(self._reader.readline())["result"]
+
+    def lookup(self, stage: str, ids: list, inputs: list[str]) -> list[str | None]:
+        """
+        Returns journaled results of the rows, None for the rows still to be processed.
+
+        Args:
+            stage (str): The stage name.
+            ids (list): Row IDs.
+            inputs (list[str]): Inputs of the stage for these rows.
+
+        Returns:
+            list[str | None]: The results.
+
+        """
+        results = []
+        with self._lock:
+            for row_id, text in zip(ids, inputs, strict=True):
+                offset = self._offsets.get(_row_key(stage, str(row_id), _digest(str(text))))
+                results.append(None if offset is None else self._read_result(offset))
+        return results
+
+    def record(self, stage: str, ids: list, inputs: list[str], results: list[str]) -> None:
+        """
+        Durably records finished rows.
+
+        Args:
+            stage (str): The stage name.
+            ids (list): Row IDs.
+            inputs (list[str]): Inputs of the stage for these rows.
+            results (list[str]): Results of the stage for these rows.
+
+        """
+        with self._lock:
+            for row_id, text, result in zip(ids, inputs, results, strict=True):
+                record = {
+                    "stage": stage,
+                    "id": str(row_id),
+                    "input": _digest(str(text)),
+                    "fingerprint": self.fingerprints[stage],
+                    "result": result,
+                }
+                line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                self._offsets[_row_key(stage, record["id"], record["input"])] = self._size
+                self._file.write(line)
+                self._size += len(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """Closes the journal file."""
+        self._file.close()
+        self._reader.close()
+
+    def __enter__(self) -> Self:
+        """Returns the journal itself."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Closes the journal file."""
+        self.close()
@@ -1,4 +1,7 @@
+import os
 from pathlib import Path
+from types import TracebackType
+from typing import Self
 
 import pandas as pd
 
@@ -8,3 +11,59 @@ def write_output(results: list[str], inputs: list[str], path: str | Path) -> Non
     df = pd.DataFrame({"tat_toxic": inputs, "tat_detox1": results})
 
     df.to_csv(str(path.absolute().resolve()), sep="\t", index_label="ID", encoding="utf-8")
+
+
+class OutputWriter:
+    """
+    Appends results to the output TSV as soon as they are ready.
+
+    The file has the same layout as the one written by `write_output`. Every chunk is flushed
+    and synced to disk, so a crash loses at most the chunk in progress.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        """
+        Initializes the OutputWriter, truncating the file and writing the header.
+
+        Args:
+            path (str | Path): Path to the output file.
+
+        """
+        self.path = Path(path).absolute().resolve()
+        self._file = self.path.open("w", encoding="utf-8", newline="")
+        self._write(pd.DataFrame(columns=["ID", "tat_toxic", "tat_detox1"]), header=True)
+
+    def _write(self, df: pd.DataFrame, *, header: bool) -> None:
+        df.to_csv(self._file, sep="\t", index=False, header=header)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def write(self, ids: list, inputs: list[str], results: list[str]) -> None:
+        """
+        Appends a chunk of results.
+
+        Args:
+            ids (list): IDs of the rows.
+            inputs (list[str]): The input texts.
+            results (list[str]): The detoxified texts.
+
+        """
+        df = pd.DataFrame({"ID": ids, "tat_toxic": inputs, "tat_detox1": results})
+        self._write(df, header=False)
+
+    def close(self) -> None:
+        """Closes the file."""
+        self._file.close()
+
+    def __enter__(self) -> Self:
+        """Returns the writer itself."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Closes the file."""
+        self.close()
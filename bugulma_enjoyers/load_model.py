@@ -1,4 +1,4 @@
-from bugulma_enjoyers.models import MODEL_TYPES
+from bugulma_enjoyers.models import get_model_type
 
 
 def load_model(model_name, pipeline_config, **kwargs):
@@ -6,4 +6,5 @@ def load_model(model_name, pipeline_config, **kwargs):
     model_type = splits[0]
     model_name = "/".join(splits[1:])
 
-    return MODEL_TYPES[model_type](model_name=model_name, pipeline_config=pipeline_config, **kwargs)
+    model_class = get_model_type(model_type)
+    return model_class(model_name=model_name, pipeline_config=pipeline_config, **kwargs)
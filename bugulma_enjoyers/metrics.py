@@ -0,0 +1,349 @@
+"""Runtime metrics of models and detoxifiers, and the sinks they are exported to."""
+
+import contextvars
+import json
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+METRIC_PREFIX = "bugulma_"
+
+# Описания метрик для Prometheus; счётчики оканчиваются на _total, длительности на _seconds
+METRIC_HELP = {
+    "model_batches_total": "Batches processed by a model.",
+    "model_rows_total": "Rows processed by a model.",
+    "model_input_tokens_total": "Input tokens of a model (estimated for API models).",
+    "model_output_tokens_total": "Output tokens of a model (estimated for API models).",
+    "model_forward_seconds": "Time a model spent per batch (generation or API requests).",
+    "model_cache_hits_total": "Models served from the process-wide model cache.",
+    "model_cache_misses_total": "Models loaded because the model cache did not have them.",
+    "generation_rows_total": "Rows generated by a local model, by task.",
+    "generation_cap_hits_total": "Rows whose generation was cut off by the length budget.",
+    "translation_memory_hits_total": "Translations served from the translation memory.",
+    "translation_memory_misses_total": "Texts the translation memory sent to the translator.",
+    "tokenization_seconds": "Time spent tokenizing inputs.",
+    "api_request_seconds": "Latency of a single API request, retries included.",
+    "api_retries_total": "Retried API requests.",
+    "api_throttles_total": "API requests rejected by the provider's rate limits.",
+    "api_fallback_rows_total": "Rows an API model returned unchanged after repeated failures.",
+    "detoxifier_calls_total": "detoxify_batch calls of a detoxifier.",
+    "detoxifier_rows_total": "Rows passed to a detoxifier.",
+    "detoxifier_unchanged_rows_total": "Rows a detoxifier returned unchanged.",
+    "detoxifier_seconds": "Time a detoxifier spent per detoxify_batch call.",
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class MetricsSink:
+    """Receives every recorded value; subclasses export them somewhere."""
+
+    def emit(self, event: dict) -> None:
+        """
+        Receives a single recorded value.
+
+        Args:
+            event (dict): The metric name, its labels, the value and a timestamp.
+
+        """
+
+    def close(self, recorder: "MetricsRecorder") -> None:
+        """
+        Exports the final state at the end of the run.
+
+        Args:
+            recorder (MetricsRecorder): The recorder, for its aggregated values.
+
+        """
+
+
+class MetricsRecorder:
+    """
+    Thread-safe aggregation of counters and durations, fanned out to pluggable sinks.
+
+    Counters are summed, durations are kept as count, sum and maximum per metric and labels.
+    Recording is cheap enough to stay enabled without sinks. Labels set with `scope` are added
+    to everything recorded within the block, e.g. the pipeline stage.
+    """
+
+    def __init__(self) -> None:
+        """Initializes the MetricsRecorder."""
+        self.counters: dict[tuple[str, Labels], float] = defaultdict(float)
+        self.durations: dict[tuple[str, Labels], list[float]] = {}
+        self.sinks: list[MetricsSink] = []
+        self._lock = threading.Lock()
+        self._scope: contextvars.ContextVar[dict[str, object] | None] = contextvars.ContextVar(
+            "metrics_scope",
+            default=None,
+        )
+
+    def add_sink(self, sink: MetricsSink) -> None:
+        """Starts sending values to the sink."""
+        with self._lock:
+            self.sinks.append(sink)
+
+    @contextmanager
+    def scope(self, **labels: object) -> Iterator[None]:
+        """
+        Adds the labels to all values recorded within the block.
+
+        The labels live in a context variable: threads started within the block see them only
+        if they run in a copy of the context (`contextvars.copy_context().run`).
+        """
+        token = self._scope.set({**(self._scope.get() or {}), **labels})
+        try:
+            yield
+        finally:
+            self._scope.reset(token)
+
+    def _emit(self, name: str, labels: dict[str, object], value: float) -> None:
+        if self.sinks:
+            event = {"ts": time.time(), "metric": name, "labels": labels, "value": value}
+            for sink in self.sinks:
+                sink.emit(event)
+
+    def increment(self, name: str, value: float = 1, **labels: object) -> None:
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): The counter, e.g. "model_rows_total".
+            value (float, optional): The increment. Defaults to 1.
+            **labels (object): Labels of the counter, e.g. component="HFModel".
+
+        """
+        if not value:
+            return
+        labels = {**(self._scope.get() or {}), **labels}
+        with self._lock:
+            self.counters[name, _labels(labels)] += value
+            self._emit(name, labels, value)
+
+    def observe(self, name: str, seconds: float, **labels: object) -> None:
+        """
+        Records a duration.
+
+        Args:
+            name (str): The duration, e.g. "model_forward_seconds".
+            seconds (float): The value.
+            **labels (object): Labels of the duration.
+
+        """
+        labels = {**(self._scope.get() or {}), **labels}
+        with self._lock:
+            stats = self.durations.setdefault((name, _labels(labels)), [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            self._emit(name, labels, seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels: object) -> Iterator[None]:
+        """Records how long the block took, also if it raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def summary(self) -> str:
+        """
+        Formats the aggregated values as a human-readable table.
+
+        Returns:
+            str: The table, one metric and labels per line.
+
+        """
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{_format_labels(labels)}: {value:g}")
+            for (name, labels), (count, total, peak) in sorted(self.durations.items()):
+                mean = total / count if count else 0.0
+                lines.append(
+                    f"{name}{_format_labels(labels)}: {count} x {mean:.3f}s "
+                    f"(total {total:.2f}s, max {peak:.3f}s)",
+                )
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """
+        Formats the aggregated values in the Prometheus text exposition format.
+
+        Durations are exported as summaries without quantiles (`_count` and `_sum`).
+
+        Returns:
+            str: The exposition.
+
+        """
+        families: dict[str, list[str]] = defaultdict(list)
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                families[name].append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {value:g}")
+            for (name, labels), (count, total, _) in self.durations.items():
+                metric = f"{METRIC_PREFIX}{name}"
+                families[name].append(f"{metric}_count{_format_labels(labels)} {count}")
+                families[name].append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+        lines = []
+        for name in sorted(families):
+            kind = "counter" if name.endswith("_total") else "summary"
+            lines.append(f"# HELP {METRIC_PREFIX}{name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+            lines.extend(sorted(families[name]))
+        return "\n".join(lines) + "\n"
+
+    def replay(self, events: list[dict]) -> None:
+        """
+        Records values captured elsewhere, e.g. by a `BufferSink` in a worker process.
+
+        Names ending with `_total` are counters, the others durations. The labels of the
+        current scope are added, as if the values were recorded here.
+
+        Args:
+            events (list[dict]): The events, as passed to `MetricsSink.emit`.
+
+        """
+        for event in events:
+            if event["metric"].endswith("_total"):
+                self.increment(event["metric"], event["value"], **event["labels"])
+            else:
+                self.observe(event["metric"], event["value"], **event["labels"])
+
+    def reset(self) -> None:
+        """Forgets all values."""
+        with self._lock:
+            self.counters.clear()
+            self.durations.clear()
+
+    def close(self) -> None:
+        """Lets the sinks export the final state and detaches them."""
+        with self._lock:
+            sinks, self.sinks = self.sinks, []
+        for sink in sinks:
+            sink.close(self)
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    # Экранирование по правилам текстового формата Prometheus
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class BufferSink(MetricsSink):
+    """Keeps the recorded values in memory until they are drained, e.g. to send them elsewhere."""
+
+    def __init__(self) -> None:
+        """Initializes the BufferSink."""
+        self._events: list[dict] = []
+
+    def emit(self, event: dict) -> None:
+        """Keeps the value."""
+        self._events.append(event)
+
+    def drain(self) -> list[dict]:
+        """
+        Returns the values kept since the last call and forgets them.
+
+        Returns:
+            list[dict]: The events, in recording order.
+
+        """
+        events, self._events = self._events, []
+        return events
+
+
+class JSONLinesSink(MetricsSink):
+    """Appends every recorded value to a JSON-lines file."""
+
+    def __init__(self, path: str | Path) -> None:
+        """
+        Initializes the JSONLinesSink, truncating the file.
+
+        Args:
+            path (str | Path): Path to the file.
+
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("w", encoding="utf-8")
+
+    def emit(self, event: dict) -> None:
+        """Writes the value as a JSON line."""
+        self._file.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+    def close(self, recorder: MetricsRecorder) -> None:  # noqa: ARG002
+        """Closes the file."""
+        self._file.close()
+
+
+class PrometheusTextfileSink(MetricsSink):
+    """
+    Keeps a Prometheus textfile (for node_exporter's textfile collector) up to date.
+
+    The file is rewritten atomically at most every `interval` seconds and at the end of the run.
+    """
+
+    def __init__(self, path: str | Path, recorder: MetricsRecorder, interval: float = 15.0) -> None:
+        """
+        Initializes the PrometheusTextfileSink.
+
+        Args:
+            path (str | Path): Path to the .prom file.
+            recorder (MetricsRecorder): The recorder to export.
+            interval (float, optional): Minimal seconds between rewrites. Defaults to 15.
+
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.recorder = recorder
+        self.interval = interval
+        self._written = 0.0
+        self._writing = threading.Lock()
+
+    def emit(self, event: dict) -> None:  # noqa: ARG002
+        """Rewrites the file in the background if the last rewrite is old enough."""
+        now = time.monotonic()
+        if now - self._written >= self.interval and self._writing.acquire(blocking=False):
+            self._written = now
+            # Вызывается под блокировкой рекордера, поэтому пишем из отдельного потока
+            threading.Thread(target=self._write_and_release, daemon=True).start()
+
+    def _write_and_release(self) -> None:
+        try:
+            self.write()
+        finally:
+            self._writing.release()
+
+    def write(self) -> None:
+        """Atomically replaces the file with the current values."""
+        with tempfile.NamedTemporaryFile(
+            "w",
+            dir=self.path.parent,
+            suffix=".tmp",
+            delete=False,
+            encoding="utf-8",
+        ) as file:
+            file.write(self.recorder.prometheus())
+        Path(file.name).replace(self.path)
+
+    def close(self, recorder: MetricsRecorder) -> None:  # noqa: ARG002
+        """Writes the final values."""
+        with self._writing:
+            self.write()
+
+
+# Общий рекордер процесса: в него пишут все модели и детоксификаторы
+metrics = MetricsRecorder()
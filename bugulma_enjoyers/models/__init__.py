@@ -1,14 +1,37 @@
+import importlib
+
 from bugulma_enjoyers.models._api_model import APIModel
-from bugulma_enjoyers.models._base import MODEL_TYPES, BaseModel
-from bugulma_enjoyers.models._google import GoogleModel
-from bugulma_enjoyers.models._hf_model import HFModel
-from bugulma_enjoyers.models._yandex import YandexModel
+from bugulma_enjoyers.models._base import MODEL_MODULES, MODEL_TYPES, BaseModel, get_model_type
+from bugulma_enjoyers.models._fake import FakeModel
+from bugulma_enjoyers.models._model_cache import ModelCache, model_cache
+
+# Бэкенды с тяжёлыми зависимостями (transformers, SDK Google, requests) импортируются лениво
+_LAZY_MODELS = {
+    "GoogleModel": MODEL_MODULES["google"],
+    "HFModel": MODEL_MODULES["hf"],
+    "YandexModel": MODEL_MODULES["yandex"],
+}
 
 __all__ = [
     "MODEL_TYPES",
     "APIModel",
     "BaseModel",
+    "FakeModel",
     "GoogleModel",
     "HFModel",
+    "ModelCache",
     "YandexModel",
+    "get_model_type",
+    "model_cache",
 ]
+
+
+def __getattr__(name: str) -> type[BaseModel]:
+    if name in _LAZY_MODELS:
+        return getattr(importlib.import_module(_LAZY_MODELS[name]), name)
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *__all__})
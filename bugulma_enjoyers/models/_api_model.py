@@ -1,14 +1,42 @@
+import contextvars
 import json
 import logging
+import math
 import re
+import threading
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Never
 
 import torch
 
+from bugulma_enjoyers.datasets.collate import (
+    build_batch_prompt,
+    format_batch_data,
+    split_batch_prompt,
+)
+from bugulma_enjoyers.datasets.sampler import TokenBudgetBatchSampler
+from bugulma_enjoyers.metrics import metrics
 from bugulma_enjoyers.models._base import BaseModel
+from bugulma_enjoyers.models._rate_limit import RateLimiter
 
 logger = logging.getLogger(__name__)
 
+# Коды ответа, после которых имеет смысл повторить запрос
+THROTTLING_STATUS_CODES = frozenset({429})
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+# Коды ответа на запрос с закэшированным префиксом, когда кэша у провайдера уже нет
+MISSING_PREFIX_STATUS_CODES = frozenset({403, 404})
+# Доля TTL, за которую до истечения закэшированный префикс продлевается
+PREFIX_REFRESH_FRACTION = 0.1
+
+# JSON-обвязка одной строки батча: {"ID": 12, "text": "..."}
+ITEM_OVERHEAD_TOKENS = 12
+# Запас на случай, если ответ длиннее исходного текста
+OUTPUT_SAFETY_FACTOR = 1.25
+
 
 class DummyTokenizer:
     """
@@ -18,6 +46,8 @@ class DummyTokenizer:
     It does not perform any actual tokenization and always returns empty tensors.
     """
 
+    pad_token_id = 0
+
     def encode(self, *args: Any, **kwds: Any) -> torch.Tensor:
         """
         Encode a single text into a tensor. Returns an empty tensor.
@@ -90,67 +120,425 @@ class DummyTokenizer:
         """
         raise NotImplementedError
 
-    def __call__(self, *args: Any, **kwds: Any) -> Any:
-        return self.encode(*args, **kwds)
+    def __call__(self, text: str | list[str], *args: Any, **kwds: Any) -> Any:
+        if isinstance(text, list):
+            # Батчевый вызов: по одному "токену" на текст, как у настоящих токенизаторов
+            return {"input_ids": [[0] for _ in text], "attention_mask": [[0] for _ in text]}
+        return self.encode(text, *args, **kwds)
 
 
 class APIModel(BaseModel, model_type="api"):
     """Base model class for API-based models."""
 
+    # Грубая оценка числа токенов по символам; уточняется для каждого провайдера
+    chars_per_token: float = 3.0
+    # Токены ответа сверх самого текста (пояснения, рассуждения модели и т.п.)
+    output_token_reserve: int = 256
+    # Умеет ли провайдер кэшировать общий префикс промпта, и с какой длины префикса
+    supports_prefix_cache: bool = False
+    min_cached_prefix_tokens: int = 0
+    # Часы для сроков жизни закэшированных префиксов; подменяются в тестах
+    clock = staticmethod(time.monotonic)
+
     def __init__(self, model_name: str, pipeline_config: dict, **kwargs: dict) -> None:
         """Initializes the APIModel."""
         self.tokenizer = DummyTokenizer()
+        self.config = pipeline_config
+        self.model_name = model_name
+        self.rate_limiter = RateLimiter.shared((type(self).__name__, model_name), pipeline_config)
+        # Строки, оставшиеся без ответа модели после всех попыток
+        self.untouched_rows = 0
+        self._stats_lock = threading.Lock()
+        # (хэндл, момент истечения) закэшированных у провайдера префиксов;
+        # (None, None) — кэширование не удалось
+        self._prefix_handles = {}
+        self._prefix_lock = threading.Lock()
+
+    def invoke_model(self, input_: str, max_output_tokens: int | None = None) -> str:
+        """Invokes the model on the input text, limiting the answer to `max_output_tokens`."""
+        raise NotImplementedError
+
+    def create_prefix_cache(self, prefix: str) -> object:
+        """
+        Registers a static prompt prefix with the provider's context cache.
+
+        Args:
+            prefix (str): The prefix.
 
-    def invoke_model(self, input_: str) -> str:
-        """Invokes the model on the input text."""
+        Returns:
+            object: A handle to pass to `invoke_with_prefix`.
+
+        """
         raise NotImplementedError
 
-    def forward(self, batch: dict) -> list[str]:
-        prompt = batch["prompted_text"]
+    def invoke_with_prefix(
+        self,
+        handle: object,
+        suffix: str,
+        max_output_tokens: int | None = None,
+    ) -> str:
+        """Invokes the model on a cached prefix (referenced by handle) followed by `suffix`."""
+        raise NotImplementedError
+
+    def delete_prefix_cache(self, handle: object) -> None:
+        """Releases a handle created by `create_prefix_cache`. Providers with TTLs may skip it."""
+
+    def refresh_prefix_cache(self, handle: object, prefix: str) -> object:
+        """
+        Extends the lifetime of a cached prefix by `api_prefix_cache_ttl` from now.
+
+        The default registers the prefix again and releases the old handle; providers that can
+        extend a TTL in place override this.
+
+        Args:
+            handle (object): The handle of the prefix.
+            prefix (str): The prefix.
+
+        Returns:
+            object: The handle to use from now on.
+
+        """
+        new_handle = self.create_prefix_cache(prefix)
         try:
-            text_response = self.invoke_model(prompt)
-            # Логика извлечения JSON (чуть упрощена для надежности)
-            if "```" in text_response:
-                # Пытаемся найти блок кода, если он есть
-                match = re.search(r"```(?:json)?(.*?)```", text_response, re.DOTALL)
-                if match:
-                    text_response = match.group(1)
-
-            json_str = self.clean_json_response(text_response)
-
-            # Парсим JSON
-            predictions = json.loads(json_str)
-
-            # Если модель вернула объект с ключом (например {"result": [...]}), извлекаем список
-            if isinstance(predictions, dict):
-                # Ищем любой ключ, который содержит список
-                for value in predictions.values():
-                    if isinstance(value, list):
-                        predictions = value
-                        break
-
-            res = batch["original_text"].copy()
-            for item in predictions:
+            self.delete_prefix_cache(handle)
+        except Exception:
+            logger.warning("Could not delete a cached prompt prefix", exc_info=True)
+        return new_handle
+
+    def is_missing_prefix(self, exc: Exception) -> bool:
+        """Whether a request with a cached prefix failed because the cache is gone."""
+        return self.status_code(exc) in MISSING_PREFIX_STATUS_CODES
+
+    def prefix_handle(self, prefix: str) -> object | None:
+        """
+        Returns the handle of a cached prefix, registering it on first use.
+
+        Handles close to the end of their TTL are refreshed, or registered anew if that fails.
+        Returns None when prefix caching is disabled, unsupported, the prefix is too short to
+        be cached, or registering it failed; callers then send the full prompt.
+        """
+        if not (self.config.api_prefix_caching and self.supports_prefix_cache):
+            return None
+        ttl = self.config.api_prefix_cache_ttl
+        with self._prefix_lock:
+            now = self.clock()
+            handle, expires = self._prefix_handles.get(prefix, (None, None))
+            if prefix in self._prefix_handles and handle is None:
+                return None
+            if handle is not None and now < expires - ttl * PREFIX_REFRESH_FRACTION:
+                return handle
+            if handle is not None:
+                try:
+                    handle = self.refresh_prefix_cache(handle, prefix)
+                    logger.info("Refreshed a cached %d-char prompt prefix", len(prefix))
+                except Exception:
+                    logger.warning("Could not refresh the prompt prefix", exc_info=True)
+                    handle = None
+            if handle is None and self.estimate_tokens(prefix) >= self.min_cached_prefix_tokens:
                 try:
-                    idx = item["ID"]
-                    if "tat_detox1" in item:
-                        detoxified_text = item["tat_detox1"]
-                    elif "detoxified_text" in item:
-                        detoxified_text = item["detoxified_text"]
-                    else:
-                        detoxified_text = item["text"]
-                    res[idx] = detoxified_text
-                except KeyError:
-                    logger.warning("Missing expected keys in model output item: %s", item)
+                    handle = self.create_prefix_cache(prefix)
+                    logger.info("Cached a %d-char prompt prefix", len(prefix))
+                except Exception:
+                    logger.exception("Could not cache the prompt prefix, sending it in full")
+            self._prefix_handles[prefix] = (handle, None if handle is None else now + ttl)
+            return handle
+
+    def forget_prefix_handle(self, prefix: str, handle: object) -> None:
+        """Drops a handle the provider no longer knows, so the prefix is registered again."""
+        with self._prefix_lock:
+            if self._prefix_handles.get(prefix, (None, None))[0] is handle:
+                del self._prefix_handles[prefix]
+
+    def close(self) -> None:
+        """Releases provider-side resources, such as cached prompt prefixes."""
+        with self._prefix_lock:
+            handles = [handle for handle, _ in self._prefix_handles.values() if handle is not None]
+            self._prefix_handles.clear()
+        for handle in handles:
+            try:
+                self.delete_prefix_cache(handle)
+            except Exception:
+                logger.warning("Could not delete a cached prompt prefix", exc_info=True)
+
+    def estimate_tokens(self, text: str) -> int:
+        """Cheap estimate of the number of tokens the provider will count for the text."""
+        return int(len(text) / self.chars_per_token) + 1
+
+    def response_token_limit(self, texts: list[str]) -> int | None:
+        """
+        The answer token limit for a batch prompt with the given texts.
+
+        None (no limit is sent) unless `api_max_output_tokens` is set.
+        """
+        if self.config.api_max_output_tokens is None:
+            return None
+        expected = sum(self.estimate_tokens(text) + ITEM_OVERHEAD_TOKENS for text in texts)
+        limit = math.ceil(expected * OUTPUT_SAFETY_FACTOR) + self.output_token_reserve
+        return min(limit, self.config.api_max_output_tokens)
 
+    def make_batch_sampler(self, dataset: object, task: str) -> TokenBudgetBatchSampler | None:
+        """
+        Packs batch prompts up to the token budgets, if `api_max_input_tokens` is set.
+
+        The static part of the batch prompt is subtracted from the input budget, and the answer
+        budget (if `api_max_output_tokens` is set) leaves room for `response_token_limit`
+        overheads.
+        """
+        if self.config.api_max_input_tokens is None:
+            return None
+        preamble = max(
+            (
+                self.estimate_tokens(build_batch_prompt(task, lang, []))
+                for lang in set(dataset.languages)
+            ),
+            default=0,
+        )
+        input_budget = self.config.api_max_input_tokens - preamble
+        if input_budget <= 0:
+            logger.warning(
+                "Prompt preamble (~%d tokens) exceeds api_max_input_tokens, one row per request",
+                preamble,
+            )
+        output_budget = math.inf
+        if self.config.api_max_output_tokens is not None:
+            output_budget = (
+                self.config.api_max_output_tokens - self.output_token_reserve
+            ) / OUTPUT_SAFETY_FACTOR
+        costs = [self.estimate_tokens(text) + ITEM_OVERHEAD_TOKENS for text in dataset.texts]
+        return TokenBudgetBatchSampler(
+            dataset.languages,
+            input_tokens=costs,
+            output_tokens=costs,
+            max_input_tokens=input_budget,
+            max_output_tokens=output_budget,
+            max_rows=self.config.api_max_batch_rows,
+        )
+
+    @staticmethod
+    def status_code(exc: Exception) -> int | None:
+        """Extracts the HTTP status code from requests, httpx and google-api-core errors."""
+        response = getattr(exc, "response", None)
+        code = getattr(response, "status_code", None)
+        if code is None:
+            code = getattr(exc, "code", None)
+        return int(code) if isinstance(code, int) else None
+
+    def is_throttling(self, exc: Exception) -> bool:
+        """Whether the error means the quota is exhausted."""
+        return self.status_code(exc) in THROTTLING_STATUS_CODES
+
+    def is_retryable(self, exc: Exception) -> bool:
+        """Whether the error is transient: throttling, server errors or network failures."""
+        code = self.status_code(exc)
+        if code is not None:
+            return code in RETRYABLE_STATUS_CODES
+        return isinstance(exc, OSError)
+
+    def invoke_with_retries(
+        self,
+        input_: str,
+        max_output_tokens: int | None = None,
+        prefix_handle: object | None = None,
+    ) -> str:
+        """
+        Invokes the model within the shared rate limits, retrying transient errors.
+
+        If `prefix_handle` is given, `input_` is only the suffix following the cached prefix.
+        """
+        if prefix_handle is None:
+            call = lambda: self.invoke_model(input_, max_output_tokens=max_output_tokens)  # noqa: E731
+        else:
+            call = lambda: self.invoke_with_prefix(prefix_handle, input_, max_output_tokens)  # noqa: E731
+        model = type(self).__name__
+        start = time.perf_counter()
+        try:
+            response = self.rate_limiter.call(
+                call,
+                tokens=self.estimate_tokens(input_) + (max_output_tokens or 0),
+                is_retryable=self.is_retryable,
+                is_throttling=self.is_throttling,
+            )
+        finally:
+            metrics.observe("api_request_seconds", time.perf_counter() - start, model=model)
+        metrics.increment("model_input_tokens_total", self.estimate_tokens(input_), model=model)
+        metrics.increment("model_output_tokens_total", self.estimate_tokens(response), model=model)
+        return response
+
+    def parse_response(self, text_response: str, size: int) -> dict[int, str]:
+        """
+        Extracts detoxified texts from the model's JSON answer.
+
+        Args:
+            text_response (str): The raw answer of the model.
+            size (int): Number of items in the request; IDs outside of `range(size)` are dropped.
+
+        Returns:
+            dict[int, str]: Detoxified texts by request ID. Missing IDs were not answered.
+
+        Raises:
+            ValueError: If the answer is not valid JSON.
+
+        """
+        # Логика извлечения JSON (чуть упрощена для надежности)
+        if "```" in text_response:
+            # Пытаемся найти блок кода, если он есть
+            match = re.search(r"```(?:json)?(.*?)```", text_response, re.DOTALL)
+            if match:
+                text_response = match.group(1)
+
+        json_str = self.clean_json_response(text_response)
+
+        # Парсим JSON
+        predictions = json.loads(json_str)
+
+        # Если модель вернула объект с ключом (например {"result": [...]}), извлекаем список
+        if isinstance(predictions, dict):
+            # Ищем любой ключ, который содержит список
+            for value in predictions.values():
+                if isinstance(value, list):
+                    predictions = value
+                    break
+
+        res = {}
+        for item in predictions if isinstance(predictions, list) else []:
+            parsed = self.parse_item(item)
+            if parsed is not None and 0 <= parsed[0] < size:
+                res[parsed[0]] = parsed[1]
+        return res
+
+    @staticmethod
+    def parse_item(item: object) -> tuple[int, str] | None:
+        """
+        Extracts the request ID and the detoxified text from one item of the model's answer.
+
+        Returns:
+            tuple[int, str] | None: The ID and the text, or None if the item is malformed.
+        """
+        try:
+            idx = int(item["ID"])
+            if "tat_detox1" in item:
+                detoxified_text = item["tat_detox1"]
+            elif "detoxified_text" in item:
+                detoxified_text = item["detoxified_text"]
+            else:
+                detoxified_text = item["text"]
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Missing expected keys in model output item: %s", item)
+            return None
+        if not isinstance(detoxified_text, str):
+            return None
+        return idx, detoxified_text
+
+    def _invoke_batch(self, batch: dict, texts: list[str]) -> str:
+        """Sends the batch prompt of the texts, after a cached prefix if there is one."""
+        limit = self.response_token_limit(texts)
+        if "task" not in batch:
+            return self.invoke_with_retries(batch["prompted_text"], limit)
+        task, language = batch["task"], batch["languages"][0]
+        prefix, suffix = split_batch_prompt(task, language)
+        handle = self.prefix_handle(prefix)
+        if handle is not None:
+            prompt = suffix.format(batch_data_str=format_batch_data(texts))
+            try:
+                return self.invoke_with_retries(prompt, limit, handle)
+            except Exception as exc:
+                if not self.is_missing_prefix(exc):
+                    raise
+                # Кэш истёк или удалён провайдером: следующий запрос зарегистрирует его заново
+                logger.warning("Cached prompt prefix is gone (%s), sending it in full", exc)
+                self.forget_prefix_handle(prefix, handle)
+        return self.invoke_with_retries(build_batch_prompt(task, language, texts), limit)
+
+    def _request(self, batch: dict, positions: list[int]) -> dict[int, str]:
+        """Requests the given rows of the batch, returning answers by batch position."""
+        texts = [batch["original_text"][pos] for pos in positions]
+        try:
+            answer = self._invoke_batch(batch, texts)
+            answers = self.parse_response(answer, len(texts))
         except Exception:
             logger.exception("Error parsing model response")
-            # Возвращаем пустой список, чтобы пайплайн не падал,
-            # или можно вернуть оригинальные тексты как 'fail-safe'
-            return batch["original_text"]
+            return {}
+        return {positions[idx]: text for idx, text in answers.items()}
 
-        else:
+    def forward(self, batch: dict) -> list[str]:
+        """
+        Detoxifies a batch, repairing partial failures.
+
+        Rows the model left out are requested again on their own. A request that fails
+        completely (an error or unparseable JSON) is split in half. After
+        `api_max_repair_attempts` requests per batch the remaining rows are returned unchanged,
+        counted in `untouched_rows` and listed (as batch positions) in `batch["untouched"]`.
+        """
+        res = batch["original_text"].copy()
+        if not res:
             return res
+        pending = deque([list(range(len(res)))])
+        # Без задачи в батче промпт для части строк не собрать: только одна попытка
+        max_attempts = self.config.api_max_repair_attempts if "task" in batch else 1
+        attempts = 0
+        while pending and attempts < max_attempts:
+            positions = pending.popleft()
+            attempts += 1
+            answers = self._request(batch, positions)
+            for pos, text in answers.items():
+                res[pos] = text
+            missing = [pos for pos in positions if pos not in answers]
+            if not missing:
+                continue
+            if not answers and len(missing) > 1:
+                middle = len(missing) // 2
+                pending.extend([missing[:middle], missing[middle:]])
+            else:
+                pending.append(missing)
+
+        untouched = sum(len(positions) for positions in pending)
+        if untouched:
+            # Позиции в батче, по которым ответа нет: вызывающий не должен их кэшировать
+            batch["untouched"] = sorted(pos for positions in pending for pos in positions)
+            with self._stats_lock:
+                self.untouched_rows += untouched
+            metrics.increment("api_fallback_rows_total", untouched, model=type(self).__name__)
+            logger.warning(
+                "%d/%d rows left untouched after %d requests (%d in total so far)",
+                untouched,
+                len(res),
+                attempts,
+                self.untouched_rows,
+            )
+        return res
+
+    def forward_batches(self, batches: Iterable[dict]) -> Iterator[tuple[dict, list[str]]]:
+        """
+        Sends up to `api_max_in_flight` batches concurrently, yielding results in input order.
+
+        Requests are dispatched from a thread pool; when the limit is reached, the oldest request
+        is awaited before the next one is sent. A batch is yielded only when it and all batches
+        before it are done, so progress bars over the results stay correct.
+
+        Args:
+            batches (Iterable[dict]): The batches, e.g. a DataLoader.
+
+        Yields:
+            tuple[dict, list[str]]: Every batch together with the model's outputs for it.
+
+        """
+        max_in_flight = getattr(self.config, "api_max_in_flight", 1)
+        if max_in_flight <= 1:
+            yield from super().forward_batches(batches)
+            return
+
+        with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="api") as pool:
+            in_flight = deque()
+            for batch in batches:
+                if len(in_flight) >= max_in_flight:
+                    done_batch, future = in_flight.popleft()
+                    yield done_batch, future.result()
+                # В копии контекста, чтобы метрики запросов сохранили метки этапа
+                context = contextvars.copy_context()
+                in_flight.append((batch, pool.submit(context.run, self.forward, batch)))
+            while in_flight:
+                done_batch, future = in_flight.popleft()
+                yield done_batch, future.result()
 
     def to(self, device: str) -> None:
         """Moves the model to the specified device. Does nothing for API-based models."""
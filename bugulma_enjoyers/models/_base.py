@@ -1,9 +1,64 @@
 """Contains the BaseModel class, which is an abstract base class for all models."""
 
+import functools
+import importlib
+import time
 from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Iterator
+
+from bugulma_enjoyers.metrics import metrics
 
 MODEL_TYPES = {}
 
+# Модули встроенных бэкендов по префиксу имени модели; импортируются при первом обращении,
+# чтобы запуск не платил за SDK, которые не используются
+MODEL_MODULES = {
+    "api": "bugulma_enjoyers.models._api_model",
+    "fake": "bugulma_enjoyers.models._fake",
+    "google": "bugulma_enjoyers.models._google",
+    "hf": "bugulma_enjoyers.models._hf_model",
+    "yandex": "bugulma_enjoyers.models._yandex",
+}
+UNKNOWN_MODEL_TYPE_ERROR = "Unknown model type {!r}. Supported model types: {}"
+
+
+def get_model_type(model_type: str) -> type["BaseModel"]:
+    """
+    Returns the model class registered for the prefix, importing its backend if needed.
+
+    Args:
+        model_type (str): The prefix of a model name, e.g. "hf" for "hf/s-nlp/mt0-xl-detox-orpo".
+
+    Returns:
+        type[BaseModel]: The model class.
+
+    Raises:
+        ValueError: If no model class is registered for the prefix.
+
+    """
+    if model_type not in MODEL_TYPES and model_type in MODEL_MODULES:
+        importlib.import_module(MODEL_MODULES[model_type])
+    if model_type not in MODEL_TYPES:
+        supported = sorted({*MODEL_TYPES, *MODEL_MODULES})
+        raise ValueError(UNKNOWN_MODEL_TYPE_ERROR.format(model_type, supported))
+    return MODEL_TYPES[model_type]
+
+
+def _instrument_forward(forward: Callable) -> Callable:
+    """Records batches, rows and time of every `forward` call, labelled by the model class."""
+
+    @functools.wraps(forward)
+    def instrumented(self: "BaseModel", batch: dict) -> list[str]:
+        start = time.perf_counter()
+        outputs = forward(self, batch)
+        model = type(self).__name__
+        metrics.observe("model_forward_seconds", time.perf_counter() - start, model=model)
+        metrics.increment("model_batches_total", model=model)
+        metrics.increment("model_rows_total", len(outputs), model=model)
+        return outputs
+
+    return instrumented
+
 
 class BaseModel(ABC):
     """
@@ -33,9 +88,56 @@ class BaseModel(ABC):
 
         """
 
+    def forward_batches(self, batches: Iterable[dict]) -> Iterator[tuple[dict, list[str]]]:
+        """
+        Runs the model over a stream of batches.
+
+        The default implementation processes batches one after another. Subclasses may process
+        several batches at once, but must yield them in the order they were received.
+
+        Args:
+            batches (Iterable[dict]): The batches, e.g. a DataLoader.
+
+        Yields:
+            tuple[dict, list[str]]: Every batch together with the model's outputs for it.
+
+        """
+        for batch in batches:
+            yield batch, self.forward(batch)
+
+    def make_batch_sampler(self, dataset: object, task: str) -> object | None:
+        """
+        Returns a model-specific batch sampler for the dataset.
+
+        Args:
+            dataset (object): The DetoxificationDataset to batch.
+            task (str): The task the batches are for.
+
+        Returns:
+            object | None: A batch sampler, or None to use the default bucketing by length.
+
+        """
+        return None
+
     def __init_subclass__(cls, model_type: str):
         super().__init_subclass__()
         MODEL_TYPES[model_type] = cls
+        if "forward" in cls.__dict__:
+            cls.forward = _instrument_forward(cls.forward)
+
+    def release(self) -> None:  # noqa: B027
+        """
+        Frees the weights of the model; it must not be used afterwards.
+
+        The default implementation does nothing, for models without local weights.
+        """
+
+    def close(self) -> None:  # noqa: B027
+        """
+        Releases provider-side and network resources at the end of the run.
+
+        The default implementation does nothing, for models without such resources.
+        """
 
     @abstractmethod
     def to(self, device: str) -> None:
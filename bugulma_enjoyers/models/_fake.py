@@ -0,0 +1,124 @@
+"""An offline stand-in for LLM APIs, used in tests and benchmarks."""
+
+import itertools
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qsl
+
+from bugulma_enjoyers.models._api_model import APIModel
+
+BATCH_DATA_MARKER = '[{"ID"'
+NO_BATCH_DATA_ERROR = "Prompt contains no batch data"
+UNKNOWN_OPTION_ERROR = "Unknown fake model option {!r}. Supported options: {}"
+
+# Параметры задержек и ошибок (и их значения по умолчанию), задаются в имени модели:
+# fake/echo?latency=0.5&error_rate=0.1
+FAKE_MODEL_OPTIONS = {
+    "latency": 0.0,
+    "jitter": 0.0,
+    "error_rate": 0.0,
+    "throttle_rate": 0.0,
+    "seed": 0,
+}
+
+
+class FakeAPIError(Exception):
+    """A simulated provider error; `code` is its HTTP status."""
+
+    def __init__(self, code: int) -> None:
+        """Initializes the FakeAPIError with the HTTP status code."""
+        super().__init__(f"Simulated API error {code}")
+        self.code = code
+
+
+class FakeModel(APIModel, model_type="fake"):
+    """
+    Answers batch prompts locally by returning every text unchanged.
+
+    Supports prefix caching like a real provider would: prefixes are stored under opaque
+    handles, and only the characters actually sent over the "network" are counted, so tests
+    can check how much prompt traffic caching saves.
+
+    Latency and failures can be simulated with options in the model name, e.g.
+    `fake/echo?latency=0.5&jitter=0.3&error_rate=0.05&throttle_rate=0.02&seed=0`: every
+    request takes `latency` seconds times a log-normal factor with sigma `jitter`, and fails
+    with a 503 (`error_rate`) or a 429 (`throttle_rate`) with the given probabilities.
+    """
+
+    supports_prefix_cache = True
+
+    def __init__(self, model_name: str, pipeline_config: dict, **kwargs: dict) -> None:
+        super().__init__(model_name, pipeline_config)
+        _, _, query = model_name.partition("?")
+        options = dict(FAKE_MODEL_OPTIONS)
+        for key, value in parse_qsl(query):
+            if key not in FAKE_MODEL_OPTIONS:
+                raise ValueError(UNKNOWN_OPTION_ERROR.format(key, list(FAKE_MODEL_OPTIONS)))
+            options[key] = type(FAKE_MODEL_OPTIONS[key])(value)
+        self.latency = options["latency"]
+        self.jitter = options["jitter"]
+        self.error_rate = options["error_rate"]
+        self.throttle_rate = options["throttle_rate"]
+        self._random = random.Random(options["seed"])  # noqa: S311
+        self.calls = 0
+        self.sent_chars = 0
+        self.prefixes = {}
+        self._handles = itertools.count()
+        self._lock = threading.Lock()
+
+    def answer(self, prompt: str) -> str:
+        """Builds the JSON answer to a (complete) batch prompt."""
+        start = prompt.rfind(BATCH_DATA_MARKER)
+        if start == -1:
+            raise ValueError(NO_BATCH_DATA_ERROR)
+        items, _ = json.JSONDecoder().raw_decode(prompt, start)
+        return json.dumps(
+            [{"ID": item["ID"], "tat_detox1": item["text"]} for item in items],
+            ensure_ascii=False,
+        )
+
+    def _record(self, sent: str) -> None:
+        with self._lock:
+            self.calls += 1
+            self.sent_chars += len(sent)
+
+    def _simulate_network(self) -> None:
+        """Sleeps for a sampled latency and raises a sampled error, if any."""
+        with self._lock:
+            delay = self.latency * self._random.lognormvariate(0, self.jitter)
+            roll = self._random.random()
+        time.sleep(delay)
+        if roll < self.throttle_rate:
+            raise FakeAPIError(429)
+        if roll < self.throttle_rate + self.error_rate:
+            raise FakeAPIError(503)
+
+    def invoke_model(self, input_: str, max_output_tokens: int | None = None) -> str:
+        self._simulate_network()
+        self._record(input_)
+        return self.answer(input_)
+
+    def create_prefix_cache(self, prefix: str) -> int:
+        self._record(prefix)
+        handle = next(self._handles)
+        self.prefixes[handle] = prefix
+        return handle
+
+    def invoke_with_prefix(
+        self,
+        handle: int,
+        suffix: str,
+        max_output_tokens: int | None = None,
+    ) -> str:
+        self._simulate_network()
+        self._record(suffix)
+        prefix = self.prefixes.get(handle)
+        if prefix is None:
+            # Провайдер уже удалил кэш (истёк TTL)
+            raise FakeAPIError(404)
+        return self.answer(prefix + suffix)
+
+    def delete_prefix_cache(self, handle: int) -> None:
+        del self.prefixes[handle]
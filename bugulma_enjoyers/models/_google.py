@@ -1,8 +1,10 @@
+import datetime as dt
 import logging
 import os
 
 import google.generativeai as genai
 from dotenv import load_dotenv
+from google.generativeai import caching
 
 from bugulma_enjoyers.constants import LOW_SAFETY
 from bugulma_enjoyers.models._api_model import APIModel
@@ -11,6 +13,14 @@ logger = logging.getLogger(__name__)
 
 
 class GoogleModel(APIModel, model_type="google"):
+    # Токенизатор Gemini дробит кириллицу мельче, чем латиницу
+    chars_per_token = 2.5
+    # Рассуждения gemini-2.5 расходуют тот же лимит max_output_tokens (если он задан)
+    output_token_reserve = 4096
+    # Явный context caching Gemini работает только с достаточно длинными префиксами
+    supports_prefix_cache = True
+    min_cached_prefix_tokens = 4096
+
     def __init__(self, model_name: str, pipeline_config: dict) -> None:
         super().__init__(model_name, pipeline_config)
         load_dotenv()
@@ -18,5 +28,44 @@ class GoogleModel(APIModel, model_type="google"):
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel(model_name, safety_settings=LOW_SAFETY)
 
-    def invoke_model(self, input_: str) -> str:
-        return self.model.generate_content(input_).text
+    def invoke_model(self, input_: str, max_output_tokens: int | None = None) -> str:
+        generation_config = (
+            None if max_output_tokens is None else {"max_output_tokens": max_output_tokens}
+        )
+        return self.model.generate_content(input_, generation_config=generation_config).text
+
+    def create_prefix_cache(self, prefix: str) -> genai.GenerativeModel:
+        cached_content = caching.CachedContent.create(
+            model=self.model_name,
+            display_name="bugulma-batch-prompt",
+            contents=[prefix],
+            ttl=dt.timedelta(seconds=self.config.api_prefix_cache_ttl),
+        )
+        return genai.GenerativeModel.from_cached_content(
+            cached_content=cached_content,
+            safety_settings=LOW_SAFETY,
+        )
+
+    def invoke_with_prefix(
+        self,
+        handle: genai.GenerativeModel,
+        suffix: str,
+        max_output_tokens: int | None = None,
+    ) -> str:
+        generation_config = (
+            None if max_output_tokens is None else {"max_output_tokens": max_output_tokens}
+        )
+        return handle.generate_content(suffix, generation_config=generation_config).text
+
+    def refresh_prefix_cache(
+        self,
+        handle: genai.GenerativeModel,
+        prefix: str,  # noqa: ARG002
+    ) -> genai.GenerativeModel:
+        caching.CachedContent.get(name=handle.cached_content).update(
+            ttl=dt.timedelta(seconds=self.config.api_prefix_cache_ttl),
+        )
+        return handle
+
+    def delete_prefix_cache(self, handle: genai.GenerativeModel) -> None:
+        caching.CachedContent.get(name=handle.cached_content).delete()
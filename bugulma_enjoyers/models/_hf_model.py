@@ -1,27 +1,191 @@
+import logging
+import os
+import re
+
 import torch
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from transformers import (
+    AutoModelForSeq2SeqLM,
+    AutoTokenizer,
+    StoppingCriteria,
+    StoppingCriteriaList,
+)
 
+from bugulma_enjoyers.constants import INFERENCE_BACKENDS, QUANTIZATION_MODES
+from bugulma_enjoyers.metrics import metrics
 from bugulma_enjoyers.models._base import BaseModel
+from bugulma_enjoyers.models._model_cache import model_cache
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_QUANTIZATION_ERROR = "Unknown quantization {!r}. Supported modes: {}"
+QUANTIZATION_DEVICE_ERROR = "Quantization {!r} is only supported on CPU, got device {!r}"
+UNKNOWN_BACKEND_ERROR = "Unknown inference backend {!r}. Supported backends: {}"
+ONNX_QUANTIZATION_ERROR = "The onnx backend does not support quantization {!r}"
+ONNX_NOT_INSTALLED = (
+    "The onnx backend needs Optimum with ONNX Runtime: pip install 'optimum[onnxruntime]' "
+    "(or use another --inference-backend)"
+)
+
+
+class RowBudgets(StoppingCriteria):
+    """Stops every row once it has generated its own number of new tokens."""
+
+    def __init__(self, budgets: torch.Tensor) -> None:
+        """
+        Initializes the RowBudgets.
+
+        Args:
+            budgets (torch.Tensor): The number of new tokens of every row of the batch.
+
+        """
+        self.budgets = budgets
+        self.prompt_length = None
+
+    def __call__(
+        self,
+        input_ids: torch.LongTensor,
+        _scores: torch.FloatTensor,
+        **_kwargs: dict,
+    ) -> torch.BoolTensor:
+        # Первый вызов — после первого нового токена, до него в input_ids была только затравка
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[-1] - 1
+        # Лучевой поиск передаёт по несколько гипотез на строку, подряд
+        budgets = self.budgets.to(input_ids.device).repeat_interleave(
+            len(input_ids) // len(self.budgets),
+        )
+        return input_ids.shape[-1] - self.prompt_length >= budgets
 
 
 class HFModel(BaseModel, model_type="hf"):
     def __init__(self, model_name: str, pipeline_config: dict, **kwargs: dict) -> None:
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(
-            model_name,
-            dtype=torch.float16 if pipeline_config.device == "cuda" else torch.float32,
-        )
-        self.model.eval()
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model_name = model_name
+        self.quantization = getattr(pipeline_config, "quantization", "none")
+        if self.quantization not in QUANTIZATION_MODES:
+            raise ValueError(
+                UNKNOWN_QUANTIZATION_ERROR.format(self.quantization, list(QUANTIZATION_MODES)),
+            )
+        if self.quantization == "bf16":
+            self.dtype = torch.bfloat16
+        elif pipeline_config.device == "cuda" and self.quantization == "none":
+            self.dtype = torch.float16
+        else:
+            self.dtype = torch.float32
+        self.backend = getattr(pipeline_config, "inference_backend", "eager")
+        if self.backend not in INFERENCE_BACKENDS:
+            raise ValueError(UNKNOWN_BACKEND_ERROR.format(self.backend, list(INFERENCE_BACKENDS)))
+        if self.backend == "onnx" and self.quantization != "none":
+            raise ValueError(ONNX_QUANTIZATION_ERROR.format(self.quantization))
         self.config = pipeline_config
+        self._load(pipeline_config.device)
+
+    def _cache_key(self, device: str | torch.device) -> tuple:
+        device = torch.device(device)
+        if self.quantization == "dynamic-int8" and device.type != "cpu":
+            raise ValueError(QUANTIZATION_DEVICE_ERROR.format(self.quantization, str(device)))
+        # Веса общие для всех HFModel с тем же чекпойнтом, точностью, устройством и бэкендом
+        precision = "dynamic-int8" if self.quantization == "dynamic-int8" else str(self.dtype)
+        return (self.model_name, precision, str(device), self.backend)
+
+    def _load(self, device: str | torch.device, weights: tuple | None = None) -> None:
+        device = torch.device(device)
+        self.cache_key = self._cache_key(device)
+        self.device = device
+
+        def load() -> tuple:
+            model = self._load_onnx(device) if self.backend == "onnx" else self._load_torch(device)
+            return model, AutoTokenizer.from_pretrained(self.model_name)
+
+        self._loader = load
+        self._released = False
+        self.tokenizer = model_cache.get(self.cache_key, lambda: weights or load())[1]
+
+    @property
+    def model(self) -> object | None:
+        """
+        The weights, fetched from the model cache on every access.
+
+        The model does not keep them alive itself, so the cache budget bounds the memory: once
+        evicted, the weights are freed and loaded again on the next use.
+        """
+        if self._released:
+            return None
+        return model_cache.get(self.cache_key, self._loader, count_hit=False)[0]
+
+    def _load_torch(self, device: torch.device) -> torch.nn.Module:
+        model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name, dtype=self.dtype)
+        model.to(device)
+        model.eval()
+        if self.quantization == "dynamic-int8":
+            model = torch.ao.quantization.quantize_dynamic(
+                model,
+                {torch.nn.Linear},
+                dtype=torch.qint8,
+            )
+        if self.backend == "compile":
+            inductor_cache = self.config.cache_path("inductor")
+            if inductor_cache is not None:
+                # Скомпилированные ядра переживают перезапуск, компиляция оплачивается один раз
+                os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(inductor_cache))
+            # Статический KV-кэш: форма тензоров не меняется от шага к шагу декодирования,
+            # так что граф компилируется один раз на форму входа
+            model.generation_config.cache_implementation = "static"
+            # CUDA graphs есть только на GPU
+            mode = "reduce-overhead" if device.type == "cuda" else None
+            model.forward = torch.compile(model.forward, mode=mode)
+        return model
+
+    def _load_onnx(self, device: torch.device) -> object:
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM  # noqa: PLC0415
+        except ImportError as exc:
+            raise ImportError(ONNX_NOT_INSTALLED) from exc
+
+        provider = "CUDAExecutionProvider" if device.type == "cuda" else "CPUExecutionProvider"
+        onnx_cache = self.config.cache_path("onnx")
+        path = None
+        if onnx_cache is not None:
+            path = onnx_cache / re.sub(r"[^\w.-]", "_", self.model_name)
+        if path is not None and (path / "config.json").exists():
+            return ORTModelForSeq2SeqLM.from_pretrained(path, use_cache=True, provider=provider)
+        # Экспорт энкодера и декодера (с KV-кэшем) в ONNX; сохраняем, чтобы не повторять
+        logger.info("Exporting %s to ONNX", self.model_name)
+        model = ORTModelForSeq2SeqLM.from_pretrained(
+            self.model_name,
+            export=True,
+            use_cache=True,
+            provider=provider,
+        )
+        if path is not None:
+            model.save_pretrained(path)
+        return model
 
     def forward(self, batch: dict) -> str:
-        input_ids = batch["input_ids"].to(self.model.device)
-        attention_mask = batch["attention_mask"].to(self.model.device)
+        # Держим веса до конца генерации, даже если другая модель вытеснит их из кэша
+        model = self.model
+        input_ids = batch["input_ids"].to(model.device)
+        attention_mask = batch["attention_mask"].to(model.device)
 
-        outputs = self.model.generate(
+        # Бюджет каждой строки по длине её источника вместо max_length для всех: лучи, которые
+        # не завершаются, не декодируют зря до предела, а вывод строки не зависит от соседей
+        task = batch.get("task", "detoxification")
+        policy = (getattr(self.config, "generation_policies", None) or {}).get(task)
+        if policy is None:
+            length = {"max_length": self.config.max_length}
+        else:
+            budgets = [
+                policy.max_new_tokens([source_length], self.config.max_length)
+                for source_length in attention_mask.sum(dim=1).tolist()
+            ]
+            length = {
+                "max_new_tokens": max(budgets),
+                "stopping_criteria": StoppingCriteriaList([RowBudgets(torch.tensor(budgets))]),
+            }
+
+        outputs = model.generate(
             input_ids=input_ids,
             attention_mask=attention_mask,
-            max_length=self.config.max_length,
+            **length,
             num_beams=self.config.num_beams,
             do_sample=self.config.do_sample,
             temperature=self.config.temperature,
@@ -30,8 +194,33 @@ class HFModel(BaseModel, model_type="hf"):
             forced_bos_token_id=batch.get("forced_bos_token_id"),
         )
 
+        name = type(self).__name__
+        metrics.increment("model_input_tokens_total", int(attention_mask.sum()), model=name)
+        output_tokens = int((outputs != self.tokenizer.pad_token_id).sum())
+        metrics.increment("model_output_tokens_total", output_tokens, model=name)
+        # Завершённые строки содержат EOS (после затравки декодера); остальные упёрлись в бюджет
+        finished = (outputs[:, 1:] == self.tokenizer.eos_token_id).any(dim=1)
+        cap_hits = int((~finished).sum())
+        metrics.increment("generation_rows_total", len(outputs), model=name, task=task)
+        metrics.increment("generation_cap_hits_total", cap_hits, model=name, task=task)
         return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
 
     def to(self, device: torch.device) -> None:
-        self.model.to(device)
+        device = torch.device(device)
+        if device == self.device:
+            return self
+        weights = None
+        if self._cache_key(device) not in model_cache and self.backend != "onnx":
+            # Переносим веса, а не читаем их с диска заново; другие HFModel с теми же весами
+            # их не держат и при следующем обращении загрузят свою копию
+            weights = model_cache.take(self.cache_key)
+            if weights is not None:
+                model, tokenizer = weights
+                weights = model.to(device), tokenizer
+        self._load(device, weights)
         return self
+
+    def release(self) -> None:
+        model_cache.release(self.cache_key)
+        self._released = True
+        self.tokenizer = None
@@ -0,0 +1,167 @@
+"""Process-wide cache of loaded model weights, shared by all models with the same checkpoint."""
+
+import gc
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import TypeVar
+
+import torch
+
+from bugulma_enjoyers.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def model_nbytes(obj: object) -> int:
+    """
+    Estimates the memory taken by the weights.
+
+    Counts every tensor of the state dicts once, so shared and tied weights are not counted
+    twice and the packed weights of quantized layers are counted too.
+
+    Args:
+        obj (object): A torch module, or a tuple of objects some of which are modules.
+
+    Returns:
+        int: Bytes of all parameters and buffers; 0 for objects that are not modules.
+
+    """
+    modules = obj if isinstance(obj, tuple) else (obj,)
+    values = [
+        value
+        for module in modules
+        if isinstance(module, torch.nn.Module)
+        for value in module.state_dict().values()
+    ]
+    sizes = {}
+    while values:
+        value = values.pop()
+        if isinstance(value, tuple | list):
+            values.extend(value)
+        elif isinstance(value, torch.Tensor):
+            sizes[value.device, value.data_ptr()] = value.numel() * value.element_size()
+    return sum(sizes.values())
+
+
+class ModelCache:
+    """
+    Loaded weights keyed by what they depend on, e.g. (checkpoint, dtype, device).
+
+    Loading the same key twice returns the same objects. When the weights of all entries exceed
+    `budget_bytes`, the least recently used entries other than the newest are evicted. An
+    evicted or released model stays alive while somebody still holds it; the cache only stops
+    keeping it alive. Users that should not pin the weights (like HFModel) call `get` whenever
+    they need them, so an evicted model is freed and loaded again on its next use.
+    """
+
+    def __init__(self, budget_bytes: int | None = None) -> None:
+        """
+        Initializes the ModelCache.
+
+        Args:
+            budget_bytes (int | None, optional): Memory budget of the cached weights. Defaults
+                to None (no limit).
+
+        """
+        self.budget_bytes = budget_bytes
+        self._entries: OrderedDict[Hashable, tuple[object, int]] = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes taken by all cached weights."""
+        with self._lock:
+            return sum(size for _, size in self._entries.values())
+
+    def get(self, key: Hashable, loader: Callable[[], T], *, count_hit: bool = True) -> T:
+        """
+        Returns the cached weights for the key, loading them on a miss.
+
+        Args:
+            key (Hashable): Everything the weights depend on.
+            loader (Callable[[], T]): Loads the weights.
+            count_hit (bool, optional): Count a hit in the metrics; off for repeated lookups
+                of weights already served. Defaults to True.
+
+        Returns:
+            T: What the loader returned for this key.
+
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                if count_hit:
+                    metrics.increment("model_cache_hits_total")
+                return self._entries[key][0]
+            metrics.increment("model_cache_misses_total")
+            value = loader()
+            self._entries[key] = (value, model_nbytes(value))
+            self._evict()
+            return value
+
+    def _evict(self) -> None:
+        if self.budget_bytes is None:
+            return
+        evicted = False
+        while len(self._entries) > 1 and self.nbytes > self.budget_bytes:
+            key, (_, size) = self._entries.popitem(last=False)
+            logger.info("Evicting model %s (%.1f MiB) from the model cache", key, size / 2**20)
+            evicted = True
+        if self.nbytes > self.budget_bytes:
+            logger.warning(
+                "Model %s alone exceeds the model cache budget (%.1f > %.1f MiB)",
+                next(iter(self._entries)),
+                self.nbytes / 2**20,
+                self.budget_bytes / 2**20,
+            )
+        if evicted:
+            _free_memory()
+
+    def release(self, key: Hashable) -> None:
+        """Forgets the weights of the key, if cached, and frees the memory nobody else holds."""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                _free_memory()
+
+    def take(self, key: Hashable) -> object | None:
+        """
+        Removes the weights of the key from the cache and returns them, e.g. to move them.
+
+        Args:
+            key (Hashable): Everything the weights depend on.
+
+        Returns:
+            object | None: The cached weights, or None if they are not cached.
+
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return None if entry is None else entry[0]
+
+    def clear(self) -> None:
+        """Forgets all weights."""
+        with self._lock:
+            self._entries.clear()
+            _free_memory()
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether the weights of the key are cached."""
+        return key in self._entries
+
+    def __len__(self) -> int:
+        """The number of cached entries."""
+        return len(self._entries)
+
+
+def _free_memory() -> None:
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+# Общий кэш процесса: одинаковые чекпойнты загружаются один раз
+model_cache = ModelCache()
@@ -0,0 +1,278 @@
+"""Client-side rate limiting, retries and adaptive concurrency for API models."""
+
+import logging
+import random
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import TypeVar
+
+from bugulma_enjoyers.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_SHARED_LIMITERS: dict[tuple, "RateLimiter"] = {}
+_SHARED_LOCK = threading.Lock()
+
+# Поля конфига, из которых собирается общий лимитер
+LIMIT_CONFIG_FIELDS = (
+    "api_requests_per_minute",
+    "api_tokens_per_minute",
+    "api_max_in_flight",
+    "api_max_retries",
+    "api_backoff_base",
+    "api_backoff_max",
+)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at a constant per-minute rate.
+
+    `acquire` reserves tokens immediately and sleeps off the deficit, so concurrent callers are
+    served in the order they arrived and the long-run rate never exceeds the quota.
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None) -> None:
+        """
+        Initializes the TokenBucket.
+
+        Args:
+            per_minute (float): Refill rate, e.g. the provider's requests- or tokens-per-minute.
+            capacity (float | None, optional): Maximum burst. Defaults to one minute of quota.
+
+        """
+        if per_minute <= 0:
+            msg = f"Rate must be positive, got {per_minute}"
+            raise ValueError(msg)
+        self.rate = per_minute / 60
+        self.capacity = per_minute if capacity is None else capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        Takes `amount` tokens, waiting for them if needed.
+
+        Args:
+            amount (float, optional): Tokens to take. Clamped to the capacity. Defaults to 1.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit.
+
+    The limit grows by about one slot per `limit` successful calls and is halved whenever the
+    provider throttles, converging to the highest concurrency the quota tolerates.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1) -> None:
+        """
+        Initializes the AdaptiveConcurrency.
+
+        Args:
+            maximum (int): Upper bound (and initial value) of the limit.
+            minimum (int, optional): Lower bound of the limit. Defaults to 1.
+
+        """
+        self.maximum = max(maximum, minimum)
+        self.minimum = minimum
+        self.limit = float(self.maximum)
+        self.active = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Holds one of the `limit` slots while the block runs."""
+        with self._condition:
+            while self.active >= int(self.limit):
+                self._condition.wait()
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.active -= 1
+                self._condition.notify_all()
+
+    def on_success(self) -> None:
+        """Additive increase."""
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def on_throttle(self) -> None:
+        """Multiplicative decrease."""
+        with self._condition:
+            self.limit = max(self.minimum, self.limit / 2)
+            logger.warning("Throttled by the API, concurrency limit lowered to %d", self.limit)
+
+
+class RateLimiter:
+    """
+    Everything an API call goes through: RPM/TPM buckets, concurrency limit and retries.
+
+    Retries use exponential backoff with full jitter. Limiters are meant to be shared by all
+    models using the same quota, see `RateLimiter.shared`.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ) -> None:
+        """
+        Initializes the RateLimiter.
+
+        Args:
+            requests_per_minute (float | None, optional): Request quota. Defaults to None (no
+                limit).
+            tokens_per_minute (float | None, optional): Token quota. Defaults to None (no limit).
+            max_concurrency (int, optional): Upper bound of concurrent calls. Defaults to 4.
+            max_retries (int, optional): Retries of a retryable error before giving up.
+                Defaults to 5.
+            backoff_base (float, optional): Backoff cap of the first retry, in seconds.
+                Defaults to 1.
+            backoff_max (float, optional): Maximum backoff, in seconds. Defaults to 60.
+
+        """
+        self.requests = None if requests_per_minute is None else TokenBucket(requests_per_minute)
+        self.tokens = None if tokens_per_minute is None else TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Лимитер общий для потоков, поэтому счётчики меняются под блокировкой
+        self.retries = 0
+        self.throttles = 0
+        self._stats_lock = threading.Lock()
+        # Метки метрик повторов и троттлинга и поля конфига, см. `RateLimiter.shared`
+        self.labels: dict[str, str] = {}
+        self.limits: dict[str, object] = {}
+
+    @classmethod
+    def shared(cls, key: tuple, config: object) -> "RateLimiter":
+        """
+        Returns the process-wide limiter for `key`, creating it from the pipeline config.
+
+        The quota belongs to the provider, so all models with the same key share the limiter
+        built from the first config; a later config with different limits only gets a warning.
+
+        Args:
+            key (tuple): Identifies the quota, e.g. (provider, model name).
+            config (object): A PipelineConfig with the `api_*` limits.
+
+        Returns:
+            RateLimiter: The limiter.
+
+        """
+        limits = {name: getattr(config, name) for name in LIMIT_CONFIG_FIELDS}
+        with _SHARED_LOCK:
+            limiter = _SHARED_LIMITERS.get(key)
+            if limiter is not None and limiter.limits != limits:
+                ignored = {
+                    name: value for name, value in limits.items() if limiter.limits[name] != value
+                }
+                logger.warning(
+                    "Rate limiter of %s is shared and keeps its limits %s; ignoring %s",
+                    key,
+                    limiter.limits,
+                    ignored,
+                )
+            if limiter is None:
+                _SHARED_LIMITERS[key] = cls(
+                    requests_per_minute=config.api_requests_per_minute,
+                    tokens_per_minute=config.api_tokens_per_minute,
+                    max_concurrency=config.api_max_in_flight,
+                    max_retries=config.api_max_retries,
+                    backoff_base=config.api_backoff_base,
+                    backoff_max=config.api_backoff_max,
+                )
+                _SHARED_LIMITERS[key].labels = {"model": str(key[0])}
+                _SHARED_LIMITERS[key].limits = limits
+            return _SHARED_LIMITERS[key]
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (zero-based) retry attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))  # noqa: S311
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        tokens: float,
+        is_retryable: Callable[[Exception], bool],
+        is_throttling: Callable[[Exception], bool],
+    ) -> T:
+        """
+        Calls `fn` within the limits, retrying retryable errors.
+
+        Args:
+            fn (Callable[[], T]): The API call.
+            tokens (float): Estimated tokens the call consumes.
+            is_retryable (Callable[[Exception], bool]): Whether an error is worth retrying.
+            is_throttling (Callable[[Exception], bool]): Whether an error means "slow down".
+
+        Returns:
+            T: The result of `fn`.
+
+        Raises:
+            Exception: The last error, if it is not retryable or retries are exhausted.
+
+        """
+        attempt = 0
+        while True:
+            if self.requests is not None:
+                self.requests.acquire(1)
+            if self.tokens is not None:
+                self.tokens.acquire(tokens)
+            with self.concurrency.slot():
+                try:
+                    result = fn()
+                except Exception as exc:
+                    if is_throttling(exc):
+                        with self._stats_lock:
+                            self.throttles += 1
+                        metrics.increment("api_throttles_total", **self.labels)
+                        self.concurrency.on_throttle()
+                    if attempt >= self.max_retries or not is_retryable(exc):
+                        raise
+                    error = exc
+                else:
+                    self.concurrency.on_success()
+                    return result
+            delay = self.backoff(attempt)
+            attempt += 1
+            with self._stats_lock:
+                self.retries += 1
+            metrics.increment("api_retries_total", **self.labels)
+            logger.warning(
+                "Retryable API error (%s), retry %d/%d in %.1fs",
+                error,
+                attempt,
+                self.max_retries,
+                delay,
+            )
+            time.sleep(delay)
@@ -3,22 +3,24 @@ import os
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 from bugulma_enjoyers.models._api_model import APIModel
 
 NON_45_HTTP_ERROR = "Error: {}, response text: {}"
 
+YANDEX_COMPLETION_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
 
-def ask_yandex_utf8(
-    user_text,
-    api_key,
-    cloud_folder,
-    model_name,
-    system_role="Ты — умный ассистент.",
-    timeout=60,
-):
-    url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
 
+def _yandex_request(
+    user_text: str,
+    api_key: str,
+    cloud_folder: str,
+    model_name: str,
+    system_role: str,
+    max_tokens: int = 1000,
+) -> tuple[dict, bytes]:
+    """Builds headers and the UTF-8 encoded body of a completion request."""
     headers = {
         "Content-Type": "application/json; charset=utf-8",
         "Authorization": f"Api-Key {api_key}",
@@ -27,14 +29,36 @@ def ask_yandex_utf8(
 
     prompt = {
         "modelUri": f"gpt://{cloud_folder}/{model_name}",
-        "completionOptions": {"stream": False, "temperature": 0.6, "maxTokens": 1000},
+        "completionOptions": {"stream": False, "temperature": 0.6, "maxTokens": max_tokens},
         "messages": [{"role": "system", "text": system_role}, {"role": "user", "text": user_text}],
     }
 
     # Кодируем в UTF-8 вручную, чтобы не было ошибок с кириллицей
-    data_payload = json.dumps(prompt, ensure_ascii=False).encode("utf-8")
+    return headers, json.dumps(prompt, ensure_ascii=False).encode("utf-8")
 
-    response = requests.post(url, headers=headers, data=data_payload, timeout=timeout)
+
+def ask_yandex_utf8(
+    user_text,
+    api_key,
+    cloud_folder,
+    model_name,
+    system_role="Ты — умный ассистент.",
+    timeout=60,
+    session: requests.Session | None = None,
+    max_tokens: int = 1000,
+):
+    headers, data_payload = _yandex_request(
+        user_text,
+        api_key,
+        cloud_folder,
+        model_name,
+        system_role,
+        max_tokens,
+    )
+
+    # Сессия переиспользует TCP/TLS-соединения между запросами
+    post = requests.post if session is None else session.post
+    response = post(YANDEX_COMPLETION_URL, headers=headers, data=data_payload, timeout=timeout)
 
     response.raise_for_status()
 
@@ -47,17 +71,34 @@ def ask_yandex_utf8(
 
 
 class YandexModel(APIModel, model_type="yandex"):
+    # Токенизатор YandexGPT обучен на кириллице
+    chars_per_token = 3.5
+
     def __init__(self, model_name: str, pipeline_config: dict, **kwargs: dict) -> None:
         super().__init__(model_name, pipeline_config)
         load_dotenv()
-        self.model_name = model_name
         self.api_key = os.getenv("YANDEX_API_KEY")
         self.cloud_folder = os.getenv("YANDEX_CLOUD_FOLDER")
 
-    def invoke_model(self, input_: str) -> str:
+        self.pool_size = pipeline_config.api_pool_size
+        self.timeout = (pipeline_config.api_connect_timeout, pipeline_config.api_read_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount("https://", adapter)
+
+    def invoke_model(self, input_: str, max_output_tokens: int | None = None) -> str:
         return ask_yandex_utf8(
             user_text=input_,
             api_key=self.api_key,
             cloud_folder=self.cloud_folder,
             model_name=self.model_name,
+            timeout=self.timeout,
+            session=self.session,
+            max_tokens=max_output_tokens or 1000,
         )
+
+    def close(self) -> None:
+        """Releases the cached prompt prefixes and closes the pooled HTTP session."""
+        super().close()
+        self.session.close()
@@ -0,0 +1,262 @@
+"""Multi-stage detoxification runner with checkpointing and overlapped stages."""
+
+import queue
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+
+from bugulma_enjoyers.detoxifiers import BaseDetoxifier
+from bugulma_enjoyers.io import RunJournal
+from bugulma_enjoyers.metrics import metrics
+
+# Как часто заблокированные очереди проверяют флаг остановки, секунды
+_POLL_INTERVAL = 0.1
+
+
+@dataclass
+class Stage:
+    """
+    A named step of the pipeline; the name identifies its rows in the journal.
+
+    If `escalate` is set, it is called with the original texts and the outputs of the stage,
+    and only the rows it returns True for go on to the next stages; the outputs of the other
+    rows are final. It is ignored for the last stage.
+
+    With `release_when_done`, the models of the detoxifier are freed as soon as the stage has
+    processed the last chunk, e.g. to make room for the next stage.
+    """
+
+    name: str
+    detoxifier: BaseDetoxifier
+    escalate: Callable[[list[str], list[str]], list[bool]] | None = None
+    release_when_done: bool = False
+
+
+@dataclass
+class _Chunk:
+    ids: list
+    texts: list[str]
+    # Строки, которые ещё проходят через стадии, и их текущие тексты
+    rows: list[int]
+    languages: list[str]
+    current: list[str]
+    # Окончательные результаты строк, выбывших из пайплайна
+    done: list[str]
+
+    @property
+    def row_ids(self) -> list:
+        return [self.ids[idx] for idx in self.rows]
+
+    def keep(self, mask: list[bool]) -> None:
+        """Finalizes the rows that are not kept."""
+        for idx, text, kept in zip(self.rows, self.current, mask, strict=True):
+            if not kept:
+                self.done[idx] = text
+        self.rows, self.languages, self.current = (
+            [value for value, kept in zip(values, mask, strict=True) if kept]
+            for values in (self.rows, self.languages, self.current)
+        )
+
+    def results(self) -> list[str]:
+        results = list(self.done)
+        for idx, text in zip(self.rows, self.current, strict=True):
+            results[idx] = text
+        return results
+
+
+def _make_chunk(
+    ids: list,
+    texts: list[str],
+    language: str,
+    gate: Callable[[list[str]], list[bool]] | None,
+) -> _Chunk:
+    rows = list(range(len(texts)))
+    chunk = _Chunk(ids, texts, rows, [language] * len(texts), texts, list(texts))
+    if gate is not None and texts:
+        chunk.keep(gate(texts))
+    return chunk
+
+
+def _advance(
+    journal: RunJournal | None,
+    stage: Stage,
+    chunk: _Chunk,
+    *,
+    last: bool = False,
+) -> None:
+    chunk.current = run_stage(journal, stage, chunk.row_ids, chunk.current, chunk.languages)
+    if stage.escalate is not None and not last and chunk.rows:
+        chunk.keep(stage.escalate([chunk.texts[idx] for idx in chunk.rows], chunk.current))
+
+
+class _Done:
+    """Marks the end of a stage's output."""
+
+
+class _Failure:
+    """Carries an exception of an upstream stage to the consumer."""
+
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+def run_stage(
+    journal: RunJournal | None,
+    stage: Stage,
+    ids: list,
+    texts: list[str],
+    languages: list[str],
+) -> list[str]:
+    """
+    Runs a stage on the rows the journal has no results for, and journals them.
+
+    Args:
+        journal (RunJournal | None): The checkpoint journal, or None to run every row.
+        stage (Stage): The stage.
+        ids (list): Row IDs.
+        texts (list[str]): Inputs of the stage.
+        languages (list[str]): Languages of the rows.
+
+    Returns:
+        list[str]: Outputs of the stage.
+
+    """
+    results = [None] * len(texts) if journal is None else journal.lookup(stage.name, ids, texts)
+    todo = [idx for idx, result in enumerate(results) if result is None]
+    if todo:
+        with metrics.scope(stage=stage.name):
+            outputs = stage.detoxifier.detoxify_batch(
+                [texts[idx] for idx in todo],
+                [languages[idx] for idx in todo],
+            )
+        if journal is not None:
+            journal.record(
+                stage.name,
+                [ids[idx] for idx in todo],
+                [texts[idx] for idx in todo],
+                outputs,
+            )
+        for idx, output in zip(todo, outputs, strict=True):
+            results[idx] = output
+    return results
+
+
+def _finish(stage: Stage) -> None:
+    """Called once the stage has processed all chunks."""
+    if stage.release_when_done:
+        stage.detoxifier.release()
+
+
+def _put(outbox: queue.Queue, item: object, stop: threading.Event) -> None:
+    """Blocks until the item is queued (backpressure) or the pipeline is stopped."""
+    while not stop.is_set():
+        try:
+            outbox.put(item, timeout=_POLL_INTERVAL)
+        except queue.Full:
+            continue
+        return
+
+
+def _drain(inbox: queue.Queue) -> Iterator[_Chunk]:
+    """Yields chunks until the upstream stage is done, re-raising its failure."""
+    while True:
+        item = inbox.get()
+        if isinstance(item, _Done):
+            return
+        if isinstance(item, _Failure):
+            raise item.exc
+        yield item
+
+
+def _run_worker(
+    stage: Stage,
+    inbox: Iterable[_Chunk],
+    outbox: queue.Queue,
+    journal: RunJournal | None,
+    stop: threading.Event,
+) -> None:
+    try:
+        for chunk in inbox:
+            if stop.is_set():
+                return
+            _advance(journal, stage, chunk)
+            _put(outbox, chunk, stop)
+        _finish(stage)
+    except BaseException as exc:
+        _put(outbox, _Failure(exc), stop)
+        return
+    _put(outbox, _Done(), stop)
+
+
+def run_pipeline(  # noqa: PLR0913, PLR0917
+    chunks: Iterable[tuple[list, list[str]]],
+    stages: list[Stage],
+    journal: RunJournal | None = None,
+    language: str = "tt",
+    queue_size: int = 2,
+    gate: Callable[[list[str]], list[bool]] | None = None,
+    *,
+    overlap: bool = True,
+) -> Iterator[tuple[list, list[str], list[str]]]:
+    """
+    Runs chunks of rows through the stages, one after another.
+
+    With `overlap`, every stage but the last runs in its own thread and hands finished chunks to
+    the next stage through a bounded queue. A CPU-bound stage can then work on chunk `n + 1`
+    while a network-bound one is busy with chunk `n`, and end-to-end time approaches that of
+    the slowest stage instead of the sum. Each stage processes chunks in order, so chunks come
+    out in input order. When a queue is full, the upstream stage waits (backpressure).
+
+    Args:
+        chunks (Iterable[tuple[list, list[str]]]): (ids, texts) chunks, e.g. from `iter_input`.
+        stages (list[Stage]): The stages.
+        journal (RunJournal | None, optional): Checkpoint journal. Defaults to None.
+        language (str, optional): Language of all texts. Defaults to "tt".
+        queue_size (int, optional): Finished chunks a stage may get ahead of the next one.
+            Defaults to 2.
+        gate (Callable[[list[str]], list[bool]] | None, optional): Tells which input texts
+            need detoxification, e.g. a ToxicityGate; the rest skip all stages and are output
+            unchanged. Defaults to None, which sends every row through.
+        overlap (bool, optional): Run the stages concurrently. Defaults to True.
+
+    Yields:
+        tuple[list, list[str], list[str]]: IDs, input texts and final results of every chunk.
+
+    """
+    # Генератор потребляется первой стадией, так что гейт работает в её потоке
+    work = (_make_chunk(ids, texts, language, gate) for ids, texts in chunks)
+    if not overlap or len(stages) < 2:  # noqa: PLR2004
+        for chunk in work:
+            for idx, stage in enumerate(stages):
+                _advance(journal, stage, chunk, last=idx == len(stages) - 1)
+            yield chunk.ids, chunk.texts, chunk.results()
+        for stage in stages:
+            _finish(stage)
+        return
+
+    stop = threading.Event()
+    threads = []
+    inbox: Iterable[_Chunk] = work
+    for stage in stages[:-1]:
+        outbox = queue.Queue(maxsize=queue_size)
+        thread = threading.Thread(
+            target=_run_worker,
+            args=(stage, inbox, outbox, journal, stop),
+            name=f"stage-{stage.name}",
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+        inbox = _drain(outbox)
+
+    final_stage = stages[-1]
+    try:
+        for chunk in inbox:
+            _advance(journal, final_stage, chunk, last=True)
+            yield chunk.ids, chunk.texts, chunk.results()
+        _finish(final_stage)
+    finally:
+        # Останавливаем верхние стадии, если потребитель прервался
+        stop.set()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,12 @@
+from bugulma_enjoyers.scorers.cascade import CascadeGate
+from bugulma_enjoyers.scorers.fluency import FluencyScorer
+from bugulma_enjoyers.scorers.similarity import SimilarityScorer
+from bugulma_enjoyers.scorers.toxicity import ToxicityGate, ToxicityScorer
+
+__all__ = [
+    "CascadeGate",
+    "FluencyScorer",
+    "SimilarityScorer",
+    "ToxicityGate",
+    "ToxicityScorer",
+]
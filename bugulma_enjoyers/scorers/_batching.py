@@ -0,0 +1,36 @@
+"""Length-sorted batching shared by the scorers."""
+
+from collections.abc import Iterator
+
+from bugulma_enjoyers.datasets.sampler import BucketBatchSampler
+
+# Префикс HF-моделей в именах из PipelineConfig
+HF_PREFIX = "hf/"
+
+
+def iter_sorted_batches(
+    tokenizer: object,
+    texts: list[str],
+    batch_size: int,
+    max_length: int,
+) -> Iterator[tuple[list[int], dict]]:
+    """
+    Tokenizes texts once and yields them in batches of similar length, padded per batch.
+
+    Args:
+        tokenizer (object): A HuggingFace tokenizer.
+        texts (list[str]): The texts.
+        batch_size (int): Texts per batch.
+        max_length (int): Texts are truncated to this many tokens.
+
+    Yields:
+        tuple[list[int], dict]: Indices of the batch texts and the padded model inputs.
+
+    """
+    if not texts:
+        return
+    input_ids = tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+    sampler = BucketBatchSampler([len(ids) for ids in input_ids], [""] * len(texts), batch_size)
+    for indices in sampler:
+        batch = [input_ids[idx] for idx in indices]
+        yield indices, tokenizer.pad({"input_ids": batch}, return_tensors="pt")
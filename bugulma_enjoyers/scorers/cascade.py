@@ -0,0 +1,61 @@
+"""Quality gate that decides which outputs of a stage go on to the next one."""
+
+import logging
+
+from bugulma_enjoyers.scorers.similarity import SimilarityScorer
+from bugulma_enjoyers.scorers.toxicity import ToxicityScorer
+
+logger = logging.getLogger(__name__)
+
+
+class CascadeGate:
+    """
+    Escalates a row to the next (more expensive) detoxifier only if its output is not good yet.
+
+    An output is good when it is no longer toxic and still close enough to its source.
+    """
+
+    def __init__(
+        self,
+        toxicity: ToxicityScorer,
+        similarity: SimilarityScorer,
+        toxicity_threshold: float = 0.5,
+        similarity_threshold: float = 0.7,
+    ) -> None:
+        """
+        Initializes the CascadeGate.
+
+        Args:
+            toxicity (ToxicityScorer): The toxicity classifier.
+            similarity (SimilarityScorer): The sentence encoder.
+            toxicity_threshold (float, optional): Outputs scoring at least this are still toxic.
+                Defaults to 0.5.
+            similarity_threshold (float, optional): Outputs less similar to their sources than
+                this have lost the meaning. Defaults to 0.7.
+
+        """
+        self.toxicity = toxicity
+        self.similarity = similarity
+        self.toxicity_threshold = toxicity_threshold
+        self.similarity_threshold = similarity_threshold
+
+    def __call__(self, sources: list[str], outputs: list[str]) -> list[bool]:
+        """
+        Decides which rows need the next stage.
+
+        Args:
+            sources (list[str]): The original texts.
+            outputs (list[str]): The outputs of the stage.
+
+        Returns:
+            list[bool]: Whether every row needs the next stage.
+
+        """
+        toxicity = self.toxicity.score(outputs)
+        similarity = self.similarity.similarity(sources, outputs)
+        escalate = [
+            tox >= self.toxicity_threshold or sim < self.similarity_threshold
+            for tox, sim in zip(toxicity, similarity, strict=True)
+        ]
+        logger.info("Cascade: %d of %d rows go to the next stage", sum(escalate), len(outputs))
+        return escalate
@@ -0,0 +1,99 @@
+"""Fluency of outputs as judged by a COMET-style quality estimation model (xCOMET)."""
+
+import logging
+from typing import Self
+
+from bugulma_enjoyers.scorers._batching import HF_PREFIX
+
+logger = logging.getLogger(__name__)
+
+COMET_NOT_INSTALLED = (
+    "Fluency scoring needs the COMET package: pip install unbabel-comet "
+    "(or disable fluency scoring)"
+)
+
+
+class FluencyScorer:
+    """
+    Reference-free quality of (source, output) pairs in [0, 1].
+
+    Wraps a COMET model, i.e. anything with `predict(samples, batch_size=..., gpus=...)`
+    returning an object with `.scores`. Samples are sorted by length before prediction.
+    """
+
+    def __init__(
+        self,
+        model: object,
+        batch_size: int = 64,
+        gpus: int = 0,
+        name: str | None = None,
+    ) -> None:
+        """
+        Initializes the FluencyScorer.
+
+        Args:
+            model (object): The COMET model.
+            batch_size (int, optional): Pairs per forward pass. Defaults to 64.
+            gpus (int, optional): GPUs COMET may use. Defaults to 0.
+            name (str | None, optional): Model name, identifies scores in on-disk caches.
+                Defaults to None.
+
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.gpus = gpus
+        self.name = name
+
+    @classmethod
+    def from_pretrained(
+        cls,
+        model_name: str,
+        device: str = "cpu",
+        batch_size: int = 64,
+    ) -> Self:
+        """
+        Downloads and loads a COMET checkpoint.
+
+        Args:
+            model_name (str): Model name, optionally with the "hf/" prefix used in the configs.
+            device (str, optional): "cuda" to run on one GPU. Defaults to "cpu".
+            batch_size (int, optional): Pairs per forward pass. Defaults to 64.
+
+        Returns:
+            FluencyScorer: The scorer.
+
+        Raises:
+            ImportError: If the COMET package is not installed.
+
+        """
+        try:
+            from comet import download_model, load_from_checkpoint  # noqa: PLC0415
+        except ImportError as exc:
+            raise ImportError(COMET_NOT_INSTALLED) from exc
+
+        model_name = model_name.removeprefix(HF_PREFIX)
+        logger.info("Loading fluency model: %s", model_name)
+        model = load_from_checkpoint(download_model(model_name))
+        return cls(model, batch_size=batch_size, gpus=int(device == "cuda"), name=model_name)
+
+    def score(self, sources: list[str], outputs: list[str]) -> list[float]:
+        """
+        Scores (source, output) pairs.
+
+        Args:
+            sources (list[str]): The original texts.
+            outputs (list[str]): The detoxified texts.
+
+        Returns:
+            list[float]: Fluency of every output.
+
+        """
+        if not outputs:
+            return []
+        order = sorted(range(len(outputs)), key=lambda idx: len(outputs[idx]), reverse=True)
+        samples = [{"src": sources[idx], "mt": outputs[idx]} for idx in order]
+        predicted = self.model.predict(samples, batch_size=self.batch_size, gpus=self.gpus).scores
+        scores = [0.0] * len(outputs)
+        for idx, score in zip(order, predicted, strict=True):
+            scores[idx] = float(score)
+        return scores
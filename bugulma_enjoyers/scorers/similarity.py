@@ -0,0 +1,138 @@
+"""Batched sentence embeddings (LaBSE) and cosine similarity of text pairs."""
+
+import logging
+from typing import Self
+
+import torch
+
+from bugulma_enjoyers.scorers._batching import HF_PREFIX, iter_sorted_batches
+
+logger = logging.getLogger(__name__)
+
+
+class SimilarityScorer:
+    """
+    Cosine similarity of normalized sentence embeddings.
+
+    A SentenceTransformer (passed without a tokenizer) embeds with its own pooling and
+    normalization, as the reference SIM metric does. A plain HuggingFace encoder uses its
+    pooler output, or is mean-pooled over the attention mask if it has no pooler.
+    """
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        tokenizer: object | None = None,
+        batch_size: int = 64,
+        max_length: int = 256,
+        name: str | None = None,
+    ) -> None:
+        """
+        Initializes the SimilarityScorer.
+
+        Args:
+            model (torch.nn.Module): A SentenceTransformer or a HuggingFace encoder.
+            tokenizer (object | None, optional): The tokenizer of a HuggingFace encoder; None
+                for a SentenceTransformer. Defaults to None.
+            batch_size (int, optional): Texts per forward pass. Defaults to 64.
+            max_length (int, optional): Texts are truncated to this many tokens. Defaults to 256.
+            name (str | None, optional): Model name, identifies scores in on-disk caches.
+                Defaults to None.
+
+        """
+        self.model = model.eval()
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.name = name
+
+    @classmethod
+    def from_pretrained(
+        cls,
+        model_name: str,
+        device: str = "cpu",
+        batch_size: int = 64,
+        max_length: int = 256,
+    ) -> Self:
+        """
+        Loads a SentenceTransformer, e.g. LaBSE.
+
+        Args:
+            model_name (str): Model name, optionally with the "hf/" prefix used in the configs.
+            device (str, optional): The device to run the model on. Defaults to "cpu".
+            batch_size (int, optional): Texts per forward pass. Defaults to 64.
+            max_length (int, optional): Texts are truncated to this many tokens. Defaults to 256.
+
+        Returns:
+            SimilarityScorer: The scorer.
+
+        """
+        from sentence_transformers import SentenceTransformer  # noqa: PLC0415
+
+        model_name = model_name.removeprefix(HF_PREFIX)
+        logger.info("Loading sentence encoder: %s", model_name)
+        model = SentenceTransformer(model_name, device=device)
+        model.max_seq_length = max_length
+        return cls(model, batch_size=batch_size, max_length=max_length, name=model_name)
+
+    def embed(self, texts: list[str]) -> torch.Tensor:
+        """
+        Embeds texts.
+
+        Args:
+            texts (list[str]): The texts.
+
+        Returns:
+            torch.Tensor: L2-normalized embeddings, one row per text, on the CPU.
+
+        """
+        if not texts:
+            return torch.empty(0, 0)
+        if self.tokenizer is None:
+            # Пулинг и нормализация SentenceTransformer, как в эталонной метрике SIM
+            embeddings = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                normalize_embeddings=True,
+                convert_to_tensor=True,
+            )
+            return embeddings.float().cpu()
+        embeddings = [None] * len(texts)
+        batches = iter_sorted_batches(self.tokenizer, texts, self.batch_size, self.max_length)
+        with torch.inference_mode():
+            for indices, batch in batches:
+                outputs = self.model(**batch.to(self.model.device))
+                pooled = getattr(outputs, "pooler_output", None)
+                if pooled is None:
+                    mask = batch["attention_mask"].unsqueeze(-1).to(outputs.last_hidden_state)
+                    pooled = (outputs.last_hidden_state * mask).sum(1) / mask.sum(1)
+                pooled = torch.nn.functional.normalize(pooled.float(), dim=-1).cpu()
+                for idx, embedding in zip(indices, pooled, strict=True):
+                    embeddings[idx] = embedding
+        return torch.stack(embeddings)
+
+    def similarity(self, sources: list[str], targets: list[str]) -> list[float]:
+        """
+        Scores text pairs.
+
+        Both sides are embedded in a single pass, so equal texts are encoded once.
+
+        Args:
+            sources (list[str]): The first text of every pair.
+            targets (list[str]): The second text of every pair.
+
+        Returns:
+            list[float]: Cosine similarity of every pair.
+
+        """
+        if len(sources) != len(targets):
+            msg = "sources and targets must have the same size"
+            raise ValueError(msg)
+        if not sources:
+            return []
+        unique = list(dict.fromkeys([*sources, *targets]))
+        position = {text: idx for idx, text in enumerate(unique)}
+        embeddings = self.embed(unique)
+        left = embeddings[[position[text] for text in sources]]
+        right = embeddings[[position[text] for text in targets]]
+        return (left * right).sum(dim=-1).tolist()
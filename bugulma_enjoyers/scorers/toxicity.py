@@ -0,0 +1,142 @@
+"""Batched toxicity classifier and the gate that lets non-toxic rows skip detoxification."""
+
+import logging
+from typing import Self
+
+import torch
+
+from bugulma_enjoyers.scorers._batching import HF_PREFIX, iter_sorted_batches
+
+logger = logging.getLogger(__name__)
+
+
+def _toxic_label(model_config: object) -> int:
+    """Index of the "toxic" class; the last class if the labels are not named."""
+    for idx, label in model_config.id2label.items():
+        if str(label).lower() == "toxic":
+            return int(idx)
+    return model_config.num_labels - 1
+
+
+class ToxicityScorer:
+    """
+    Probability of the "toxic" class of a sequence classifier, for many texts at once.
+
+    Texts are tokenized once, sorted by length and padded per batch, so a batch costs about as
+    much as its real tokens.
+    """
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        tokenizer: object,
+        batch_size: int = 64,
+        max_length: int = 256,
+        name: str | None = None,
+    ) -> None:
+        """
+        Initializes the ToxicityScorer.
+
+        Args:
+            model (torch.nn.Module): A sequence classification model.
+            tokenizer (object): Its tokenizer.
+            batch_size (int, optional): Texts per forward pass. Defaults to 64.
+            max_length (int, optional): Texts are truncated to this many tokens. Defaults to 256.
+            name (str | None, optional): Model name, identifies scores in on-disk caches.
+                Defaults to None.
+
+        """
+        self.model = model.eval()
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.name = name
+        self.toxic_label = _toxic_label(model.config)
+
+    @classmethod
+    def from_pretrained(
+        cls,
+        model_name: str,
+        device: str = "cpu",
+        batch_size: int = 64,
+        max_length: int = 256,
+    ) -> Self:
+        """
+        Loads a HuggingFace classifier.
+
+        Args:
+            model_name (str): Model name, optionally with the "hf/" prefix used in the configs.
+            device (str, optional): The device to run the model on. Defaults to "cpu".
+            batch_size (int, optional): Texts per forward pass. Defaults to 64.
+            max_length (int, optional): Texts are truncated to this many tokens. Defaults to 256.
+
+        Returns:
+            ToxicityScorer: The scorer.
+
+        """
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer  # noqa: PLC0415
+
+        model_name = model_name.removeprefix(HF_PREFIX)
+        logger.info("Loading toxicity classifier: %s", model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        return cls(
+            model,
+            tokenizer,
+            batch_size=batch_size,
+            max_length=max_length,
+            name=model_name,
+        )
+
+    def score(self, texts: list[str]) -> list[float]:
+        """
+        Scores texts.
+
+        Args:
+            texts (list[str]): The texts.
+
+        Returns:
+            list[float]: Probability of every text being toxic.
+
+        """
+        scores = [0.0] * len(texts)
+        batches = iter_sorted_batches(self.tokenizer, texts, self.batch_size, self.max_length)
+        with torch.inference_mode():
+            for indices, batch in batches:
+                logits = self.model(**batch.to(self.model.device)).logits
+                probs = logits.float().softmax(dim=-1)[:, self.toxic_label].tolist()
+                for idx, prob in zip(indices, probs, strict=True):
+                    scores[idx] = prob
+        return scores
+
+
+class ToxicityGate:
+    """Tells which texts are toxic enough to be worth detoxifying."""
+
+    def __init__(self, scorer: ToxicityScorer, threshold: float = 0.5) -> None:
+        """
+        Initializes the ToxicityGate.
+
+        Args:
+            scorer (ToxicityScorer): The classifier.
+            threshold (float, optional): Texts scoring below it are left as they are.
+                Defaults to 0.5.
+
+        """
+        self.scorer = scorer
+        self.threshold = threshold
+
+    def __call__(self, texts: list[str]) -> list[bool]:
+        """
+        Decides which texts need detoxification.
+
+        Args:
+            texts (list[str]): The texts.
+
+        Returns:
+            list[bool]: Whether every text needs detoxification.
+
+        """
+        needed = [score >= self.threshold for score in self.scorer.score(texts)]
+        logger.info("Toxicity gate: %d of %d rows need detoxification", sum(needed), len(texts))
+        return needed
@@ -0,0 +1,94 @@
+"""Evaluation entrypoint for BugulmaEnjoyers: STA, SIM, FL and J of an output TSV."""
+
+import json
+import logging
+from pathlib import Path
+
+import click
+
+from bugulma_enjoyers.detoxifiers import PipelineConfig
+from bugulma_enjoyers.detoxifiers.base import xcomet_model_name
+from bugulma_enjoyers.evaluation import Evaluator
+from bugulma_enjoyers.io import read_input
+from bugulma_enjoyers.scorers import FluencyScorer, SimilarityScorer, ToxicityScorer
+from bugulma_enjoyers.setup_logging import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+@click.option("--verbose", "-v", count=True, default=False)
+@click.option("--quiet", "-q", count=True, default=False)
+@click.option("--file", "-f", help="Output TSV to evaluate.", default="dev_outputs.tsv")
+@click.option("--source-column", help="Column with the original texts.", default="tat_toxic")
+@click.option("--output-column", help="Column with the detoxified texts.", default="tat_detox1")
+@click.option("--report", "-r", help="Write the mean scores to this JSON file.", default=None)
+@click.option("--scores", help="Write per-row scores to this TSV file.", default=None)
+@click.option("--batch-size", help="Batch size of the scoring models.", default=64)
+@click.option(
+    "--fluency/--no-fluency",
+    help="Score fluency with xCOMET; skipped with a warning without the 'fluency' extra.",
+    default=True,
+)
+@click.option("--cache/--no-cache", help="Reuse scores and embeddings of past runs.", default=True)
+@click.command()
+def main(  # noqa: PLR0913, PLR0917
+    file: str = "dev_outputs.tsv",
+    source_column: str = "tat_toxic",
+    output_column: str = "tat_detox1",
+    report: str | None = None,
+    scores: str | None = None,
+    batch_size: int = 64,
+    verbose: int = 0,
+    quiet: int = 0,
+    fluency: bool = True,  # noqa: FBT002
+    cache: bool = True,  # noqa: FBT002
+) -> None:
+    """Evaluation entrypoint for BugulmaEnjoyers."""
+    setup_logging(verbose - quiet + 1)
+    config = PipelineConfig()
+    sources = [str(text) for text in read_input(file, column=source_column)]
+    outputs = [str(text) for text in read_input(file, column=output_column)]
+
+    fluency_scorer = None
+    if fluency:
+        try:
+            fluency_scorer = FluencyScorer.from_pretrained(
+                xcomet_model_name,
+                device=config.device,
+                batch_size=batch_size,
+            )
+        except ImportError as exc:
+            logger.warning("Skipping FL: %s", exc)
+
+    cache_path = config.cache_path("evaluation") if cache else None
+    evaluator = Evaluator(
+        toxicity=ToxicityScorer.from_pretrained(
+            config.toxicity_detector_model_name,
+            device=config.device,
+            batch_size=batch_size,
+        ),
+        similarity=SimilarityScorer.from_pretrained(
+            config.similarity_model_name,
+            device=config.device,
+            batch_size=batch_size,
+        ),
+        fluency=fluency_scorer,
+        cache_path=None if cache_path is None else cache_path / "scores.sqlite",
+    )
+    try:
+        if scores is None:
+            summary = evaluator.evaluate(sources, outputs)
+        else:
+            per_row = evaluator.score(sources, outputs)
+            per_row.to_csv(scores, sep="\t", index_label="ID", encoding="utf-8")
+            summary = evaluator.summarize(per_row)
+    finally:
+        evaluator.close()
+
+    if report is not None:
+        Path(report).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    click.echo(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
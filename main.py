@@ -2,12 +2,49 @@
 
 import click
 
+from bugulma_enjoyers.constants import INFERENCE_BACKENDS, QUANTIZATION_MODES
+
 # from bugulma_enjoyers.detoxifiers import TheOneAndSuperDetoxifierWeFinallySelected # noqa: ERA001
-from bugulma_enjoyers.detoxifiers import PipelineConfig, StandaloneDetoxifier
-from bugulma_enjoyers.io import read_input, write_output
+from bugulma_enjoyers.detoxifiers import (
+    BaseDetoxifier,
+    CachingDetoxifier,
+    DedupDetoxifier,
+    PipelineConfig,
+    StandaloneDetoxifier,
+)
+from bugulma_enjoyers.detoxifiers.worker_pool import default_threads_per_worker
+from bugulma_enjoyers.generation import default_generation_policies
+from bugulma_enjoyers.io import OutputWriter, RunJournal, iter_input
+from bugulma_enjoyers.metrics import JSONLinesSink, PrometheusTextfileSink, metrics
+from bugulma_enjoyers.models import model_cache
+from bugulma_enjoyers.pipeline import Stage, run_pipeline
+from bugulma_enjoyers.scorers import (
+    CascadeGate,
+    SimilarityScorer,
+    ToxicityGate,
+    ToxicityScorer,
+)
 from bugulma_enjoyers.setup_logging import setup_logging
 
 
+def wrap_detoxifier(
+    detoxifier: BaseDetoxifier,
+    config: PipelineConfig,
+    *,
+    cache: bool,
+    dedup: bool,
+) -> BaseDetoxifier:
+    """Wraps the detoxifier into a persistent result cache and input deduplication, if enabled."""
+    if cache:
+        cache_path = config.cache_path("results")
+        detoxifier = CachingDetoxifier(
+            detoxifier,
+            db_path=None if cache_path is None else cache_path / "results.sqlite",
+        )
+    # Дедупликация снаружи кэша: в кэш попадает по одной строке из группы почти-дубликатов
+    return DedupDetoxifier(detoxifier) if dedup else detoxifier
+
+
 @click.option("--verbose", "-v", count=True, default=False)
 @click.option("--quiet", "-q", count=True, default=False)
 @click.option("--file", "-f", help="File to read.", default="dev_inputs.tsv")
@@ -20,6 +57,129 @@ from bugulma_enjoyers.setup_logging import setup_logging
 @click.option(
     "--detoxifier-2", help="Second detoxifier model name.", default="google/models/gemini-2.5-pro",
 )
+@click.option(
+    "--api-max-in-flight",
+    help="Max concurrent requests for API detoxifiers.",
+    default=4,
+)
+@click.option(
+    "--api-requests-per-minute",
+    help="Request quota of API detoxifiers.",
+    type=float,
+    default=None,
+)
+@click.option(
+    "--api-tokens-per-minute",
+    help="Token quota of API detoxifiers.",
+    type=float,
+    default=None,
+)
+@click.option(
+    "--api-max-input-tokens",
+    help="Pack batches of API detoxifiers by this prompt token budget instead of batch size.",
+    type=int,
+    default=None,
+)
+@click.option(
+    "--api-max-output-tokens",
+    help="Answer token limit sent to API detoxifiers; no limit by default.",
+    type=int,
+    default=None,
+)
+@click.option(
+    "--api-max-batch-rows",
+    help="Row limit of batches packed by --api-max-input-tokens.",
+    default=PipelineConfig.api_max_batch_rows,
+)
+@click.option("--chunk-size", help="Rows read, processed and written at a time.", default=256)
+@click.option(
+    "--overlap/--no-overlap",
+    help="Run stage 1 on the next chunk during stage 2.",
+    default=True,
+)
+@click.option("--queue-size", help="Chunks stage 1 may get ahead of stage 2.", default=2)
+@click.option("--journal", help="Checkpoint journal. Defaults to <output>.journal.", default=None)
+@click.option("--resume", help="Skip rows finished by a previous run.", is_flag=True)
+@click.option(
+    "--cache/--no-cache",
+    help="Store results on disk and reuse them in later runs with the same models.",
+    default=False,
+)
+@click.option(
+    "--dedup/--no-dedup",
+    help="Detoxify texts repeated up to mentions/URLs once.",
+    default=False,
+)
+@click.option(
+    "--toxicity-gate/--no-toxicity-gate",
+    help="Leave rows the toxicity classifier deems non-toxic unchanged (loads the classifier).",
+    default=False,
+)
+@click.option(
+    "--toxicity-threshold",
+    help="Toxicity probability to detoxify at.",
+    default=PipelineConfig.toxicity_threshold,
+)
+@click.option(
+    "--cascade/--no-cascade",
+    help="Send to the second detoxifier only rows the first one did not detoxify well enough.",
+    default=False,
+)
+@click.option(
+    "--similarity-threshold",
+    help="Cascade: minimal similarity of a first-stage output to its source.",
+    default=PipelineConfig.similarity_threshold,
+)
+@click.option(
+    "--quantization",
+    help="Quantization of local HF models; dynamic-int8 is CPU-only.",
+    type=click.Choice(QUANTIZATION_MODES),
+    default="none",
+)
+@click.option(
+    "--inference-backend",
+    help="How local HF models run: eager PyTorch, torch.compile or ONNX Runtime.",
+    type=click.Choice(INFERENCE_BACKENDS),
+    default="eager",
+)
+@click.option(
+    "--length-aware-generation/--fixed-generation-length",
+    help="Size the generation budget of local models by the source lengths, not max_length.",
+    default=True,
+)
+@click.option(
+    "--workers",
+    help="Processes running local models on CPU in parallel; they share the loaded weights.",
+    default=1,
+)
+@click.option(
+    "--threads-per-worker",
+    help=(
+        "Torch threads of every worker process; defaults to an even split of the CPUs "
+        "between the workers of all concurrently running stages."
+    ),
+    type=int,
+    default=None,
+)
+@click.option(
+    "--model-memory-budget",
+    help=(
+        "GiB of model weights to keep loaded; least recently used models are evicted beyond it "
+        "and loaded again when next used."
+    ),
+    type=float,
+    default=None,
+)
+@click.option(
+    "--metrics-jsonl",
+    help="Write every recorded metric to this JSON-lines file (overwritten).",
+)
+@click.option("--metrics-prom", help="Keep a Prometheus textfile with the metrics up to date.")
+@click.option(
+    "--metrics-summary/--no-metrics-summary",
+    help="Print a summary of the metrics to stderr at the end.",
+    default=True,
+)
 @click.command()
 def main(
     file: str = "dev_inputs.tsv",
@@ -30,23 +190,130 @@ def main(
     batch_size_2: int = 8,
     detoxifier_1: str = "hf/s-nlp/mt0-xl-detox-orpo",
     detoxifier_2: str = "google/models/gemini-2.5-pro",
+    api_max_in_flight: int = 4,
+    api_requests_per_minute: float | None = None,
+    api_tokens_per_minute: float | None = None,
+    api_max_input_tokens: int | None = None,
+    api_max_output_tokens: int | None = None,
+    api_max_batch_rows: int = PipelineConfig.api_max_batch_rows,
+    chunk_size: int = 256,
+    overlap: bool = True,  # noqa: FBT002
+    queue_size: int = 2,
+    journal: str | None = None,
+    resume: bool = False,  # noqa: FBT002
+    cache: bool = False,  # noqa: FBT002
+    dedup: bool = False,  # noqa: FBT002
+    toxicity_gate: bool = False,  # noqa: FBT002
+    toxicity_threshold: float = 0.5,
+    cascade: bool = False,  # noqa: FBT002
+    similarity_threshold: float = 0.7,
+    metrics_jsonl: str | None = None,
+    metrics_prom: str | None = None,
+    metrics_summary: bool = True,  # noqa: FBT002
+    model_memory_budget: float | None = None,
+    quantization: str = "none",
+    inference_backend: str = "eager",
+    workers: int = 1,
+    threads_per_worker: int | None = None,
+    length_aware_generation: bool = True,  # noqa: FBT002
 ) -> None:
     """Main entrypoint for BugulmaEnjoyers."""
     verbosity = verbose - quiet + 1
     setup_logging(verbosity)
-    texts = read_input(file)
-    config = PipelineConfig(detoxifier_model_name=detoxifier_1, batch_size=batch_size_1)
-    detox = StandaloneDetoxifier(config)
+    if model_memory_budget is not None:
+        model_cache.budget_bytes = int(model_memory_budget * 2**30)
+    generation_policies = default_generation_policies() if length_aware_generation else {}
+    # С --overlap пулы обеих локальных стадий работают одновременно и делят процессоры
+    local = sum(name.startswith("hf/") for name in (detoxifier_1, detoxifier_2))
+    threads_per_worker = threads_per_worker or default_threads_per_worker(
+        workers,
+        max(1, local) if overlap else 1,
+    )
+    config = PipelineConfig(
+        detoxifier_model_name=detoxifier_1,
+        batch_size=batch_size_1,
+        api_max_in_flight=api_max_in_flight,
+        api_requests_per_minute=api_requests_per_minute,
+        api_tokens_per_minute=api_tokens_per_minute,
+        api_max_input_tokens=api_max_input_tokens,
+        api_max_output_tokens=api_max_output_tokens,
+        api_max_batch_rows=api_max_batch_rows,
+        quantization=quantization,
+        inference_backend=inference_backend,
+        num_workers=workers,
+        threads_per_worker=threads_per_worker,
+        generation_policies=generation_policies,
+    )
+    detox = wrap_detoxifier(StandaloneDetoxifier(config), config, cache=cache, dedup=dedup)
     config2 = PipelineConfig(
         detoxifier_model_name=detoxifier_2,
         batch_size=batch_size_2,
+        api_max_in_flight=api_max_in_flight,
+        api_requests_per_minute=api_requests_per_minute,
+        api_tokens_per_minute=api_tokens_per_minute,
+        api_max_input_tokens=api_max_input_tokens,
+        api_max_output_tokens=api_max_output_tokens,
+        api_max_batch_rows=api_max_batch_rows,
+        quantization=quantization,
+        inference_backend=inference_backend,
+        num_workers=workers,
+        threads_per_worker=threads_per_worker,
+        generation_policies=generation_policies,
     )
-    detox2 = StandaloneDetoxifier(config2)
-    results = detox2.detoxify_batch(
-        detox.detoxify_batch(texts, ["tt"] * len(texts)),
-        ["tt"] * len(texts),
+    detox2 = wrap_detoxifier(
+        StandaloneDetoxifier(config2),
+        config2,
+        cache=cache,
+        dedup=dedup,
     )
-    write_output(results, texts, output)
+    gate, escalate = None, None
+    if toxicity_gate or cascade:
+        scorer = ToxicityScorer.from_pretrained(
+            config.toxicity_detector_model_name,
+            device=config.device,
+            batch_size=config.scorer_batch_size,
+            max_length=config.max_length,
+        )
+        if toxicity_gate:
+            gate = ToxicityGate(scorer, toxicity_threshold)
+        if cascade:
+            similarity = SimilarityScorer.from_pretrained(
+                config.similarity_model_name,
+                device=config.device,
+                batch_size=config.scorer_batch_size,
+                max_length=config.max_length,
+            )
+            escalate = CascadeGate(scorer, similarity, toxicity_threshold, similarity_threshold)
+    stages = [
+        Stage("stage1", detox, escalate=escalate, release_when_done=True),
+        Stage("stage2", detox2),
+    ]
+    fingerprints = {stage.name: stage.detoxifier.fingerprint() for stage in stages}
+    if metrics_jsonl is not None:
+        metrics.add_sink(JSONLinesSink(metrics_jsonl))
+    if metrics_prom is not None:
+        metrics.add_sink(PrometheusTextfileSink(metrics_prom, metrics))
+    try:
+        with (
+            RunJournal(journal or f"{output}.journal", fingerprints, resume=resume) as run_journal,
+            OutputWriter(output) as writer,
+        ):
+            for ids, texts, results in run_pipeline(
+                iter_input(file, chunk_size=chunk_size),
+                stages,
+                run_journal,
+                queue_size=queue_size,
+                gate=gate,
+                overlap=overlap,
+            ):
+                writer.write(ids, texts, results)
+    finally:
+        # Кэшированные у провайдера префиксы промптов оплачиваются, пока не удалены
+        for stage in stages:
+            stage.detoxifier.close()
+        metrics.close()
+        if metrics_summary:
+            click.echo(metrics.summary(), err=True)
 
 
 if __name__ == "__main__":
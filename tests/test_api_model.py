@@ -0,0 +1,275 @@
+import contextlib
+import json
+import re
+import threading
+import time
+
+import requests
+
+from bugulma_enjoyers.datasets.collate import build_batch_prompt
+from bugulma_enjoyers.detoxifiers import PipelineConfig
+from bugulma_enjoyers.models import APIModel
+from bugulma_enjoyers.models._rate_limit import AdaptiveConcurrency, RateLimiter
+
+
+class EchoModel(APIModel, model_type="test-echo"):
+    """Answers every batch prompt with upper-cased texts, slower for earlier batches."""
+
+    def __init__(self, model_name, pipeline_config, **kwargs):
+        super().__init__(model_name, pipeline_config)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def invoke_model(self, input_, max_output_tokens=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        items = json.loads(re.search(r'\[\{"ID".*\}\]', input_, re.DOTALL).group())
+        time.sleep(0.05 / (1 + int(items[0]["text"].split()[-1])))
+        with self.lock:
+            self.active -= 1
+        answer = [{"ID": item["ID"], "tat_detox1": item["text"].upper()} for item in items]
+        return json.dumps(answer)
+
+
+def make_batch(texts):
+    return {
+        "original_text": list(texts),
+        "prompted_text": build_batch_prompt("detoxification", "tt", texts),
+        "languages": ["tt"] * len(texts),
+        "task": "detoxification",
+    }
+
+
+def test_forward_batches_is_concurrent_and_ordered():
+    model = EchoModel("echo", PipelineConfig(device="cpu", api_max_in_flight=3))
+    batches = [make_batch([f"text {idx}"]) for idx in range(6)]
+    results = [outputs for _, outputs in model.forward_batches(batches)]
+    assert results == [[f"TEXT {idx}"] for idx in range(6)]
+    assert 1 < model.peak <= 3
+
+
+def test_yandex_model_reuses_the_pooled_session(monkeypatch):
+    from bugulma_enjoyers.models import YandexModel
+
+    monkeypatch.setenv("YANDEX_CLOUD_FOLDER", "folder")
+    model = YandexModel("yandexgpt", PipelineConfig(device="cpu", api_pool_size=2))
+    adapter = model.session.get_adapter("https://example.com")
+    assert adapter._pool_maxsize == 2
+
+    requests_seen = []
+
+    def send(request, **kwargs):
+        requests_seen.append(json.loads(request.body))
+        text = requests_seen[-1]["messages"][1]["text"]
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(
+            {"result": {"alternatives": [{"message": {"text": text}}]}},
+        ).encode()
+        return response
+
+    monkeypatch.setattr(adapter, "send", send)
+    assert [model.invoke_model(f"q{idx}") for idx in range(3)] == ["q0", "q1", "q2"]
+    assert requests_seen[0]["modelUri"] == "gpt://folder/yandexgpt"
+    model.close()
+
+
+class FlakyModel(EchoModel, model_type="test-flaky"):
+    """Fails with the given HTTP status a few times before answering."""
+
+    def __init__(self, model_name, pipeline_config, failures, status):
+        super().__init__(model_name, pipeline_config)
+        self.failures = failures
+        self.status = status
+        self.calls = 0
+
+    def invoke_model(self, input_, max_output_tokens=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            response = requests.Response()
+            response.status_code = self.status
+            raise requests.exceptions.HTTPError(response=response)
+        return super().invoke_model(input_)
+
+
+def flaky(name, failures, status):
+    config = PipelineConfig(
+        device="cpu",
+        api_max_retries=2,
+        api_backoff_base=0.001,
+        api_max_repair_attempts=1,
+    )
+    return FlakyModel(name, config, failures=failures, status=status)
+
+
+def test_throttled_requests_are_retried():
+    model = flaky("retried", failures=2, status=429)
+    assert model.forward(make_batch(["text 1"])) == ["TEXT 1"]
+    assert model.rate_limiter.retries == 2
+    assert model.rate_limiter.throttles == 2
+
+
+def test_limiter_counts_throttles_of_concurrent_calls():
+    limiter = RateLimiter(max_concurrency=8, max_retries=1, backoff_base=0)
+
+    def throttled():
+        response = requests.Response()
+        response.status_code = 429
+        raise requests.exceptions.HTTPError(response=response)
+
+    def run():
+        for _ in range(50):
+            with contextlib.suppress(requests.exceptions.HTTPError):
+                limiter.call(
+                    throttled,
+                    tokens=1,
+                    is_retryable=lambda _: True,
+                    is_throttling=lambda _: True,
+                )
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.throttles == 8 * 50 * 2
+    assert limiter.retries == 8 * 50
+
+
+def test_client_errors_and_exhausted_retries_fall_back():
+    model = flaky("bad-request", failures=1, status=400)
+    assert model.forward(make_batch(["text 1"])) == ["text 1"]
+    assert model.calls == 1
+
+    model = flaky("outage", failures=10, status=503)
+    assert model.forward(make_batch(["text 1"])) == ["text 1"]
+    assert model.calls == 3
+
+
+def test_adaptive_concurrency_is_aimd():
+    concurrency = AdaptiveConcurrency(maximum=8)
+    concurrency.on_throttle()
+    concurrency.on_throttle()
+    assert concurrency.limit == 2
+    for _ in range(4):
+        concurrency.on_success()
+    assert 3 < concurrency.limit < 4
+
+
+class ForgetfulModel(EchoModel, model_type="test-forgetful"):
+    """Skips "skip" texts and breaks the JSON whenever a "broken" text is in the request."""
+
+    def __init__(self, model_name, pipeline_config):
+        super().__init__(model_name, pipeline_config)
+        self.requests = []
+
+    def invoke_model(self, input_, max_output_tokens=None):
+        answer = json.loads(super().invoke_model(input_))
+        self.requests.append([item["tat_detox1"] for item in answer])
+        if any("BROKEN" in item["tat_detox1"] for item in answer):
+            return "[{not json"
+        return json.dumps([item for item in answer if "SKIP" not in item["tat_detox1"]])
+
+
+def test_missing_rows_are_requested_again_and_broken_batches_bisected():
+    config = PipelineConfig(device="cpu", api_max_repair_attempts=6, api_backoff_base=0.001)
+    model = ForgetfulModel("forgetful", config)
+    texts = ["a 0", "broken 1", "c 2", "d 3"]
+    assert model.forward(make_batch(texts)) == ["A 0", "broken 1", "C 2", "D 3"]
+    assert model.requests[:3] == [
+        ["A 0", "BROKEN 1", "C 2", "D 3"],
+        ["A 0", "BROKEN 1"],
+        ["C 2", "D 3"],
+    ]
+    assert model.untouched_rows == 1
+    assert len(model.requests) == 6
+
+    model.requests = []
+    assert model.forward(make_batch(["skip 0", "b 1"])) == ["skip 0", "B 1"]
+    assert model.requests == [["SKIP 0", "B 1"]] + [["SKIP 0"]] * 5
+    assert model.untouched_rows == 2
+
+
+def test_answer_limit_is_only_sent_when_configured():
+    texts = ["текст"] * 4
+    model = EchoModel("echo", PipelineConfig(device="cpu"))
+    assert model.response_token_limit(texts) is None
+    model = EchoModel("echo", PipelineConfig(device="cpu", api_max_output_tokens=50))
+    assert model.response_token_limit(texts) == 50
+    model = EchoModel("echo", PipelineConfig(device="cpu", api_max_output_tokens=8192))
+    assert 0 < model.response_token_limit(texts) < 8192
+
+
+def test_static_prompt_prefix_is_cached_once():
+    from bugulma_enjoyers.detoxifiers import DedupDetoxifier, StandaloneDetoxifier
+
+    texts = [f"текст {idx}" for idx in range(10)]
+
+    def run(prefix_caching):
+        config = PipelineConfig(
+            detoxifier_model_name="fake/echo",
+            device="cpu",
+            cache_dir=None,
+            batch_size=2,
+            api_prefix_caching=prefix_caching,
+        )
+        detoxifier = StandaloneDetoxifier(config)
+        assert detoxifier.detoxify_batch(texts, ["tt"] * len(texts)) == texts
+        return detoxifier
+
+    cached, uncached = run(prefix_caching=True), run(prefix_caching=False)
+    model = cached.model
+    assert len(model.prefixes) == 1
+    assert model.calls == uncached.model.calls + 1
+    assert model.sent_chars < uncached.model.sent_chars / 3
+    DedupDetoxifier(cached).close()
+    assert model.prefixes == {}
+
+
+def test_prefix_cache_is_refreshed_before_it_expires():
+    from bugulma_enjoyers.detoxifiers import StandaloneDetoxifier
+
+    texts = [f"текст {idx}" for idx in range(4)]
+    config = PipelineConfig(
+        detoxifier_model_name="fake/echo",
+        device="cpu",
+        cache_dir=None,
+        batch_size=2,
+        api_max_in_flight=1,
+        api_prefix_cache_ttl=10.0,
+    )
+    detoxifier = StandaloneDetoxifier(config)
+    model = detoxifier.model
+    now = [0.0]
+    model.clock = lambda: now[0]
+
+    def handles():
+        assert detoxifier.detoxify_batch(texts, ["tt"] * len(texts)) == texts
+        return set(model.prefixes)
+
+    first = handles()
+    now[0] = 5.0
+    assert handles() == first
+    now[0] = 9.5
+    refreshed = handles()
+    assert len(refreshed) == 1
+    assert refreshed != first
+
+    # Провайдер удалил кэш раньше срока: промпт уходит целиком, затем кэш создаётся заново
+    model.prefixes.clear()
+    assert len(handles()) == 1
+    assert model.untouched_rows == 0
+
+
+def test_shared_limiter_warns_about_ignored_limits(caplog):
+    key = ("EchoModel", "shared-limits")
+    first = RateLimiter.shared(key, PipelineConfig(device="cpu", api_requests_per_minute=60))
+    same = RateLimiter.shared(key, PipelineConfig(device="cpu", api_requests_per_minute=60))
+    assert same is first
+    assert not caplog.records
+
+    second = RateLimiter.shared(key, PipelineConfig(device="cpu", api_requests_per_minute=600))
+    assert second is first
+    assert "'api_requests_per_minute': 600" in caplog.text
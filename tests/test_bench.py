@@ -0,0 +1,43 @@
+import pytest
+
+from bugulma_enjoyers.bench import run_benchmark, synthetic_texts
+from bugulma_enjoyers.detoxifiers import PipelineConfig
+from bugulma_enjoyers.models import FakeModel
+from bugulma_enjoyers.models._fake import FakeAPIError
+
+
+def test_synthetic_texts_are_reproducible():
+    assert synthetic_texts(5, seed=1) == synthetic_texts(5, seed=1)
+    assert synthetic_texts(5, seed=1) != synthetic_texts(5, seed=2)
+
+
+@pytest.mark.parametrize("detoxifier", ["standalone", "backtranslation"])
+def test_benchmark_report(tmp_path, detoxifier):
+    texts = synthetic_texts(12, max_words=8)
+    report = run_benchmark(detoxifier, texts, batch_size=4, work_dir=tmp_path, max_length=8)
+    assert report["rows"] == 12
+    assert report["rows_per_s"] > 0
+    assert set(report["batch_latency_s"]) == {"p50", "p95", "p99"}
+    detoxify = report["stages"]["detoxify"]
+    assert detoxify["batches"] == 3
+    assert detoxify["rows"] == 12
+    if detoxifier == "backtranslation":
+        assert report["stages"]["translate"]["rows"] == 24
+
+
+def test_fake_model_simulates_errors():
+    config = PipelineConfig(device="cpu")
+    model = FakeModel("echo?error_rate=0.3&throttle_rate=0.2&seed=3", config)
+    prompt = '[{"ID": 0, "text": "a"}]'
+    codes = []
+    for _ in range(200):
+        try:
+            model.invoke_model(prompt)
+        except FakeAPIError as exc:
+            assert model.is_retryable(exc)
+            codes.append(exc.code)
+    assert 60 < codes.count(503) < 120
+    assert 20 < codes.count(429) < 60
+
+    with pytest.raises(ValueError, match="latncy"):
+        FakeModel("echo?latncy=1", config)
@@ -0,0 +1,94 @@
+import sqlite3
+
+from bugulma_enjoyers.detoxifiers import (
+    BaseDetoxifier,
+    CachingDetoxifier,
+    DedupDetoxifier,
+    PipelineConfig,
+    StandaloneDetoxifier,
+)
+
+
+class UpperDetoxifier(BaseDetoxifier):
+    def __init__(self, config):
+        self.config = config
+        self.seen = []
+
+    def detoxify(self, text, language):
+        return self.detoxify_batch([text], [language])[0]
+
+    def detoxify_batch(self, texts, languages):
+        self.seen.extend(texts)
+        return [text.upper() for text in texts]
+
+
+def test_only_misses_reach_inner_detoxifier(tmp_path):
+    db_path = tmp_path / "results.sqlite"
+    inner = UpperDetoxifier(PipelineConfig(device="cpu"))
+    cached = CachingDetoxifier(inner, db_path=db_path)
+    assert cached.detoxify_batch(["a", "b", "a"], ["tt", "tt", "tt"]) == ["A", "B", "A"]
+    assert inner.seen == ["a", "b"]
+
+    assert cached.detoxify_batch(["c", "b", "a"], ["tt", "tt", "ru"]) == ["C", "B", "A"]
+    assert inner.seen == ["a", "b", "c", "a"]
+
+    # Новый процесс: результаты берутся с диска
+    inner = UpperDetoxifier(PipelineConfig(device="cpu"))
+    assert CachingDetoxifier(inner, db_path=db_path).detoxify_batch(["b", "c"], ["tt"] * 2) == [
+        "B",
+        "C",
+    ]
+    assert inner.seen == []
+
+
+def test_config_changes_invalidate_cache(tmp_path):
+    db_path = tmp_path / "results.sqlite"
+    CachingDetoxifier(UpperDetoxifier(PipelineConfig(device="cpu")), db_path).detoxify("a", "tt")
+    inner = UpperDetoxifier(PipelineConfig(device="cpu", num_beams=8))
+    CachingDetoxifier(inner, db_path).detoxify("a", "tt")
+    assert inner.seen == ["a"]
+
+
+class FlakyDetoxifier(UpperDetoxifier):
+    """Gives no answer for texts starting with "!", like an API model after failed retries."""
+
+    def detoxify_batch(self, texts, languages):
+        outputs = super().detoxify_batch(texts, languages)
+        self.last_untouched = frozenset(
+            idx for idx, text in enumerate(texts) if text.startswith("!")
+        )
+        return [
+            text if text.startswith("!") else output
+            for text, output in zip(texts, outputs, strict=True)
+        ]
+
+
+def test_rows_without_an_answer_are_not_cached(tmp_path):
+    inner = FlakyDetoxifier(PipelineConfig(device="cpu"))
+    cached = CachingDetoxifier(inner, db_path=tmp_path / "results.sqlite")
+    assert cached.detoxify_batch(["a", "!b", "!b"], ["tt"] * 3) == ["A", "!b", "!b"]
+    assert cached.last_untouched == {1, 2}
+
+    # Без ответа осталась только "!b": она и уходит в модель снова
+    assert cached.detoxify_batch(["a", "!b"], ["tt"] * 2) == ["A", "!b"]
+    assert inner.seen == ["a", "!b", "!b"]
+    assert cached.last_untouched == {1}
+
+
+def test_failed_api_rows_are_not_cached(tmp_path):
+    config = PipelineConfig(
+        detoxifier_model_name="fake/upper?error_rate=1.0",
+        device="cpu",
+        cache_dir=None,
+        api_max_retries=0,
+        api_backoff_base=0.0,
+    )
+    db_path = tmp_path / "results.sqlite"
+    cached = CachingDetoxifier(StandaloneDetoxifier(config), db_path=db_path)
+    detoxifier = DedupDetoxifier(cached)
+    texts = ["сүз", "икенче сүз", "сүз"]
+    assert detoxifier.detoxify_batch(texts, ["tt"] * len(texts)) == texts
+    assert detoxifier.last_untouched == {0, 1, 2}
+    assert len(cached.memory) == 0
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM results").fetchone() == (0,)
@@ -0,0 +1,116 @@
+import pytest
+
+from bugulma_enjoyers.datasets import (
+    BucketBatchSampler,
+    DetoxificationDataset,
+    TokenBudgetBatchSampler,
+    build_dataloader,
+)
+from bugulma_enjoyers.datasets.collate import get_collate_fn
+from bugulma_enjoyers.datasets.token_store import TokenStore
+
+
+class WhitespaceTokenizer:
+    """One token per word, enough to check batching without downloading a tokenizer."""
+
+    pad_token_id = 0
+
+    def __call__(self, texts, max_length=256, truncation=True, **kwargs):
+        ids = [[len(word) for word in text.split()][:max_length] for text in texts]
+        return {"input_ids": ids, "attention_mask": [[1] * len(row) for row in ids]}
+
+
+def make_dataset(texts, languages):
+    return DetoxificationDataset(texts, languages, WhitespaceTokenizer(), use_prompts=False)
+
+
+def test_bucket_sampler_groups_languages_and_lengths():
+    lengths = [1, 5, 3, 2, 4, 6]
+    languages = ["tt", "en", "tt", "en", "tt", "tt"]
+    batches = list(BucketBatchSampler(lengths, languages, batch_size=2))
+    assert sorted(idx for batch in batches for idx in batch) == list(range(6))
+    for batch in batches:
+        assert len({languages[idx] for idx in batch}) == 1
+    assert batches[0] == [5, 4]
+
+
+def test_token_budget_sampler_packs_up_to_budgets():
+    languages = ["tt"] * 5 + ["en"]
+    tokens = [50, 10, 40, 30, 200, 5]
+    sampler = TokenBudgetBatchSampler(
+        languages,
+        tokens,
+        tokens,
+        max_input_tokens=100,
+        max_output_tokens=80,
+    )
+    assert list(sampler) == [[4], [0], [2, 3, 1], [5]]
+    row_capped = TokenBudgetBatchSampler(languages, tokens, tokens, 1000, 1000, max_rows=2)
+    assert len(list(row_capped)) == 4
+
+
+def test_collate_pads_to_longest_in_batch():
+    dataset = make_dataset(["a bb", "a bb ccc dddd", "a"], ["tt"] * 3)
+    batch = get_collate_fn("detoxification")([dataset[0], dataset[1]])
+    assert batch["input_ids"].shape == (2, 4)
+    assert batch["attention_mask"].sum().item() == 6
+    assert batch["indices"] == [0, 1]
+
+
+def test_collate_rejects_mixed_languages():
+    dataset = make_dataset(["a", "b"], ["tt", "en"])
+    with pytest.raises(ValueError, match="language"):
+        get_collate_fn("detoxification")([dataset[0], dataset[1]])
+
+
+def test_dataloader_restores_input_order():
+    texts = ["a", "a b c", "a b", "a b c d", "x"]
+    languages = ["tt", "en", "tt", "tt", "en"]
+    results = [None] * len(texts)
+    for batch in build_dataloader(make_dataset(texts, languages), 2, task="detoxification"):
+        assert batch["input_ids"].shape[1] == max(len(t.split()) for t in batch["original_text"])
+        for idx, text in zip(batch["indices"], batch["original_text"], strict=True):
+            results[idx] = text
+    assert results == texts
+
+
+def test_token_store_is_persisted(tmp_path):
+    class CountingTokenizer(WhitespaceTokenizer):
+        name_or_path = "whitespace"
+        calls = 0
+
+        def __call__(self, texts, **kwargs):
+            CountingTokenizer.calls += 1
+            return super().__call__(texts, **kwargs)
+
+    texts = ["a bb", "", "a bb ccc"]
+    store = TokenStore.build(CountingTokenizer(), texts, max_length=2, cache_dir=tmp_path)
+    assert store.lengths.tolist() == [2, 0, 2]
+    assert store[0].tolist() == [1, 2]
+
+    again = TokenStore.build(CountingTokenizer(), texts, max_length=2, cache_dir=tmp_path)
+    assert CountingTokenizer.calls == 1
+    assert again.tokens.tolist() == store.tokens.tolist()
+    assert again.offsets.tolist() == store.offsets.tolist()
+
+
+def test_token_store_cache_is_capped(tmp_path):
+    class NamedTokenizer(WhitespaceTokenizer):
+        name_or_path = "whitespace"
+
+    texts = [" ".join(["word"] * 50)] * 20
+    TokenStore.build(NamedTokenizer(), texts, max_length=64, cache_dir=tmp_path)
+    first = next(tmp_path.glob("*.npz"))
+    budget = int(first.stat().st_size * 3.5)
+    for idx in range(5):
+        TokenStore.build(
+            NamedTokenizer(),
+            [*texts, str(idx)],
+            64,
+            cache_dir=tmp_path,
+            max_cache_bytes=budget,
+        )
+    files = list(tmp_path.glob("*.npz"))
+    assert len(files) == 3
+    assert sum(path.stat().st_size for path in files) <= budget
+    assert not first.exists()
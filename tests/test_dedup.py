@@ -0,0 +1,60 @@
+from bugulma_enjoyers.detoxifiers import (
+    BaseDetoxifier,
+    DedupDetoxifier,
+    PipelineConfig,
+    StandaloneDetoxifier,
+)
+from bugulma_enjoyers.detoxifiers.dedup import MENTION_SENTINEL, URL_SENTINEL, normalize
+
+
+class RecordingDetoxifier(BaseDetoxifier):
+    def __init__(self):
+        self.config = PipelineConfig(device="cpu")
+        self.seen = []
+
+    def detoxify(self, text, language):
+        return self.detoxify_batch([text], [language])[0]
+
+    def detoxify_batch(self, texts, languages):
+        self.seen.extend(texts)
+        return [f"clean: {text}" for text in texts]
+
+
+def test_normalize():
+    row = normalize("@bob  смотри https://t.me/x?a=1 !!!\n@alice")
+    assert row.text == f"{MENTION_SENTINEL} смотри {URL_SENTINEL} ! {MENTION_SENTINEL}"
+    assert row.mentions == ["@bob", "@alice"]
+    assert row.urls == ["https://t.me/x?a=1"]
+    assert normalize("почта a@b.ru").mentions == []
+    # Буквальные "URL" и "@user" в тексте не путаются с заменёнными
+    assert normalize("URL http://x.com").text != normalize("http://x.com URL").text
+
+
+def test_near_duplicates_are_sent_once():
+    inner = RecordingDetoxifier()
+    dedup = DedupDetoxifier(inner)
+    results = dedup.detoxify_batch(
+        ["@bob ты дурак!!!", "@alice  ты дурак!", "ты дурак www.x.ru", "ты дурак https://y.ru"],
+        ["tt"] * 4,
+    )
+    assert inner.seen == ["@bob ты дурак!!!", "ты дурак www.x.ru"]
+    assert results == [
+        "clean: @bob ты дурак!!!",
+        "clean: @alice ты дурак!!!",
+        "clean: ты дурак www.x.ru",
+        "clean: ты дурак https://y.ru",
+    ]
+
+
+def test_identity_model_keeps_texts():
+    texts = ["привет,,,   мир!!!", "URL http://x.com", "@bob @bobby", "@ann @bobby"]
+    config = PipelineConfig(detoxifier_model_name="fake/echo", device="cpu", cache_dir=None)
+    results = DedupDetoxifier(StandaloneDetoxifier(config)).detoxify_batch(texts, ["tt"] * 4)
+    assert results == texts
+
+
+def test_languages_are_not_merged():
+    inner = RecordingDetoxifier()
+    DedupDetoxifier(inner).detoxify_batch(["a", "a", "a"], ["tt", "ru", "tt"])
+    assert inner.seen == ["a", "a"]
+    assert DedupDetoxifier(inner).fingerprint() != inner.fingerprint()
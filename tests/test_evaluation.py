@@ -0,0 +1,67 @@
+import pytest
+
+from bugulma_enjoyers.evaluation import Evaluator
+from bugulma_enjoyers.scorers import SimilarityScorer, ToxicityScorer
+from tests.test_scorers import tiny_classifier, tiny_encoder
+
+
+class CountingEncoder(SimilarityScorer):
+    def __init__(self):
+        model, tokenizer = tiny_encoder()
+        super().__init__(model, tokenizer, name="tiny-encoder")
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded.extend(texts)
+        return super().embed(texts)
+
+
+class FixedFluency:
+    name = "fixed"
+
+    def __init__(self):
+        self.pairs = []
+
+    def score(self, sources, outputs):
+        self.pairs.extend(zip(sources, outputs, strict=True))
+        return [0.5] * len(outputs)
+
+
+def make_evaluator(cache_path, fluency=None):
+    classifier, tokenizer = tiny_classifier()
+    toxicity = ToxicityScorer(classifier, tokenizer, name="tiny-classifier")
+    return Evaluator(toxicity, CountingEncoder(), fluency=fluency, cache_path=cache_path)
+
+
+def test_scores_are_consistent_with_scorers(tmp_path):
+    evaluator = make_evaluator(None, fluency=FixedFluency())
+    sources, outputs = ["ты дурак", "привет"], ["ты", "привет"]
+    scores = evaluator.score(sources, outputs)
+    toxicity = evaluator.toxicity.score(outputs)
+    similarity = evaluator.similarity.similarity(sources, outputs)
+    assert scores["STA"].tolist() == pytest.approx([1 - value for value in toxicity], abs=1e-5)
+    assert scores["SIM"].tolist() == pytest.approx(similarity, abs=1e-5)
+    assert scores["SIM"][1] == pytest.approx(1.0, abs=1e-5)
+    assert scores["J"].tolist() == pytest.approx(
+        (scores["STA"] * scores["SIM"].clip(lower=0) * 0.5).tolist(),
+    )
+    summary = evaluator.evaluate(sources, outputs)
+    assert summary["rows"] == 2
+    assert summary["FL"] == 0.5
+
+
+def test_new_config_only_encodes_new_outputs(tmp_path):
+    cache_path = tmp_path / "scores.sqlite"
+    sources = ["ты дурак", "как дела дурак"]
+    first = make_evaluator(cache_path, fluency=FixedFluency())
+    before = first.score(sources, ["ты", "как дела"])
+    first.close()
+
+    fluency = FixedFluency()
+    second = make_evaluator(cache_path, fluency=fluency)
+    after = second.score(sources, ["ты", "как дела хорошо"])
+    second.close()
+    assert second.similarity.embedded == ["как дела хорошо"]
+    assert fluency.pairs == [("как дела дурак", "как дела хорошо")]
+    assert after["SIM"][0] == pytest.approx(before["SIM"][0])
+    assert after["STA"][0] == pytest.approx(before["STA"][0])
@@ -0,0 +1,80 @@
+import pytest
+
+from bugulma_enjoyers.bench import build_tiny_seq2seq, synthetic_texts
+from bugulma_enjoyers.detoxifiers import PipelineConfig, StandaloneDetoxifier
+from bugulma_enjoyers.generation import GenerationPolicy
+from bugulma_enjoyers.metrics import metrics
+from bugulma_enjoyers.models import model_cache
+
+
+@pytest.fixture
+def tiny_model_name(tmp_path):
+    model_cache.clear()
+    yield f"hf/{build_tiny_seq2seq(tmp_path / 'tiny', synthetic_texts(50))}"
+    model_cache.clear()
+
+
+def test_policy_budget():
+    policy = GenerationPolicy(ratio=1.5, slack=4, min_new_tokens=8, round_to=8)
+    assert policy.max_new_tokens([2, 2], cap=256) == 8
+    assert policy.max_new_tokens([10, 20], cap=256) == 40
+    assert policy.max_new_tokens([10, 200], cap=256) == 256
+    assert policy.max_new_tokens([], cap=256) == 8
+
+
+def test_budget_limits_generation(tiny_model_name):
+    texts = synthetic_texts(16)
+
+    def generate(policies):
+        config = PipelineConfig(
+            detoxifier_model_name=tiny_model_name,
+            device="cpu",
+            cache_dir=None,
+            batch_size=4,
+            max_length=64,
+            generation_policies=policies,
+        )
+        metrics.reset()
+        StandaloneDetoxifier(config).detoxify_batch(texts, ["tt"] * len(texts))
+        counters = {name: value for (name, _), value in metrics.counters.items()}
+        metrics.reset()
+        return counters
+
+    fixed = generate({})
+    tight = generate({"detoxification": GenerationPolicy(ratio=0.0, slack=0, min_new_tokens=4)})
+
+    assert fixed["generation_rows_total"] == tight["generation_rows_total"] == len(texts)
+    assert tight["model_output_tokens_total"] < fixed["model_output_tokens_total"]
+    assert tight["generation_cap_hits_total"] >= fixed["generation_cap_hits_total"]
+
+
+def test_policies_are_part_of_the_fingerprint():
+    detox = StandaloneDetoxifier(PipelineConfig(detoxifier_model_name="fake/a", cache_dir=None))
+    fixed = StandaloneDetoxifier(
+        PipelineConfig(detoxifier_model_name="fake/a", cache_dir=None, generation_policies={}),
+    )
+    assert detox.fingerprint() != fixed.fingerprint()
+
+
+def test_outputs_do_not_depend_on_the_batch(tiny_model_name):
+    texts = synthetic_texts(12, seed=5)
+    policy = GenerationPolicy(ratio=0.5, slack=0, min_new_tokens=1, round_to=1)
+
+    def detoxify(batch_size, order):
+        config = PipelineConfig(
+            detoxifier_model_name=tiny_model_name,
+            device="cpu",
+            cache_dir=None,
+            batch_size=batch_size,
+            max_length=64,
+            generation_policies={"detoxification": policy},
+        )
+        outputs = StandaloneDetoxifier(config).detoxify_batch(
+            [texts[idx] for idx in order],
+            ["tt"] * len(order),
+        )
+        return dict(zip(order, outputs, strict=True))
+
+    alone = detoxify(1, range(len(texts)))
+    assert detoxify(4, range(len(texts))) == alone
+    assert detoxify(3, list(reversed(range(len(texts))))) == alone
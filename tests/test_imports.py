@@ -0,0 +1,41 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["transformers", "google.generativeai", "requests"]
+
+
+def imported_modules(code):
+    probe = (
+        f"import json, sys\n{code}\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", probe],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_cli_does_not_import_backends():
+    assert imported_modules("import main") == []
+
+
+@pytest.mark.parametrize(
+    ("model_type", "expected"),
+    [("fake", []), ("yandex", ["requests"]), ("hf", ["transformers"])],
+)
+def test_backends_are_imported_by_prefix(model_type, expected):
+    code = f"from bugulma_enjoyers.models import get_model_type\nget_model_type({model_type!r})"
+    assert sorted(imported_modules(code)) == sorted(expected)
+
+
+def test_unknown_model_type():
+    from bugulma_enjoyers.models import get_model_type
+
+    with pytest.raises(ValueError, match="Supported model types"):
+        get_model_type("nope")
@@ -0,0 +1,68 @@
+import importlib.util
+
+import pytest
+
+from bugulma_enjoyers.bench import build_tiny_seq2seq, synthetic_texts
+from bugulma_enjoyers.detoxifiers import PipelineConfig
+from bugulma_enjoyers.load_model import load_model
+from bugulma_enjoyers.models import model_cache
+
+
+@pytest.fixture
+def tiny_model_name(tmp_path):
+    model_cache.clear()
+    yield f"hf/{build_tiny_seq2seq(tmp_path / 'tiny', synthetic_texts(20))}"
+    model_cache.clear()
+
+
+def load(model_name, tmp_path, **kwargs):
+    config = PipelineConfig(device="cpu", cache_dir=str(tmp_path / "cache"), **kwargs)
+    return load_model(model_name=model_name, pipeline_config=config)
+
+
+def test_compile_backend(tiny_model_name, tmp_path):
+    eager = load(tiny_model_name, tmp_path)
+    compiled = load(tiny_model_name, tmp_path, inference_backend="compile")
+
+    assert compiled.model is not eager.model
+    assert compiled.model.generation_config.cache_implementation == "static"
+    assert eager.model.generation_config.cache_implementation is None
+    # torch.compile компилирует при первом вызове, здесь проверяем только обёртку
+    assert hasattr(compiled.model.forward, "_torchdynamo_orig_callable")
+
+
+def test_invalid_backend(tiny_model_name, tmp_path):
+    with pytest.raises(ValueError, match="Supported backends"):
+        load(tiny_model_name, tmp_path, inference_backend="tensorrt")
+    with pytest.raises(ValueError, match="does not support quantization"):
+        load(tiny_model_name, tmp_path, inference_backend="onnx", quantization="bf16")
+
+
+@pytest.mark.skipif(
+    importlib.util.find_spec("optimum") is not None,
+    reason="Optimum is installed",
+)
+def test_onnx_backend_needs_optimum(tiny_model_name, tmp_path):
+    with pytest.raises(ImportError, match="optimum"):
+        load(tiny_model_name, tmp_path, inference_backend="onnx")
+
+
+def test_onnx_backend_matches_eager(tiny_model_name, tmp_path):
+    pytest.importorskip("optimum.onnxruntime")
+    from bugulma_enjoyers.detoxifiers import StandaloneDetoxifier
+
+    texts = synthetic_texts(6, max_words=6)
+
+    def detoxify(**kwargs):
+        config = PipelineConfig(
+            detoxifier_model_name=tiny_model_name,
+            device="cpu",
+            cache_dir=str(tmp_path / "cache"),
+            max_length=8,
+            num_beams=1,
+            **kwargs,
+        )
+        return StandaloneDetoxifier(config).detoxify_batch(texts, ["tt"] * len(texts))
+
+    assert detoxify(inference_backend="onnx") == detoxify()
+    assert list((tmp_path / "cache" / "onnx").iterdir())
@@ -1,7 +1,7 @@
 import json
 from pathlib import Path
 
-from bugulma_enjoyers.io import read_input, write_output
+from bugulma_enjoyers.io import OutputWriter, RunJournal, iter_input, read_input, write_output
 
 
 def test_input():
@@ -24,3 +24,50 @@ def test_output():
     read = read_input(respath, column="tat_detox1")
     assert read == out
 
+
+def test_streaming_roundtrip(tmp_path):
+    inp = read_input(Path("tests") / "resources" / "sample_input.tsv")
+    chunks = list(iter_input(Path("tests") / "resources" / "sample_input.tsv", chunk_size=10))
+    assert [len(texts) for _, texts in chunks] == [10, 10, 10, 7]
+    assert [text for _, texts in chunks for text in texts] == inp
+    assert chunks[1][0] == list(range(10, 20))
+
+    respath = tmp_path / "streamed.tsv"
+    with OutputWriter(respath) as writer:
+        for ids, texts in chunks:
+            writer.write(ids, texts, [text.upper() for text in texts])
+    assert read_input(respath, column="tat_detox1") == [text.upper() for text in inp]
+
+
+def test_journal_resume(tmp_path):
+    path = tmp_path / "run.journal"
+    with RunJournal(path, {"stage1": "mt0"}, resume=False) as journal:
+        assert journal.lookup("stage1", [0, 1], ["a", "b"]) == [None, None]
+        journal.record("stage1", [0, 1], ["a", "b"], ["A", "B"])
+    with path.open("a", encoding="utf-8") as file:
+        file.write('{"stage": "stage1", "id": "2", "inp')
+
+    with RunJournal(path, {"stage1": "mt0"}, resume=True) as journal:
+        assert journal.lookup("stage1", [0, 1, 2], ["a", "changed", "c"]) == ["A", None, None]
+        journal.record("stage1", [2], ["c"], ["C"])
+    with RunJournal(path, {"stage1": "mt0"}, resume=True) as journal:
+        assert journal.lookup("stage1", [2], ["c"]) == ["C"]
+    with RunJournal(path, {"stage1": "another model"}, resume=True) as journal:
+        assert journal.lookup("stage1", [0], ["a"]) == [None]
+
+
+def test_journal_reads_results_back_from_the_file(tmp_path):
+    path = tmp_path / "run.journal"
+    results = [f"нәтиҗә {idx} " * 20 for idx in range(50)]
+    inputs = [f"кертү {idx}" for idx in range(50)]
+    fingerprints = {"stage1": "mt0", "stage2": "api"}
+    with RunJournal(path, fingerprints, resume=False) as journal:
+        journal.record("stage1", list(range(50)), inputs, results)
+        assert journal.lookup("stage1", [3, 7], [inputs[3], inputs[7]]) == [results[3], results[7]]
+        journal.record("stage2", [3], [results[3]], ["соңгы"])
+
+    with RunJournal(path, fingerprints, resume=True) as journal:
+        assert journal.lookup("stage1", list(range(50)), inputs) == results
+        assert journal.lookup("stage2", [3, 4], [results[3], results[4]]) == ["соңгы", None]
+        # В памяти только хэши и смещения, без текстов
+        assert all(isinstance(value, int) for value in vars(journal)["_offsets"].values())
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from bugulma_enjoyers.detoxifiers import DedupDetoxifier, PipelineConfig, StandaloneDetoxifier
+from bugulma_enjoyers.metrics import (
+    JSONLinesSink,
+    MetricsRecorder,
+    PrometheusTextfileSink,
+    metrics,
+)
+
+
+@pytest.fixture
+def recorder():
+    metrics.reset()
+    yield metrics
+    metrics.close()
+    metrics.reset()
+
+
+def test_recorder_aggregates_by_labels():
+    recorder = MetricsRecorder()
+    recorder.increment("model_rows_total", 3, model="A")
+    recorder.increment("model_rows_total", 2, model="A")
+    recorder.increment("model_rows_total", 0, model="B")
+    recorder.observe("model_forward_seconds", 0.5, model="A")
+    recorder.observe("model_forward_seconds", 1.5, model="A")
+
+    assert recorder.counters == {("model_rows_total", (("model", "A"),)): 5}
+    assert recorder.durations["model_forward_seconds", (("model", "A"),)] == [2, 2.0, 1.5]
+    summary = recorder.summary()
+    assert 'model_rows_total{model="A"}: 5' in summary
+    assert "2 x 1.000s" in summary
+
+
+def test_sinks(tmp_path):
+    recorder = MetricsRecorder()
+    recorder.add_sink(JSONLinesSink(tmp_path / "metrics.jsonl"))
+    recorder.add_sink(PrometheusTextfileSink(tmp_path / "metrics.prom", recorder, interval=3600))
+    recorder.increment("api_retries_total", model='quo"ted')
+    with recorder.timer("tokenization_seconds", tokenizer="T"):
+        pass
+    recorder.close()
+
+    events = [json.loads(line) for line in (tmp_path / "metrics.jsonl").read_text().splitlines()]
+    assert [event["metric"] for event in events] == ["api_retries_total", "tokenization_seconds"]
+    assert events[0]["labels"] == {"model": 'quo"ted'}
+    assert events[0]["value"] == 1
+
+    prom = (tmp_path / "metrics.prom").read_text()
+    assert "# TYPE bugulma_api_retries_total counter" in prom
+    assert 'bugulma_api_retries_total{model="quo\\"ted"} 1' in prom
+    assert 'bugulma_tokenization_seconds_count{tokenizer="T"} 1' in prom
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_models_and_detoxifiers_are_instrumented(recorder):
+    config = PipelineConfig(
+        detoxifier_model_name="fake/echo?throttle_rate=0.5&seed=1",
+        device="cpu",
+        cache_dir=None,
+        batch_size=2,
+        api_backoff_base=0.0,
+        api_max_retries=20,
+    )
+    texts = [f"текст {idx % 3}" for idx in range(6)]
+    detoxifier = DedupDetoxifier(StandaloneDetoxifier(config))
+    assert detoxifier.detoxify_batch(texts, ["tt"] * len(texts)) == texts
+
+    counters = {
+        (name, dict(labels).popitem()[1]): value
+        for (name, labels), value in recorder.counters.items()
+    }
+    assert counters["detoxifier_rows_total", "DedupDetoxifier"] == 6
+    assert counters["detoxifier_rows_total", "StandaloneDetoxifier"] == 3
+    assert counters["detoxifier_unchanged_rows_total", "StandaloneDetoxifier"] == 3
+    assert counters["model_batches_total", "FakeModel"] == 2
+    assert counters["model_rows_total", "FakeModel"] == 3
+    assert counters["model_input_tokens_total", "FakeModel"] > 0
+    assert counters["api_throttles_total", "FakeModel"] > 0
+    retries = counters["api_retries_total", "FakeModel"]
+    assert retries == counters["api_throttles_total", "FakeModel"]
+    assert recorder.durations["api_request_seconds", (("model", "FakeModel"),)][0] == 2
+
+
+def test_scope_labels_reach_worker_threads(recorder):
+    config = PipelineConfig(
+        detoxifier_model_name="fake/scoped",
+        device="cpu",
+        cache_dir=None,
+        batch_size=1,
+    )
+    detoxifier = StandaloneDetoxifier(config)
+    with recorder.scope(stage="stage1"):
+        detoxifier.detoxify_batch(["а", "б", "в"], ["tt"] * 3)
+
+    labels = (("model", "FakeModel"), ("stage", "stage1"))
+    assert recorder.counters["model_rows_total", labels] == 3
+    assert recorder.durations["api_request_seconds", labels][0] == 3
@@ -0,0 +1,99 @@
+import weakref
+from dataclasses import replace
+
+import pytest
+import torch
+
+from bugulma_enjoyers.bench import build_tiny_seq2seq, synthetic_texts
+from bugulma_enjoyers.detoxifiers import PipelineConfig, StandaloneDetoxifier
+from bugulma_enjoyers.models import ModelCache, model_cache
+from bugulma_enjoyers.models._model_cache import model_nbytes
+
+
+def linear(size):
+    return torch.nn.Linear(size, size, bias=False)
+
+
+def test_lru_eviction_under_budget():
+    # 16x16 float32 = 1 KiB
+    cache = ModelCache(budget_bytes=2 * 1024)
+    loads = []
+
+    def loader(name):
+        def load():
+            loads.append(name)
+            return linear(16)
+
+        return load
+
+    a = cache.get("a", loader("a"))
+    cache.get("b", loader("b"))
+    assert cache.get("a", loader("a")) is a
+    cache.get("c", loader("c"))
+    assert "b" not in cache
+    assert "a" in cache
+    assert cache.nbytes == 2 * 1024
+    assert loads == ["a", "b", "c"]
+
+    cache.release("a")
+    assert len(cache) == 1
+    cache.get("big", lambda: linear(64))
+    assert list(cache._entries) == ["big"]
+
+
+def test_model_nbytes():
+    assert model_nbytes((linear(4), "tokenizer")) == 4 * 4 * 4
+
+
+@pytest.fixture
+def tiny_config(tmp_path):
+    path = build_tiny_seq2seq(tmp_path / "tiny", synthetic_texts(20))
+    model_cache.clear()
+    yield PipelineConfig(
+        detoxifier_model_name=f"hf/{path}",
+        device="cpu",
+        cache_dir=None,
+        max_length=8,
+    )
+    model_cache.clear()
+
+
+def test_detoxifiers_share_weights(tiny_config):
+    first = StandaloneDetoxifier(tiny_config)
+    second = StandaloneDetoxifier(tiny_config)
+    assert first.model is not second.model
+    assert first.model.model is second.model.model
+    assert len(model_cache) == 1
+
+    first.release()
+    assert len(model_cache) == 0
+    assert first.model.model is None
+    assert second.detoxify_batch(["мин"], ["tt"])
+
+
+def test_eviction_frees_weights_of_live_models(tiny_config, tmp_path):
+    first = StandaloneDetoxifier(tiny_config)
+    weights = weakref.ref(first.model.model)
+    other = build_tiny_seq2seq(tmp_path / "other", synthetic_texts(20), seed=1)
+    model_cache.budget_bytes = 1
+    try:
+        second = StandaloneDetoxifier(replace(tiny_config, detoxifier_model_name=f"hf/{other}"))
+        assert weights() is None
+        assert len(model_cache) == 1
+
+        # Вытесненные веса загружаются снова при следующем обращении
+        assert first.detoxify_batch(["мин"], ["tt"])
+        assert first.model.cache_key in model_cache
+        assert second.model.cache_key not in model_cache
+    finally:
+        model_cache.budget_bytes = None
+
+
+def test_to_moves_the_cached_weights(tiny_config):
+    model = StandaloneDetoxifier(tiny_config).model
+    weights = model.model
+    model.to("meta")
+    assert model.model is weights
+    assert weights.device.type == "meta"
+    assert len(model_cache) == 1
+    assert model.cache_key in model_cache
@@ -0,0 +1,139 @@
+import time
+
+import pytest
+
+from bugulma_enjoyers.detoxifiers import BaseDetoxifier, PipelineConfig
+from bugulma_enjoyers.io import RunJournal
+from bugulma_enjoyers.pipeline import Stage, run_pipeline
+
+
+class SleepyDetoxifier(BaseDetoxifier):
+    def __init__(self, suffix, delay, fail_on=None):
+        self.config = PipelineConfig(device="cpu")
+        self.suffix = suffix
+        self.delay = delay
+        self.fail_on = fail_on
+        self.seen = []
+
+    def detoxify(self, text, language):
+        return self.detoxify_batch([text], [language])[0]
+
+    def detoxify_batch(self, texts, languages):
+        time.sleep(self.delay)
+        if self.fail_on in texts:
+            msg = f"cannot detoxify {self.fail_on}"
+            raise RuntimeError(msg)
+        self.seen.extend(texts)
+        return [text + self.suffix for text in texts]
+
+
+def make_chunks(n_chunks, size=2):
+    return [
+        (list(range(start, start + size)), [f"t{idx}" for idx in range(start, start + size)])
+        for start in range(0, n_chunks * size, size)
+    ]
+
+
+def run(stages, chunks, **kwargs):
+    return [row for _, _, results in run_pipeline(chunks, stages, **kwargs) for row in results]
+
+
+def test_stages_overlap_and_keep_order():
+    chunks = make_chunks(6)
+    expected = [f"t{idx}_1_2" for idx in range(12)]
+
+    stages = [
+        Stage("stage1", SleepyDetoxifier("_1", 0.05)),
+        Stage("stage2", SleepyDetoxifier("_2", 0.05)),
+    ]
+    start = time.perf_counter()
+    assert run(stages, chunks, overlap=False) == expected
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assert run(stages, chunks, queue_size=1) == expected
+    overlapped = time.perf_counter() - start
+
+    # 6 чанков по 0.05 с на стадию: ~0.6 с последовательно и ~0.35 с с перекрытием
+    assert overlapped < sequential * 0.8
+
+
+def test_upstream_failure_reaches_consumer():
+    stages = [
+        Stage("stage1", SleepyDetoxifier("_1", 0, fail_on="t4")),
+        Stage("stage2", SleepyDetoxifier("_2", 0)),
+    ]
+    outputs = []
+    with pytest.raises(RuntimeError, match="t4"):
+        for ids, _, _ in run_pipeline(make_chunks(4), stages):
+            outputs.append(ids)
+    assert outputs == [[0, 1], [2, 3]]
+
+
+def test_pipeline_resumes_from_journal(tmp_path):
+    path = tmp_path / "run.journal"
+    fingerprints = {"stage1": "a", "stage2": "b"}
+    stage1 = SleepyDetoxifier("_1", 0)
+    stage2 = SleepyDetoxifier("_2", 0, fail_on="t2_1")
+    stages = [Stage("stage1", stage1), Stage("stage2", stage2)]
+    with RunJournal(path, fingerprints, resume=False) as journal, pytest.raises(RuntimeError):
+        run(stages, make_chunks(3), journal=journal, queue_size=1)
+
+    stage2.fail_on = None
+    stage1.seen, stage2.seen = [], []
+    with RunJournal(path, fingerprints, resume=True) as journal:
+        results = run(stages, make_chunks(3), journal=journal)
+    assert results == [f"t{idx}_1_2" for idx in range(6)]
+    assert "t0" not in stage1.seen
+    assert stage2.seen == ["t2_1", "t3_1", "t4_1", "t5_1"]
+
+
+def test_gate_skips_non_toxic_rows():
+    stage1, stage2 = SleepyDetoxifier("_1", 0), SleepyDetoxifier("_2", 0)
+    stages = [Stage("stage1", stage1), Stage("stage2", stage2)]
+
+    def gate(texts):
+        return [not text.endswith(("0", "3")) for text in texts]
+
+    results = run(stages, make_chunks(2), gate=gate)
+    assert results == ["t0", "t1_1_2", "t2_1_2", "t3"]
+    assert stage1.seen == ["t1", "t2"]
+    assert stage2.seen == ["t1_1", "t2_1"]
+
+
+@pytest.mark.parametrize("overlap", [True, False])
+def test_cascade_escalates_only_failing_rows(overlap):
+    stage1, stage2 = SleepyDetoxifier("_1", 0), SleepyDetoxifier("_2", 0)
+
+    def escalate(sources, outputs):
+        assert [f"{source}_1" for source in sources] == outputs
+        return [source in {"t1", "t2"} for source in sources]
+
+    stages = [Stage("stage1", stage1, escalate=escalate), Stage("stage2", stage2)]
+
+    def gate(texts):
+        return [text != "t2" for text in texts]
+
+    results = run(stages, make_chunks(2), gate=gate, overlap=overlap)
+    assert results == ["t0_1", "t1_1_2", "t2", "t3_1"]
+    assert stage2.seen == ["t1_1"]
+
+
+@pytest.mark.parametrize("overlap", [True, False])
+def test_stage_is_released_when_done(overlap):
+    released = []
+
+    class ReleasingDetoxifier(SleepyDetoxifier):
+        def release(self):
+            released.append(self.suffix)
+
+    stages = [
+        Stage("stage1", ReleasingDetoxifier("_1", 0), release_when_done=True),
+        Stage("stage2", ReleasingDetoxifier("_2", 0)),
+    ]
+    rows = run_pipeline(make_chunks(3), stages, overlap=overlap)
+    next(rows)
+    if not overlap:
+        assert released == []
+    assert len(list(rows)) == 2
+    assert released == ["_1"]
@@ -0,0 +1,63 @@
+import pytest
+import torch
+
+from bugulma_enjoyers.bench import agreement, build_tiny_seq2seq, run_benchmark, synthetic_texts
+from bugulma_enjoyers.detoxifiers import PipelineConfig
+from bugulma_enjoyers.load_model import load_model
+from bugulma_enjoyers.models import model_cache
+from bugulma_enjoyers.models._model_cache import model_nbytes
+
+
+@pytest.fixture
+def tiny_model_name(tmp_path):
+    model_cache.clear()
+    yield f"hf/{build_tiny_seq2seq(tmp_path / 'tiny', synthetic_texts(20))}"
+    model_cache.clear()
+
+
+def load(model_name, quantization, device="cpu"):
+    config = PipelineConfig(device=device, quantization=quantization, cache_dir=None)
+    return load_model(model_name=model_name, pipeline_config=config)
+
+
+def test_quantized_weights(tiny_model_name):
+    full = load(tiny_model_name, "none")
+    int8 = load(tiny_model_name, "dynamic-int8")
+    bf16 = load(tiny_model_name, "bf16")
+
+    assert full.model is not int8.model
+    assert not any(isinstance(module, torch.nn.Linear) for module in int8.model.modules())
+    assert bf16.model.dtype == torch.bfloat16
+    assert model_nbytes(int8.model) < model_nbytes(full.model) / 2
+    assert model_nbytes(bf16.model) == model_nbytes(full.model) / 2
+
+
+def test_invalid_quantization(tiny_model_name):
+    with pytest.raises(ValueError, match="Supported modes"):
+        load(tiny_model_name, "int4")
+    with pytest.raises(ValueError, match="only supported on CPU"):
+        load(tiny_model_name, "dynamic-int8", device="cuda")
+
+
+def test_agreement():
+    assert agreement(["abc", "xyz"], ["abc", "xy"]) == {
+        "exact_match": 0.5,
+        "char_similarity": pytest.approx((1 + 0.8) / 2),
+    }
+
+
+def test_benchmark_compares_with_reference(tmp_path):
+    texts = synthetic_texts(8, max_words=6)
+    kwargs = {"work_dir": tmp_path, "max_length": 8}
+    reference = run_benchmark("standalone", texts, batch_size=4, **kwargs)
+    report = run_benchmark(
+        "standalone",
+        texts,
+        batch_size=4,
+        quantization="dynamic-int8",
+        reference=reference["outputs"],
+        **kwargs,
+    )
+    assert report["quantization"] == "dynamic-int8"
+    assert set(report["agreement"]) == {"exact_match", "char_similarity"}
+    assert report["weights_mb"] < reference["weights_mb"]
@@ -0,0 +1,113 @@
+import pytest
+import torch
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+from transformers import (
+    BertConfig,
+    BertForSequenceClassification,
+    BertModel,
+    PreTrainedTokenizerFast,
+)
+
+from bugulma_enjoyers.scorers import CascadeGate, SimilarityScorer, ToxicityGate, ToxicityScorer
+
+WORDS = ["[PAD]", "[UNK]", "ты", "дурак", "привет", "как", "дела", "очень", "хорошо"]
+
+
+def tiny_tokenizer():
+    backend = Tokenizer(WordLevel({word: idx for idx, word in enumerate(WORDS)}, unk_token="[UNK]"))
+    backend.pre_tokenizer = Whitespace()
+    return PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="[PAD]")
+
+
+def tiny_config():
+    return BertConfig(
+        vocab_size=len(WORDS),
+        hidden_size=8,
+        num_hidden_layers=1,
+        num_attention_heads=1,
+        intermediate_size=16,
+        id2label={0: "toxic", 1: "neutral"},
+        label2id={"toxic": 0, "neutral": 1},
+    )
+
+
+def tiny_classifier():
+    torch.manual_seed(0)
+    return BertForSequenceClassification(tiny_config()), tiny_tokenizer()
+
+
+def tiny_encoder():
+    torch.manual_seed(0)
+    return BertModel(tiny_config()), tiny_tokenizer()
+
+
+def test_batched_scores_match_single_texts():
+    model, tokenizer = tiny_classifier()
+    scorer = ToxicityScorer(model, tokenizer, batch_size=2)
+    assert scorer.toxic_label == 0
+
+    texts = ["ты дурак", "привет как дела очень хорошо", "дела", "как дела"]
+    scores = scorer.score(texts)
+    singles = [scorer.score([text])[0] for text in texts]
+    assert scores == pytest.approx(singles, abs=1e-5)
+    assert all(0 <= score <= 1 for score in scores)
+    assert scorer.score([]) == []
+
+
+def test_gate_threshold():
+    model, tokenizer = tiny_classifier()
+    scorer = ToxicityScorer(model, tokenizer)
+    texts = ["ты дурак", "привет"]
+    low, high = sorted(scorer.score(texts))
+    assert ToxicityGate(scorer, threshold=0.0)(texts) == [True, True]
+    assert ToxicityGate(scorer, threshold=1.01)(texts) == [False, False]
+    assert sum(ToxicityGate(scorer, threshold=(low + high) / 2)(texts)) == 1
+
+
+def test_similarity():
+    model, tokenizer = tiny_encoder()
+    scorer = SimilarityScorer(model, tokenizer, batch_size=2)
+    sources = ["ты дурак", "привет как дела", "очень хорошо"]
+    targets = ["ты дурак", "как дела", "привет"]
+    similarity = scorer.similarity(sources, targets)
+    assert similarity[0] == pytest.approx(1.0, abs=1e-5)
+    assert all(-1 - 1e-5 <= value <= 1 + 1e-5 for value in similarity)
+    embeddings = scorer.embed(targets)
+    assert embeddings.shape == (3, 8)
+    assert embeddings.norm(dim=-1).tolist() == pytest.approx([1.0] * 3, abs=1e-5)
+    assert scorer.similarity([], []) == []
+
+
+class RecordingSentenceEncoder(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(kwargs)
+        return torch.nn.functional.normalize(torch.ones(len(texts), 4, dtype=torch.float16), dim=-1)
+
+
+def test_sentence_transformer_embeds_normalized():
+    encoder = RecordingSentenceEncoder()
+    scorer = SimilarityScorer(encoder, batch_size=2)
+    assert scorer.similarity(["a", "b"], ["b", "c"]) == pytest.approx([1.0, 1.0], abs=1e-3)
+    assert encoder.calls == [
+        {"batch_size": 2, "normalize_embeddings": True, "convert_to_tensor": True},
+    ]
+    assert scorer.embed(["a"]).dtype == torch.float32
+
+
+def test_cascade_gate():
+    classifier, tokenizer = tiny_classifier()
+    toxicity = ToxicityScorer(classifier, tokenizer)
+    encoder, _ = tiny_encoder()
+    similarity = SimilarityScorer(encoder, tokenizer)
+    sources, outputs = ["ты дурак", "привет"], ["ты дурак", "очень хорошо"]
+    # Токсичность никогда не превышает порог 1.01: решает только похожесть
+    gate = CascadeGate(toxicity, similarity, toxicity_threshold=1.01, similarity_threshold=0.999)
+    assert gate(sources, outputs) == [False, True]
+    gate = CascadeGate(toxicity, similarity, toxicity_threshold=0.0, similarity_threshold=-2)
+    assert gate(sources, outputs) == [True, True]
@@ -0,0 +1,93 @@
+import pytest
+
+from bugulma_enjoyers.bench import build_tiny_seq2seq, synthetic_texts
+from bugulma_enjoyers.detoxifiers import (
+    BacktranslationDetoxifier,
+    PipelineConfig,
+    StandaloneDetoxifier,
+)
+from bugulma_enjoyers.detoxifiers.translation_memory import (
+    TranslationMemory,
+    translation_namespace,
+)
+from bugulma_enjoyers.metrics import metrics
+from bugulma_enjoyers.models import model_cache
+
+
+class Translator:
+    def __init__(self):
+        self.seen = []
+
+    def __call__(self, texts):
+        self.seen.extend(texts)
+        return [text[::-1] for text in texts]
+
+
+def test_only_misses_are_translated(tmp_path):
+    db_path = tmp_path / "translations.sqlite"
+    translator = Translator()
+    memory = TranslationMemory("ns", db_path)
+    assert memory.translate(["ab", "cd", "ab"], "tt", "en", translator) == ["ba", "dc", "ba"]
+    assert translator.seen == ["ab", "cd"]
+
+    # Другое направление перевода — другой ключ
+    assert memory.translate(["ab"], "en", "tt", translator) == ["ba"]
+    assert translator.seen == ["ab", "cd", "ab"]
+
+    # Новый процесс: переводы берутся с диска
+    translator = Translator()
+    assert TranslationMemory("ns", db_path).translate(["cd", "ab"], "tt", "en", translator) == [
+        "dc",
+        "ba",
+    ]
+    assert translator.seen == []
+    assert TranslationMemory("other", db_path).translate(["cd"], "tt", "en", translator) == ["dc"]
+    assert translator.seen == ["cd"]
+
+
+def test_namespace_ignores_the_detoxifier():
+    config = PipelineConfig(device="cpu", detoxifier_model_name="fake/a")
+    assert translation_namespace(config) == translation_namespace(
+        PipelineConfig(device="cpu", detoxifier_model_name="fake/b", batch_size=1),
+    )
+    assert translation_namespace(config) != translation_namespace(
+        PipelineConfig(device="cpu", detoxifier_model_name="fake/a", num_beams=1),
+    )
+
+
+@pytest.fixture
+def tiny_model_name(tmp_path):
+    model_cache.clear()
+    yield f"hf/{build_tiny_seq2seq(tmp_path / 'tiny', synthetic_texts(20))}"
+    model_cache.clear()
+
+
+def test_rerun_with_another_detoxifier_reuses_translations(tiny_model_name, tmp_path):
+    texts = synthetic_texts(6)
+
+    def run(detoxifier_model_name):
+        config = PipelineConfig(
+            detoxifier_model_name=detoxifier_model_name,
+            translator_model_name=tiny_model_name,
+            device="cpu",
+            cache_dir=tmp_path / "cache",
+            max_length=16,
+        )
+        detoxifier = BacktranslationDetoxifier(config, StandaloneDetoxifier(config))
+        metrics.reset()
+        outputs = detoxifier.detoxify_batch(texts, ["tt"] * len(texts))
+        counters = {
+            (name, dict(labels)["src_lang"]): value
+            for (name, labels), value in metrics.counters.items()
+            if name.startswith("translation_memory")
+        }
+        metrics.reset()
+        return outputs, counters
+
+    outputs, counters = run("fake/a")
+    assert counters["translation_memory_misses_total", "tt"] == len(texts)
+
+    rerun, counters = run("fake/b")
+    assert rerun == outputs
+    assert counters["translation_memory_hits_total", "tt"] == len(texts)
+    assert counters["translation_memory_hits_total", "en"] == len(texts)
@@ -0,0 +1,160 @@
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bugulma_enjoyers.bench import build_tiny_seq2seq, synthetic_texts
+from bugulma_enjoyers.detoxifiers import PipelineConfig, StandaloneDetoxifier, worker_pool
+from bugulma_enjoyers.detoxifiers.worker_pool import ForkWorkerPool, default_threads_per_worker
+from bugulma_enjoyers.metrics import metrics
+from bugulma_enjoyers.models import model_cache
+
+
+@pytest.fixture
+def tiny_model_name(tmp_path):
+    model_cache.clear()
+    yield f"hf/{build_tiny_seq2seq(tmp_path / 'tiny', synthetic_texts(20))}"
+    model_cache.clear()
+
+
+needs_fork = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="needs the fork start method",
+)
+
+
+def shout(texts, languages):
+    return [f"{language}:{text.upper()}" for text, language in zip(texts, languages, strict=True)]
+
+
+@needs_fork
+def test_pool_keeps_input_order():
+    pool = ForkWorkerPool(shout, num_workers=2, threads_per_worker=1)
+    try:
+        texts = [f"{'x' * (idx % 5)}{idx}" for idx in range(23)]
+        languages = ["tt" if idx % 2 else "ru" for idx in range(23)]
+        order, shards = pool.shards(texts, languages, min_size=3)
+        assert sorted(order) == list(range(23))
+        assert all(len(shard_texts) >= 3 for shard_texts, _ in shards[:-1])
+
+        results = [None] * len(texts)
+        for positions, outputs in pool.imap(texts, languages, min_size=3):
+            for idx, output in zip(positions, outputs, strict=True):
+                results[idx] = output
+        assert results == shout(texts, languages)
+    finally:
+        pool.close()
+
+
+def whisper(texts, languages):
+    return [f"{language}:{text.lower()}" for text, language in zip(texts, languages, strict=True)]
+
+
+def fail(texts, languages):
+    raise ValueError(texts[0])
+
+
+@needs_fork
+def test_two_live_pools_run_together():
+    first = ForkWorkerPool(shout, num_workers=2, threads_per_worker=1)
+    second = ForkWorkerPool(whisper, num_workers=2, threads_per_worker=1)
+    try:
+        texts = [f"Ab{idx}" for idx in range(17)]
+        languages = ["tt"] * len(texts)
+
+        def run(pool):
+            results = [None] * len(texts)
+            for positions, outputs in pool.imap(texts, languages, min_size=2):
+                for idx, output in zip(positions, outputs, strict=True):
+                    results[idx] = output
+            return results
+
+        # Как стадии конвейера: оба пула работают одновременно из разных потоков
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            shouted, whispered = executor.map(run, [first, second])
+        assert shouted == shout(texts, languages)
+        assert whispered == whisper(texts, languages)
+    finally:
+        first.close()
+        second.close()
+
+
+@needs_fork
+def test_worker_errors_reach_the_caller():
+    pool = ForkWorkerPool(fail, num_workers=2, threads_per_worker=1)
+    try:
+        with pytest.raises(ValueError, match=r"^[xyz]$"):
+            list(pool.imap(["x", "y", "z"], ["tt"] * 3))
+        # Результаты брошенных шардов не достаются следующему вызову
+        with pytest.raises(ValueError, match=r"^a$"):
+            list(pool.imap(["a"], ["tt"]))
+    finally:
+        pool.close()
+
+
+@needs_fork
+def test_workers_match_serial_inference(tiny_model_name):
+    texts = synthetic_texts(24, seed=3)
+    languages = ["tt"] * len(texts)
+
+    def detoxify(num_workers):
+        config = PipelineConfig(
+            detoxifier_model_name=tiny_model_name,
+            device="cpu",
+            cache_dir=None,
+            batch_size=4,
+            max_length=16,
+            num_workers=num_workers,
+        )
+        detoxifier = StandaloneDetoxifier(config)
+        metrics.reset()
+        try:
+            outputs = detoxifier.detoxify_batch(texts, languages)
+        finally:
+            detoxifier.release()
+        # Шарды делятся на батчи иначе, чем весь вход, поэтому число батчей не сравниваем
+        counters = {
+            name: value
+            for (name, _), value in metrics.counters.items()
+            if name != "model_batches_total"
+        }
+        metrics.reset()
+        return outputs, counters
+
+    pooled, pooled_counters = detoxify(2)
+    serial, serial_counters = detoxify(1)
+    assert pooled == serial
+    assert pooled_counters["model_rows_total"] == len(texts)
+    assert pooled_counters == serial_counters
+
+
+def test_workers_are_ignored_for_api_models():
+    config = PipelineConfig(
+        detoxifier_model_name="fake/echo",
+        device="cpu",
+        cache_dir=None,
+        num_workers=2,
+    )
+    detoxifier = StandaloneDetoxifier(config)
+    assert detoxifier.pool is None
+    assert detoxifier.detoxify_batch(["а", "б"], ["tt", "tt"]) == ["а", "б"]
+
+
+def test_detoxifier_runs_serially_without_fork(tiny_model_name, monkeypatch):
+    monkeypatch.setattr(worker_pool.multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+    config = PipelineConfig(
+        detoxifier_model_name=tiny_model_name,
+        device="cpu",
+        cache_dir=None,
+        num_workers=2,
+    )
+    detoxifier = StandaloneDetoxifier(config)
+    assert detoxifier.pool is None
+    assert len(detoxifier.detoxify_batch(["мин"], ["tt"])) == 1
+
+
+def test_default_threads_are_split_across_pools(monkeypatch):
+    monkeypatch.setattr(worker_pool.os, "cpu_count", lambda: 16)
+    assert default_threads_per_worker(4) == 4
+    assert default_threads_per_worker(4, num_pools=2) == 2
+    assert default_threads_per_worker(32) == 1